@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import collections
+import os
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Type
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def fixture(file_name: str) -> bytes:
+    with open(os.path.join(FIXTURES, file_name), 'rb') as fp:
+        return fp.read()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class LocalServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, handler: Type[BaseHTTPRequestHandler]):
+        super().__init__(('127.0.0.1', 0), handler)
+        threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True).start()
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class QuietHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def respond(self, content: bytes, status: int = 200) -> None:
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class FakePortal(LocalServer):
+    def __init__(self, handler: Type['FakePortalHandler'] = None):
+        self.requests = collections.Counter()
+        super().__init__(handler or FakePortalHandler)
+
+
+class FakePortalHandler(QuietHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests['Suchen'] += 1
+        self.respond(fixture('list_nw.html'))
+
+    def do_GET(self):
+        if 'showAnhang' in self.path:
+            self.server.requests['showAnhang'] += 1
+            self.respond(b'%PDF-1.4\n' + self.path.encode('ascii'))
+        else:
+            self.server.requests['showZvg'] += 1
+            self.respond(fixture('detail_nw.html'))
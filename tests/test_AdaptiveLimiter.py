@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from helpers import FakeClock, LocalServer, QuietHandler
+from zvg_portal.rate_limiter import AdaptiveLimiter, HostLimiters, TokenBucket
+from zvg_portal.utils import CustomHTTPAdapter
+
+
+class CountingClock(FakeClock):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def __call__(self) -> float:
+        self.calls += 1
+        return super().__call__()
+
+
+class OverloadedPortal(LocalServer):
+    def __init__(self, capacity: int, latency: float):
+        self.capacity = capacity
+        self.latency = latency
+        self.in_flight = 0
+        self.served = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+        super().__init__(OverloadedPortalHandler)
+
+
+class OverloadedPortalHandler(QuietHandler):
+    def do_GET(self):
+        with self.server.lock:
+            overloaded = self.server.in_flight >= self.server.capacity
+            if overloaded:
+                self.server.rejected += 1
+            else:
+                self.server.in_flight += 1
+        if overloaded:
+            self.respond(b'', 503)
+            return
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.in_flight -= 1
+            self.server.served += 1
+        self.respond(b'OK')
+
+
+class AdaptiveLimiterTest(unittest.TestCase):
+    def _request(self, limiter: AdaptiveLimiter, clock: FakeClock, latency: float = 0.1, **kwargs) -> None:
+        started = limiter.acquire()
+        clock.now += latency
+        limiter.release(started, **kwargs)
+
+    def test_slowStartUpToCeiling(self):
+        clock = FakeClock()
+        limiter = AdaptiveLimiter(max_concurrency=8, clock=clock)
+        self.assertEqual(limiter.concurrency_limit, 1)
+        for _ in range(3):
+            self._request(limiter, clock)
+        self.assertEqual(limiter.concurrency_limit, 4)
+        for _ in range(10):
+            self._request(limiter, clock)
+        self.assertEqual(limiter.concurrency_limit, 8)
+
+    def test_multiplicativeDecreaseOncePerWindow(self):
+        clock = FakeClock()
+        limiter = AdaptiveLimiter(max_concurrency=16, clock=clock)
+        for _ in range(15):
+            self._request(limiter, clock)
+        started = [limiter.acquire() for _ in range(3)]
+        clock.now += 0.1
+        for s in started:
+            limiter.release(s, overloaded=True)
+        self.assertEqual(limiter.concurrency_limit, 8)
+        self.assertEqual(limiter.stats().decreases, 1)
+
+    def test_additiveIncreaseAfterDecrease(self):
+        clock = FakeClock()
+        limiter = AdaptiveLimiter(max_concurrency=16, clock=clock)
+        for _ in range(15):
+            self._request(limiter, clock)
+        self._request(limiter, clock, overloaded=True)
+        for _ in range(8):
+            self._request(limiter, clock)
+        self.assertEqual(limiter.concurrency_limit, 8)
+        self._request(limiter, clock)
+        self.assertEqual(limiter.concurrency_limit, 9)
+
+    def test_slowResponsesAndTimeoutsDecrease(self):
+        clock = FakeClock()
+        limiter = AdaptiveLimiter(max_concurrency=16, latency_target=1.0, clock=clock)
+        for _ in range(15):
+            self._request(limiter, clock)
+        self._request(limiter, clock, latency=1.5)
+        self.assertEqual(limiter.concurrency_limit, 8)
+        self._request(limiter, clock, timed_out=True)
+        self.assertEqual(limiter.concurrency_limit, 4)
+        self.assertEqual(limiter.stats().timeouts, 1)
+
+    def test_tokenBucketFloorBelowMinimumConcurrency(self):
+        clock = FakeClock()
+        limiter = AdaptiveLimiter(max_concurrency=4, min_rate=1.0, clock=clock)
+        self.assertIsNone(limiter.rate_limit)
+        for _ in range(10):
+            clock.now += 1.0
+            self._request(limiter, clock, latency=0.1, overloaded=True)
+        self.assertEqual(limiter.concurrency_limit, 1)
+        self.assertEqual(limiter.rate_limit, 1.0)
+        for _ in range(1000):
+            clock.now += 1.0
+            self._request(limiter, clock)
+        self.assertIsNone(limiter.rate_limit)
+
+    def test_rateCeiling(self):
+        clock = FakeClock()
+        limiter = AdaptiveLimiter(max_concurrency=4, min_concurrency=2, max_rate=2.0, clock=clock)
+        self.assertEqual(limiter.rate_limit, 2.0)
+        self.assertEqual(limiter._try_acquire(clock.now), 0.0)
+        self.assertEqual(limiter._try_acquire(clock.now), 0.5)
+        for _ in range(20):
+            clock.now += 1.0
+            self._request(limiter, clock)
+        self.assertEqual(limiter.rate_limit, 2.0)
+
+    def test_tokenBucket(self):
+        bucket = TokenBucket(rate=10.0, burst=2.0)
+        self.assertEqual(bucket.take(0.0), 0.0)
+        self.assertEqual(bucket.take(0.0), 0.0)
+        self.assertAlmostEqual(bucket.take(0.0), 0.1)
+        self.assertEqual(bucket.take(0.1), 0.0)
+
+    def test_asyncWaiterWokenByRelease(self):
+        clock = CountingClock()
+        limiter = AdaptiveLimiter(max_concurrency=1, clock=clock)
+        started = limiter.acquire()
+
+        async def wait_for_slot():
+            waiter = asyncio.ensure_future(limiter.acquire_async())
+            await asyncio.sleep(0.05)
+            calls = clock.calls
+            await asyncio.sleep(0.05)
+            self.assertEqual(clock.calls, calls)
+            self.assertFalse(waiter.done())
+            await asyncio.get_running_loop().run_in_executor(None, limiter.release, started)
+            return await asyncio.wait_for(waiter, 1.0)
+
+        self.assertEqual(asyncio.run(wait_for_slot()), 0.0)
+        self.assertEqual(limiter.stats().max_in_flight, 1)
+
+    def test_adaptsToOverloadedServer(self):
+        server = OverloadedPortal(capacity=4, latency=0.02)
+        self.addCleanup(server.stop)
+        limiters = HostLimiters(max_concurrency=16, latency_target=1.0)
+        session = requests.session()
+        session.mount('http://', CustomHTTPAdapter(retries=20, backoff_factor=0.01, pool_maxsize=16, limiters=limiters))
+        url = f'{server.base_url}/index.php'
+
+        with ThreadPoolExecutor(16) as executor:
+            statuses = list(executor.map(lambda _: session.get(url).status_code, range(200)))
+
+        self.assertEqual(statuses, [200] * 200)
+        stats, = limiters.stats().values()
+        self.assertGreater(stats.decreases, 0)
+        self.assertLessEqual(stats.max_in_flight, 16)
+        self.assertLess(stats.concurrency_limit, 16)
+        self.assertGreaterEqual(stats.requests, 200)
+        self.assertGreater(stats.effective_rate, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
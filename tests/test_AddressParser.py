@@ -58,6 +58,49 @@ class AdressParserTest(unittest.TestCase):
         self.assertEqual(adresse.ort, 'Wuppertal')
         self.assertEqual(adresse.stadtteil, 'Elberfeld')
 
+    def test_unusualCharacters(self):
+        adresse = AddressParser().parse("Einfamilienhaus: Rue de l'Église 3, 06108 Halle (Saale)")
+        self.assertEqual(adresse.strasse, "Rue de l'Église 3")
+        self.assertEqual(adresse.plz, '06108')
+        self.assertEqual(adresse.ort, 'Halle (Saale)')
+
+    def test_slashInStadtteil(self):
+        adresse = AddressParser().parse('Am Markt 1, 01234 Dresden, Altstadt/Nord')
+        self.assertEqual(adresse.ort, 'Dresden')
+        self.assertEqual(adresse.stadtteil, 'Altstadt/Nord')
+
+    def test_parenthesesInOrt(self):
+        adresse = AddressParser().parse('Hauptstr. 5, 12345 Berlin (Mitte), Zentrum')
+        self.assertEqual(adresse.strasse, 'Hauptstr. 5')
+        self.assertEqual(adresse.ort, 'Berlin (Mitte)')
+        self.assertEqual(adresse.stadtteil, 'Zentrum')
+
+    def test_strasseSpansCommas(self):
+        adresse = AddressParser().parse('Flur 3, Flurstück 12/4, 54321 Musterdorf')
+        self.assertEqual(adresse.strasse, 'Flur 3, Flurstück 12/4')
+        self.assertEqual(adresse.plz, '54321')
+        self.assertEqual(adresse.ort, 'Musterdorf')
+        self.assertIsNone(adresse.stadtteil)
+
+    def test_withoutStrasse(self):
+        adresse = AddressParser().parse('Garage: 12345 Musterstadt, Nord')
+        self.assertIsNone(adresse.strasse)
+        self.assertEqual(adresse.plz, '12345')
+        self.assertEqual(adresse.ort, 'Musterstadt')
+        self.assertEqual(adresse.stadtteil, 'Nord')
+
+    def test_withoutPlz(self):
+        self.assertIsNone(AddressParser().parse('Baugrundstück: Gemarkung Holpe, Flur 3'))
+
+    def test_plzWithoutComma(self):
+        self.assertIsNone(AddressParser().parse('Wald: In der Lahmich 51597 Morsbach'))
+
+    def test_cachedResultsAreNotShared(self):
+        parser = AddressParser()
+        adresse = parser.parse('Reihenhaus: Wiesenstraße 1, 52531 Übach-Palenberg')
+        adresse.stadtteil = 'geändert'
+        self.assertIsNone(parser.parse('Reihenhaus: Wiesenstraße 1, 52531 Übach-Palenberg').stadtteil)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import time
+import unittest
+
+import aiohttp
+
+from helpers import FakePortal, FakePortalHandler
+from zvg_portal.async_scraper import AsyncZvgPortal
+from zvg_portal.model import Land, ObjektEntry, RawEntry, RawAnhang, RawList
+from zvg_portal.rate_limiter import HostLimiters
+from zvg_portal.scraper import ZvgPortal
+from zvg_portal.serializer import plain
+
+
+class SlowAttachmentHandler(FakePortalHandler):
+    def do_GET(self):
+        if 'showAnhang' not in self.path:
+            return super().do_GET()
+        self.server.requests['showAnhang'] += 1
+        self.send_response(200)
+        self.send_header('Content-Length', str(10 * 1024))
+        self.end_headers()
+        for _ in range(10):
+            self.wfile.write(b'x' * 1024)
+            self.wfile.flush()
+            time.sleep(0.05)
+
+
+class UnavailableHandler(FakePortalHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests['Suchen'] += 1
+        self.respond(b'', 503)
+
+    def do_GET(self):
+        self.server.requests['GET'] += 1
+        self.respond(b'', 503)
+
+
+class AsyncZvgPortalTest(unittest.TestCase):
+    def setUp(self):
+        self.land = Land(short='nw', name='Nordrhein-Westfalen')
+
+    def _list(self, server: FakePortal, **kwargs):
+        async def collect():
+            async with AsyncZvgPortal(logging.getLogger('test'), 'test', server.base_url, **kwargs) as portal:
+                return [item async for item in portal.list(self.land)]
+
+        return asyncio.run(collect())
+
+    def test_sameAsThreadedPortal(self):
+        server = FakePortal()
+        self.addCleanup(server.stop)
+        items = self._list(server, concurrency=8)
+        self.assertIsInstance(items[0], RawList)
+        entries = [item for item in items if isinstance(item, ObjektEntry)]
+        self.assertEqual(len(entries), 40)
+        self.assertEqual(sum(isinstance(item, RawEntry) for item in items), 40)
+        self.assertEqual(sum(isinstance(item, RawAnhang) for item in items), 80)
+        self.assertEqual(server.requests, {'Suchen': 1, 'showZvg': 40, 'showAnhang': 80})
+
+        threaded = ZvgPortal(logging.getLogger('test'), 'test', server.base_url, concurrency=4)
+        expected = [item for item in threaded.list(self.land) if isinstance(item, ObjektEntry)]
+        self.assertEqual([plain(entry) for entry in entries], [plain(entry) for entry in expected])
+
+    def test_slowDownloadIsNotATimeout(self):
+        server = FakePortal(SlowAttachmentHandler)
+        self.addCleanup(server.stop)
+        items = self._list(server, concurrency=40, fixed_timeout=0.3, retries=0)
+        anhaenge = [item for item in items if isinstance(item, RawAnhang)]
+        self.assertEqual(len(anhaenge), 80)
+        self.assertTrue(all(anhang.size == 10 * 1024 for anhang in anhaenge))
+
+    def test_limiterExcludesBodyTime(self):
+        server = FakePortal(SlowAttachmentHandler)
+        self.addCleanup(server.stop)
+        limiters = HostLimiters(max_concurrency=40, latency_target=0.3)
+        items = self._list(server, concurrency=40, limiters=limiters)
+        self.assertEqual(sum(isinstance(item, RawAnhang) for item in items), 80)
+        stats, = limiters.stats().values()
+        self.assertEqual(stats.decreases, 0)
+        self.assertLess(stats.mean_latency, 0.3)
+
+    def test_retryOnlyIdempotentRequestsOnStatus(self):
+        server = FakePortal(UnavailableHandler)
+        self.addCleanup(server.stop)
+
+        async def request(method: str):
+            async with AsyncZvgPortal(logging.getLogger('test'), 'test', server.base_url, backoff_factor=0) as portal:
+                await portal._request(method, f'{server.base_url}/index.php', data={'button': 'Suchen'})
+
+        for method in ('POST', 'GET'):
+            with self.assertRaises(aiohttp.ClientResponseError):
+                asyncio.run(request(method))
+        self.assertEqual(server.requests, {'Suchen': 1, 'GET': 4})
+
+
+if __name__ == "__main__":
+    unittest.main()
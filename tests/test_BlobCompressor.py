@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import tempfile
+import unittest
+
+from zvg_portal.repository import RawRepository, PackRepository
+
+
+def page(i: int) -> bytes:
+    return (
+        f'\n<!DOCTYPE html><html><body><table>'
+        f'<tr><td>Aktenzeichen</td><td>{i:04d} K {i:04d}/2023</td></tr>'
+        f'<tr><td>Amtsgericht</td><td>Amtsgericht {i}</td></tr>'
+        f'</table></body></html>'
+    ).encode('latin1')
+
+
+class BlobCompressorTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_directoryRoundtrip(self):
+        repository = RawRepository(self._tmp_dir.name, compress=True)
+        self.assertTrue(repository.store(page(1)))
+        self.assertFalse(repository.store(page(1)))
+        sha256 = hashlib.sha256(page(1)).hexdigest()
+        self.assertTrue(os.path.exists(f'{repository.path(sha256)}.zst'))
+        self.assertEqual(RawRepository(self._tmp_dir.name).get(sha256), page(1))
+        self.assertEqual(list(repository), [sha256])
+
+    def test_uncompressedStaysReadable(self):
+        RawRepository(self._tmp_dir.name).store(page(1))
+        repository = RawRepository(self._tmp_dir.name, compress=True)
+        self.assertFalse(repository.store(page(1)))
+        self.assertEqual(repository.get(hashlib.sha256(page(1)).hexdigest()), page(1))
+
+    def test_packRoundtripWithDictionary(self):
+        from zvg_portal.compression import BlobCompressor
+        BlobCompressor.train(os.path.join(self._tmp_dir.name, 'zstd-dictionaries'), [page(i) for i in range(500)], 4096)
+        repository = PackRepository(self._tmp_dir.name, compress=True)
+        self.assertTrue(repository.store(page(1000)))
+        self.assertEqual(PackRepository(self._tmp_dir.name).get(hashlib.sha256(page(1000)).hexdigest()), page(1000))
+
+
+if __name__ == "__main__":
+    unittest.main()
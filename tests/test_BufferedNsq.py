@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import struct
+import threading
+import unittest
+from urllib.parse import urlparse, parse_qs
+
+from helpers import LocalServer, QuietHandler
+from zvg_portal.nsq_util import Nsq, BufferedNsq, NsqPublishError
+
+
+class FakeNsqd(LocalServer):
+    def __init__(self, status: int = 200):
+        self.status = status
+        self.requests = []
+        self.messages = []
+        super().__init__(FakeNsqdHandler)
+
+
+class FakeNsqdHandler(QuietHandler):
+    def do_POST(self):
+        url = urlparse(self.path)
+        topic = parse_qs(url.query)['topic'][0]
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append(url.path)
+        if url.path == '/pub':
+            self.server.messages.append((topic, body))
+        else:
+            count, = struct.unpack('>I', body[0:4])
+            offset = 4
+            for _ in range(count):
+                size, = struct.unpack('>I', body[offset:offset + 4])
+                self.server.messages.append((topic, body[offset + 4:offset + 4 + size]))
+                offset += 4 + size
+        self.respond(b'OK', self.server.status)
+
+
+class BufferedNsqTest(unittest.TestCase):
+    def setUp(self):
+        self._nsqd = FakeNsqd()
+
+    def tearDown(self):
+        self._nsqd.stop()
+
+    def _nsq(self) -> Nsq:
+        return Nsq('127.0.0.1', self._nsqd.server_address[1])
+
+    def test_batchesByCount(self):
+        with BufferedNsq(self._nsq(), max_messages=10, flush_interval=60) as nsq:
+            for i in range(25):
+                nsq.publish('zvg_entries', f'message {i}')
+        self.assertEqual(self._nsqd.requests, ['/mpub', '/mpub', '/mpub'])
+        self.assertEqual([m for _, m in self._nsqd.messages], [f'message {i}'.encode() for i in range(25)])
+
+    def test_separateTopics(self):
+        with BufferedNsq(self._nsq(), flush_interval=60) as nsq:
+            nsq.publish('zvg_entries', 'a')
+            nsq.publish('zvg_scraper_runs', 'b')
+            nsq.publish('zvg_entries', 'c')
+        self.assertEqual(
+            sorted(self._nsqd.messages),
+            [('zvg_entries', b'a'), ('zvg_entries', b'c'), ('zvg_scraper_runs', b'b')]
+        )
+
+    def test_flushByTime(self):
+        nsq = BufferedNsq(self._nsq(), flush_interval=0.05)
+        nsq.publish('zvg_entries', 'a')
+        for _ in range(100):
+            if self._nsqd.messages:
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual(self._nsqd.messages, [('zvg_entries', b'a')])
+        nsq.close()
+
+    def test_errorIsRaised(self):
+        self._nsqd.status = 500
+        nsq = BufferedNsq(self._nsq(), flush_interval=60)
+        nsq.publish('zvg_entries', 'a')
+        with self.assertRaises(NsqPublishError):
+            nsq.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import hashlib
+import tempfile
+import unittest
+
+from zvg_portal.repository import ExistenceIndex, RawRepository
+
+
+def sha256(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+class ExistenceIndexTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_addAndReload(self):
+        index = ExistenceIndex(self._tmp_dir.name)
+        self.assertNotIn(sha256(b'a'), index)
+        index.add(sha256(b'a'))
+        self.assertIn(sha256(b'a'), index)
+        self.assertIn(sha256(b'a'), ExistenceIndex(self._tmp_dir.name))
+        self.assertNotIn(sha256(b'b'), ExistenceIndex(self._tmp_dir.name))
+
+    def test_rebuild(self):
+        index = ExistenceIndex(self._tmp_dir.name)
+        index.add(sha256(b'a'))
+        self.assertEqual(index.rebuild([sha256(b'b'), sha256(b'c')]), 2)
+        reloaded = ExistenceIndex(self._tmp_dir.name)
+        self.assertNotIn(sha256(b'a'), reloaded)
+        self.assertIn(sha256(b'b'), reloaded)
+        self.assertIn(sha256(b'c'), reloaded)
+
+    def test_concurrentCompaction(self):
+        writer = ExistenceIndex(self._tmp_dir.name)
+        for i in range(1 << 16):
+            writer.add(sha256(str(i).encode('ascii')))
+        writer.add(sha256(b'a'))
+        first = ExistenceIndex(self._tmp_dir.name)
+        second = ExistenceIndex(self._tmp_dir.name)
+        first._sorted, first._recent = first._read_sorted(), first._read_log()
+        second._sorted, second._recent = second._read_sorted(), second._read_log()
+        first._compact()
+        second._compact()
+        self.assertIn(sha256(b'a'), second)
+        self.assertIn(sha256(b'1234'), ExistenceIndex(self._tmp_dir.name))
+        self.assertNotIn(sha256(b'b'), ExistenceIndex(self._tmp_dir.name))
+
+    def test_repositorySkipsKnownBlobs(self):
+        RawRepository(self._tmp_dir.name).store(b'a')
+        repository = RawRepository(self._tmp_dir.name, existence_index=True)
+        self.assertFalse(repository.store(b'a'))
+        self.assertIn(sha256(b'a'), repository.existence_index)
+        self.assertTrue(repository.store(b'b'))
+        self.assertFalse(RawRepository(self._tmp_dir.name, existence_index=True).store(b'b'))
+
+
+if __name__ == "__main__":
+    unittest.main()
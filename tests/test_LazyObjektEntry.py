@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import logging
+import unittest
+
+from helpers import FakePortal
+from zvg_portal.model import Land, LazyObjektEntry, ObjektEntry, RawEntry, RawAnhang, RawList
+from zvg_portal.scraper import ZvgPortal
+from zvg_portal.serializer import plain
+
+
+class LazyObjektEntryTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakePortal()
+        self.portal = ZvgPortal(logging.getLogger('test'), 'test', self.server.base_url, concurrency=4)
+        self.land = Land(short='nw', name='Nordrhein-Westfalen')
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _entries(self):
+        items = list(self.portal.list_lazy(self.land))
+        self.assertIsInstance(items[0], RawList)
+        return items[1:]
+
+    def test_listFieldsWithoutDetailRequests(self):
+        entries = self._entries()
+        self.assertEqual(len(entries), 40)
+        self.assertTrue(all(entry.zvg_id and entry.verkehrswert_in_cent for entry in entries))
+        self.assertFalse(any(entry.details_loaded for entry in entries))
+        self.assertEqual(self.server.requests, {'Suchen': 1})
+
+    def test_detailsLoadedOnAccess(self):
+        entry = self._entries()[0]
+        self.assertEqual(entry.grundbuch, 'Grundbuch von Wuppertal-Langerfeld, Blatt 1234')
+        self.assertTrue(entry.details_loaded)
+        self.assertEqual(len(entry.anhang_sha256s), 2)
+        self.assertIsNotNone(entry.raw_entry_sha256)
+        self.assertEqual(self.server.requests, {'Suchen': 1, 'showZvg': 1, 'showAnhang': 2})
+
+    def test_batchLoad(self):
+        entries = self._entries()[:5]
+        raws = self.portal.load_details(entries)
+        self.assertEqual(sum(isinstance(raw, RawEntry) for raw in raws), 5)
+        self.assertEqual(sum(isinstance(raw, RawAnhang) for raw in raws), 10)
+        self.assertTrue(all(entry.details_loaded for entry in entries))
+        self.assertEqual(self.portal.load_details(entries), [])
+        self.assertEqual(self.server.requests['showZvg'], 5)
+
+    def test_sameAsEagerEntry(self):
+        lazy = self._entries()[0]
+        eager = next(item for item in self.portal.list(self.land) if isinstance(item, ObjektEntry))
+        self.assertEqual(plain(lazy), plain(eager))
+
+    def test_reprDoesNotLoad(self):
+        entry = LazyObjektEntry(land_short='nw', raw_list_sha256='0' * 64, zvg_id=1, details_loader=self.fail)
+        self.assertIn('details not loaded', repr(entry))
+
+
+if __name__ == "__main__":
+    unittest.main()
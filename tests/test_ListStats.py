@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import unittest
+
+from zvg_portal.model import ObjektEntry
+from zvg_portal.stats import ListStats, format_cents
+
+
+def entry(land_short: str, amtsgericht: str, cents) -> ObjektEntry:
+    return ObjektEntry(
+        land_short=land_short,
+        raw_list_sha256='0' * 64,
+        amtsgericht=amtsgericht,
+        verkehrswert_in_cent=cents,
+    )
+
+
+class ListStatsTest(unittest.TestCase):
+    def test_groupsByLandAndAmtsgericht(self):
+        stats = ListStats()
+        stats.extend([entry('nw', 'Essen', 100), entry('nw', 'Hagen', 300), entry('by', 'Hagen', 200)])
+        self.assertEqual(stats.by_land['nw'].count, 2)
+        self.assertEqual(stats.by_land['nw'].total_cents, 400)
+        self.assertEqual(stats.by_amtsgericht['Hagen'].count, 2)
+        self.assertEqual(stats.by_amtsgericht['Hagen'].total_cents, 500)
+
+    def test_minAndMaxLikeStableSort(self):
+        first, second = entry('nw', 'Essen', 500), entry('nw', 'Essen', 500)
+        stats = ListStats()
+        stats.extend([entry('nw', 'Essen', 100), first, entry('nw', 'Essen', 200), second])
+        self.assertEqual(stats.by_land['nw'].cheapest.verkehrswert_in_cent, 100)
+        self.assertIs(stats.by_land['nw'].most_expensive, second)
+
+    def test_entriesWithoutVerkehrswertOnlyCount(self):
+        stats = ListStats()
+        stats.extend([entry('nw', 'Essen', None), entry('nw', 'Essen', 0)])
+        self.assertEqual(stats.by_land['nw'].count, 2)
+        self.assertEqual(stats.by_land['nw'].valued, 0)
+        self.assertIsNone(stats.by_land['nw'].cheapest)
+        self.assertEqual(stats.by_land['nw'].summary(4), 'Verkehrswertsumme: 0,00 €')
+
+    def test_quantiles(self):
+        stats = ListStats(quantiles=4)
+        stats.extend(entry('nw', 'Essen', cents) for cents in [100, 200, 300, 400, 500])
+        self.assertEqual(stats.by_land['nw'].quantiles(4), [200, 300, 400])
+
+    def test_noQuantilesUnlessRequested(self):
+        stats = ListStats()
+        stats.extend(entry('nw', 'Essen', cents) for cents in [100, 200, 300])
+        self.assertEqual(stats.by_land['nw'].quantiles(4), [])
+
+    def test_formatCents(self):
+        self.assertEqual(format_cents(123_456_78), '123456,78 €')
+        self.assertEqual(format_cents(5), '0,05 €')
+
+
+if __name__ == "__main__":
+    unittest.main()
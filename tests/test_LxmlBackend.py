@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import dataclasses
+import importlib.util
+import logging
+import unittest
+
+from helpers import fixture
+from zvg_portal.model import Land, ObjektEntry, RawList
+from zvg_portal.scraper import ZvgPortalBase
+
+
+@unittest.skipUnless(importlib.util.find_spec('lxml'), 'lxml is not installed')
+class LxmlBackendTest(unittest.TestCase):
+    def setUp(self):
+        logger = logging.getLogger('test')
+        logger.addHandler(logging.NullHandler())
+        logger.propagate = False
+        self._portals = [
+            ZvgPortalBase(logger, 'http://127.0.0.1', html_parser='html.parser'),
+            ZvgPortalBase(logger, 'http://127.0.0.1', html_parser='lxml'),
+        ]
+
+    def assertParity(self, fn):
+        expected, actual = [fn(portal) for portal in self._portals]
+        self.assertEqual(expected, actual)
+        return actual
+
+    def test_tableRows(self):
+        content = fixture('list_nw.html')
+        rows = self.assertParity(
+            lambda portal: list(portal._parse_html_table(portal._html.parse(content, 'latin1')))
+        )
+        self.assertEqual(len(rows), 40)
+        self.assertEqual(rows[0]['zvg_id'], 10000)
+
+    def test_list(self):
+        land = Land(short='nw', name='Nordrhein-Westfalen')
+        raw_list = RawList(content=fixture('list_nw.html'))
+        entries = self.assertParity(
+            lambda portal: [dataclasses.asdict(entry) for entry in portal.parse_list(land, raw_list)]
+        )
+        self.assertEqual(len(entries), 40)
+        self.assertEqual(entries[3]['amtsgericht'], 'Wuppertal')
+
+    def test_details(self):
+        content = fixture('detail_nw.html')
+
+        def parse(portal: ZvgPortalBase):
+            entry = ObjektEntry(land_short='nw', raw_list_sha256='0' * 64, aktenzeichen='0003 K 0003/2022')
+            attachment_hrefs = portal._parse_details(entry, content)
+            return attachment_hrefs, dataclasses.asdict(entry)
+
+        attachment_hrefs, entry = self.assertParity(parse)
+        self.assertEqual(len(attachment_hrefs), 2)
+        self.assertEqual(entry['urls'], ['https://www.geoportal.nrw/?zvg=10111'])
+        self.assertEqual(entry['informationen_zum_glaeubiger'], 'Antragsteller: Miteigentümer')
+
+    def test_laender(self):
+        content = fixture('form.html')
+        laender = self.assertParity(lambda portal: list(portal._parse_laender(content)))
+        self.assertEqual(laender[-1], Land(short='th', name='Thüringen'))
+
+    def test_laenderWithoutValue(self):
+        content = (
+            '<html><body><select><option value="">-- Bundesland auswählen --</option>'
+            '<option>Bitte wählen</option><option value="nw">Nordrhein-Westfalen</option></select></body></html>'
+        ).encode('latin1')
+        laender = self.assertParity(lambda portal: list(portal._parse_laender(content)))
+        self.assertEqual(laender, [Land(short='nw', name='Nordrhein-Westfalen')])
+
+    def test_markupEdgeCases(self):
+        content = (
+            '<html><body><table>'
+            '<tr><td>Aktenzeichen:</td><td><b>0001</b> <i>K</i><!-- x --> 0001/2023<script>var a;</script></td></tr>'
+            '<tr><td>Objekt/Lage:</td><td><a name="top">A&amp;B</a><a href="?zvg_id=42">x</a>&nbsp;y</td></tr>'
+            '<tr><td>single</td></tr>'
+            '<tr><td>Termin:</td><td>1<br>2</td><td><table><tr><td>inner</td></tr></table></td></tr>'
+            '</table></body></html>'
+        ).encode('latin1')
+        rows = self.assertParity(
+            lambda portal: list(portal._parse_html_table(portal._html.parse(content, 'latin1')))
+        )
+        self.assertEqual(rows[0]['Aktenzeichen'], ['0001 K 0001/2023'])
+        self.assertNotIn('zvg_id', rows[0])
+
+    def test_emptyDocument(self):
+        self.assertParity(lambda portal: list(portal._parse_html_table(portal._html.parse(b'', 'latin1'))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+import pickle
+import tempfile
+import unittest
+
+import requests
+
+from zvg_portal.metrics import Metrics, Histogram, serve_metrics, REGISTRY
+from zvg_portal.repository import RawRepository
+
+
+class MetricsTest(unittest.TestCase):
+    def test_prometheusText(self):
+        metrics = Metrics()
+        metrics.inc('zvg_http_downloaded_bytes_total', 100, call='list')
+        metrics.inc('zvg_http_downloaded_bytes_total', 50, call='list')
+        metrics.observe('zvg_http_request_seconds', 0.003, call='detail')
+        metrics.observe('zvg_http_request_seconds', 0.2, call='detail')
+        text = metrics.to_prometheus()
+        self.assertIn('# TYPE zvg_http_downloaded_bytes_total counter\n', text)
+        self.assertIn('zvg_http_downloaded_bytes_total{call="list"} 150\n', text)
+        self.assertIn('# TYPE zvg_http_request_seconds histogram\n', text)
+        self.assertIn('zvg_http_request_seconds_bucket{call="detail",le="0.0025"} 0\n', text)
+        self.assertIn('zvg_http_request_seconds_bucket{call="detail",le="0.005"} 1\n', text)
+        self.assertIn('zvg_http_request_seconds_bucket{call="detail",le="+Inf"} 2\n', text)
+        self.assertIn('zvg_http_request_seconds_sum{call="detail"} 0.203\n', text)
+        self.assertIn('zvg_http_request_seconds_count{call="detail"} 2\n', text)
+
+    def test_labelValuesAreEscaped(self):
+        metrics = Metrics()
+        metrics.inc('zvg_published_messages_total', topic='a"b')
+        self.assertIn('zvg_published_messages_total{topic="a\\"b"} 1\n', metrics.to_prometheus())
+
+    def test_quantile(self):
+        histogram = Histogram()
+        for _ in range(90):
+            histogram.observe(0.02)
+        for _ in range(10):
+            histogram.observe(20.0)
+        self.assertTrue(0.01 < histogram.quantile(0.5) <= 0.025)
+        self.assertTrue(10.0 < histogram.quantile(0.95) <= 30.0)
+
+    def test_drainAndMergeAcrossProcesses(self):
+        worker = Metrics()
+        worker.inc('zvg_repository_duplicates_total')
+        worker.observe('zvg_parse_seconds', 0.01, page='list')
+        drained = pickle.loads(pickle.dumps(worker.drain()))
+        self.assertEqual(worker.summary(), {})
+
+        main = Metrics()
+        main.inc('zvg_repository_duplicates_total')
+        main.merge(drained)
+        summary = main.summary()
+        self.assertEqual(summary['zvg_repository_duplicates_total'], 2)
+        self.assertEqual(summary['zvg_parse_seconds{page="list"}']['count'], 1)
+
+    def test_repositoryStore(self):
+        REGISTRY.drain()
+        with tempfile.TemporaryDirectory() as dir_name:
+            repository = RawRepository(dir_name)
+            self.assertTrue(repository.store(b'content'))
+            self.assertFalse(repository.store(b'content'))
+        summary = REGISTRY.drain().summary()
+        self.assertEqual(summary['zvg_repository_stored_blobs_total'], 1)
+        self.assertEqual(summary['zvg_repository_written_bytes_total'], 7)
+        self.assertEqual(summary['zvg_repository_duplicates_total'], 1)
+        self.assertEqual(summary['zvg_repository_store_seconds']['count'], 2)
+
+    def test_endpointAndTextfile(self):
+        metrics = Metrics()
+        metrics.inc('zvg_repository_stored_blobs_total', 3)
+        server = serve_metrics(0, '127.0.0.1', metrics)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        response = requests.get(f'http://127.0.0.1:{server.server_address[1]}/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('zvg_repository_stored_blobs_total 3\n', response.text)
+        with tempfile.TemporaryDirectory() as dir_name:
+            path = os.path.join(dir_name, 'zvg.prom')
+            metrics.write_textfile(path)
+            with open(path, 'r') as fp:
+                self.assertEqual(fp.read(), response.text)
+
+
+if __name__ == "__main__":
+    unittest.main()
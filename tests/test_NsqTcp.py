@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import json
+import socket
+import socketserver
+import struct
+import threading
+import unittest
+
+from zvg_portal.nsq_util import NsqTcp, NsqPublishError
+
+
+class FakeNsqd(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, drop_after: int = 0):
+        self.drop_after = drop_after
+        self.connections = 0
+        self.messages = []
+        super().__init__(('127.0.0.1', 0), FakeNsqdHandler)
+        threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True).start()
+
+
+class FakeNsqdHandler(socketserver.StreamRequestHandler):
+    def _respond(self, frame_type: int, data: bytes):
+        self.wfile.write(struct.pack('>Ii', len(data) + 4, frame_type) + data)
+
+    def handle(self):
+        self.server.connections += 1
+        assert self.rfile.read(4) == b'  V2'
+        handled = 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command, *params = line.strip().split(b' ')
+            size, = struct.unpack('>I', self.rfile.read(4))
+            body = self.rfile.read(size)
+            if command == b'IDENTIFY':
+                self._respond(0, json.dumps({'tls_v1': False}).encode())
+                continue
+            if self.server.drop_after and handled >= self.server.drop_after:
+                self.server.drop_after = 0
+                # close gracefully, so the client still reads the responses that were sent
+                self.request.shutdown(socket.SHUT_WR)
+                while self.rfile.read(4096):
+                    pass
+                return
+            handled += 1
+            if params[0] == b'bad!':
+                self._respond(1, b'E_BAD_TOPIC')
+                continue
+            if command == b'PUB':
+                self.server.messages.append((params[0], body))
+            elif command == b'MPUB':
+                count, = struct.unpack('>I', body[0:4])
+                offset = 4
+                for _ in range(count):
+                    message_size, = struct.unpack('>I', body[offset:offset + 4])
+                    self.server.messages.append((params[0], body[offset + 4:offset + 4 + message_size]))
+                    offset += 4 + message_size
+            self._respond(0, b'OK')
+
+
+class NsqTcpTest(unittest.TestCase):
+    def _serve(self, **kwargs) -> FakeNsqd:
+        nsqd = FakeNsqd(**kwargs)
+        self.addCleanup(nsqd.server_close)
+        self.addCleanup(nsqd.shutdown)
+        return nsqd
+
+    def test_pipelinedPublish(self):
+        nsqd = self._serve()
+        nsq = NsqTcp('127.0.0.1', nsqd.server_address[1], max_in_flight=4)
+        for i in range(10):
+            nsq.publish('zvg_entries', f'message {i}')
+        nsq.publish_multiple_bytes('zvg_entries', [b'a', b'b'])
+        nsq.close()
+        self.assertEqual(
+            [m for _, m in nsqd.messages],
+            [f'message {i}'.encode() for i in range(10)] + [b'a', b'b']
+        )
+        self.assertEqual(nsqd.connections, 1)
+
+    def test_reconnectResendsUnacknowledged(self):
+        nsqd = self._serve(drop_after=3)
+        nsq = NsqTcp('127.0.0.1', nsqd.server_address[1], max_in_flight=1, backoff_factor=0)
+        for i in range(6):
+            nsq.publish('zvg_entries', f'message {i}')
+        nsq.close()
+        self.assertEqual(nsqd.connections, 2)
+        self.assertEqual([m for _, m in nsqd.messages], [f'message {i}'.encode() for i in range(6)])
+
+    def test_reconnectWithManyInFlight(self):
+        nsqd = self._serve(drop_after=7)
+        nsq = NsqTcp('127.0.0.1', nsqd.server_address[1], max_in_flight=4, backoff_factor=0)
+        for i in range(20):
+            nsq.publish('zvg_entries', f'message {i}')
+        nsq.close()
+        self.assertEqual(nsqd.connections, 2)
+        self.assertEqual([m for _, m in nsqd.messages], [f'message {i}'.encode() for i in range(20)])
+
+    def test_errorFrame(self):
+        nsqd = self._serve()
+        nsq = NsqTcp('127.0.0.1', nsqd.server_address[1])
+        nsq.publish('bad!', 'message')
+        with self.assertRaises(NsqPublishError):
+            nsq.flush()
+
+
+if __name__ == "__main__":
+    unittest.main()
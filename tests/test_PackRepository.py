@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import hashlib
+import tempfile
+import unittest
+
+from zvg_portal.repository import PackRepository, RawRepository
+
+
+class PackRepositoryTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_storeAndGet(self):
+        repository = PackRepository(self._tmp_dir.name)
+        self.assertTrue(repository.store(b'abc'))
+        self.assertFalse(repository.store(b'abc'))
+        self.assertEqual(repository.get(hashlib.sha256(b'abc').hexdigest()), b'abc')
+
+    def test_findMissing(self):
+        for repository in (PackRepository(self._tmp_dir.name), RawRepository(self._tmp_dir.name)):
+            repository.store(b'abc')
+            self.assertEqual(repository.find(hashlib.sha256(b'abc').hexdigest()), b'abc')
+            self.assertIsNone(repository.find(hashlib.sha256(b'missing').hexdigest()))
+
+    def test_reopen(self):
+        PackRepository(self._tmp_dir.name).store(b'abc')
+        repository = PackRepository(self._tmp_dir.name)
+        self.assertFalse(repository.store(b'abc'))
+        self.assertEqual(list(repository), [hashlib.sha256(b'abc').hexdigest()])
+
+    def test_segmentRotation(self):
+        repository = PackRepository(self._tmp_dir.name, max_segment_size=4)
+        repository.store(b'abc')
+        repository.store(b'def')
+        self.assertEqual(repository.get(hashlib.sha256(b'abc').hexdigest()), b'abc')
+        self.assertEqual(repository.get(hashlib.sha256(b'def').hexdigest()), b'def')
+
+    def test_streamingWriter(self):
+        repository = PackRepository(self._tmp_dir.name)
+        with repository.writer() as writer:
+            writer.write(b'ab')
+            writer.write(b'c')
+            self.assertEqual(repository.commit(writer), (hashlib.sha256(b'abc').hexdigest(), True))
+        self.assertFalse(repository.store(b'abc'))
+
+    def test_seenByOtherInstance(self):
+        first = PackRepository(self._tmp_dir.name)
+        second = PackRepository(self._tmp_dir.name)
+        first.store(b'abc')
+        self.assertFalse(second.store(b'abc'))
+
+
+if __name__ == "__main__":
+    unittest.main()
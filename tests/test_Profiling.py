@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+import pickle
+import pstats
+import tempfile
+import time
+import unittest
+
+from zvg_portal import profiling
+from zvg_portal.profiling import start_profiler, stop_profiler, stage
+
+
+def _busy(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class ProfilingTest(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(stop_profiler)
+
+    def test_stageWithoutProfiler(self):
+        self.assertIsNone(profiling._profiler)
+        with stage('list_parse'):
+            pass
+
+    def test_samplingWritesCollapsedStacks(self):
+        profiler = start_profiler('sampling', 0.001)
+        with stage('detail_parse'):
+            _busy(0.1)
+        stop_profiler()
+        with tempfile.TemporaryDirectory() as dir_name:
+            path, = profiler.write(dir_name, 'run-id')
+            self.assertEqual(path, os.path.join(dir_name, 'run-id.collapsed'))
+            with open(path, 'r', encoding='utf-8') as fp:
+                lines = fp.read().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            self.assertTrue(stack.startswith('detail_parse;'))
+            self.assertGreater(int(count), 0)
+        self.assertTrue(any('_busy' in line for line in lines))
+
+    def test_cprofileWritesPstatsPerStage(self):
+        profiler = start_profiler('cprofile')
+        with stage('store'):
+            _busy(0.01)
+            with stage('publish'):
+                _busy(0.01)
+        stop_profiler()
+        with tempfile.TemporaryDirectory() as dir_name:
+            paths = profiler.write(dir_name, 'run-id')
+            self.assertEqual(paths, [
+                os.path.join(dir_name, 'run-id.publish.pstats'),
+                os.path.join(dir_name, 'run-id.store.pstats'),
+            ])
+            for path in paths:
+                stats = pstats.Stats(path)
+                self.assertTrue(any(func[2] == '_busy' for func in stats.stats))
+
+    def test_mergeAcrossProcesses(self):
+        worker = profiling.SamplingProfiler()
+        worker.merge({'store;a;b': 2})
+        drained = pickle.loads(pickle.dumps(worker.drain()))
+        self.assertEqual(worker.drain(), {})
+        main = profiling.SamplingProfiler()
+        main.merge({'store;a;b': 1})
+        main.merge(drained)
+        self.assertEqual(main.drain(), {'store;a;b': 3})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from helpers import FakeClock, fixture
+from zvg_portal.journal import RunJournal
+from zvg_portal.metrics import Metrics
+from zvg_portal.model import Land, ObjektEntry, RawList, ScraperRun
+from zvg_portal.scraper import ZvgPortal
+
+
+def sha256(i: int) -> str:
+    return hashlib.sha256(str(i).encode('ascii')).hexdigest()
+
+
+class RunJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.dir_name = tempfile.mkdtemp()
+        self.run = ScraperRun()
+        self.path = RunJournal.path_of(self.dir_name, self.run.id)
+        self.clock = FakeClock()
+        self.journal = RunJournal(self.path, checkpoint_interval=30.0, clock=self.clock)
+        self.journal.begin(self.run)
+
+    def tearDown(self):
+        self.journal.close()
+        for file_name in os.listdir(self.dir_name):
+            os.remove(os.path.join(self.dir_name, file_name))
+        os.rmdir(self.dir_name)
+
+    def _process(self, land_short: str, zvg_id: int) -> None:
+        self.run.entry_sha256s.append(sha256(zvg_id))
+        self.run.scraped_entries += 1
+        self.journal.processed(ObjektEntry(land_short=land_short, raw_list_sha256=sha256(0), zvg_id=zvg_id))
+
+    def _reopen(self) -> RunJournal:
+        self.journal.close()
+        self.journal = RunJournal(self.path, clock=self.clock)
+        return self.journal
+
+    def test_restoreUpToLastCheckpoint(self):
+        self.run.list_sha256s.append(sha256(0))
+        self._process('bw', 1)
+        self._process('bw', 2)
+        self.journal.checkpoint(self.run)
+        self._process('bw', 3)
+
+        journal = self._reopen()
+        restored = journal.restore()
+        self.assertEqual(restored.id, self.run.id)
+        self.assertEqual(restored.scraper_started, self.run.scraper_started)
+        self.assertEqual(restored.list_sha256s, [sha256(0)])
+        self.assertEqual(restored.entry_sha256s, [sha256(1), sha256(2)])
+        self.assertEqual(restored.scraped_entries, 2)
+        self.assertEqual(journal.processed_zvg_ids(), {'bw': {1, 2}})
+        self.assertEqual(journal.completed_laender(), set())
+
+    def test_checkpointsAppendOnlyNewDigests(self):
+        self._process('bw', 1)
+        self.journal.checkpoint(self.run)
+        self._process('bw', 2)
+        self.journal.checkpoint(self.run, completed_land='bw')
+        self._process('by', 3)
+        self.journal.checkpoint(self.run)
+
+        journal = self._reopen()
+        restored = journal.restore()
+        self.assertEqual(restored.entry_sha256s, [sha256(1), sha256(2), sha256(3)])
+        self.assertEqual(journal.completed_laender(), {'bw'})
+        self.assertEqual(journal.processed_zvg_ids(), {'by': {3}})
+
+        restored.anhang_sha256s.append(sha256(4))
+        journal.checkpoint(restored)
+        self.assertEqual(self._reopen().restore().anhang_sha256s, [sha256(4)])
+
+    def test_resumedListIsRecordedOnce(self):
+        self.run.list_sha256s.append(sha256(0))
+        self._process('bw', 1)
+        self.journal.checkpoint(self.run)
+
+        journal = self._reopen()
+        journal.restore()
+        self.assertEqual(journal.processed_lists(), {'bw': sha256(0)})
+        self.assertTrue(journal.resumes_list(sha256(0)))
+        self.assertFalse(journal.resumes_list(sha256(0)))
+        journal.checkpoint(self.run, completed_land='bw')
+        self.assertEqual(journal.processed_lists(), {})
+
+    def test_entriesWithoutZvgId(self):
+        self.journal.processed(ObjektEntry(land_short='bw', raw_list_sha256=sha256(0), aktenzeichen='0001 K 1/23'))
+        self.journal.processed(ObjektEntry(land_short='bw', raw_list_sha256=sha256(0)))
+        self.journal.checkpoint(self.run)
+        self.assertEqual(self._reopen().processed_aktenzeichen(), {'bw': {'0001 K 1/23'}})
+        self.assertEqual(self.journal.processed_zvg_ids(), {})
+
+    def test_checkpointDue(self):
+        self.assertFalse(self.journal.due())
+        self.clock.now += 30.0
+        self.assertTrue(self.journal.due())
+        self.journal.checkpoint(self.run)
+        self.assertFalse(self.journal.due())
+
+    def test_metrics(self):
+        self.assertIsNone(self.journal.metrics())
+        metrics = Metrics()
+        metrics.inc('zvg_repository_stored_blobs_total', 3)
+        self.journal.checkpoint(self.run, metrics)
+        self.assertEqual(self._reopen().metrics().summary(), {'zvg_repository_stored_blobs_total': 3})
+
+    def test_remove(self):
+        self.journal.checkpoint(self.run)
+        self.journal.remove()
+        self.assertEqual(os.listdir(self.dir_name), [])
+        self.journal = RunJournal(self.path)
+        self.assertIsNone(self.journal.restore())
+
+
+class SkipProcessedTest(unittest.TestCase):
+    def test_skipZvgIds(self):
+        portal = ZvgPortal(logging.getLogger('test'), 'test', 'http://127.0.0.1:1')
+        land = Land(short='nw', name='Nordrhein-Westfalen')
+        raw_list = RawList(content=fixture('list_nw.html'))
+        entries = portal._entries_to_fetch(land, raw_list, ())
+        skipped = {entry.zvg_id for entry in entries[:10]}
+        remaining = portal._entries_to_fetch(land, raw_list, skipped)
+        self.assertEqual(remaining, entries[10:])
+
+    def test_skipAktenzeichenOfEntriesWithoutZvgId(self):
+        portal = ZvgPortal(logging.getLogger('test'), 'test', 'http://127.0.0.1:1')
+        land = Land(short='nw', name='Nordrhein-Westfalen')
+        raw_list = RawList(content=fixture('list_nw.html'))
+        entries = portal._entries_to_fetch(land, raw_list, ())
+        entries[0].zvg_id = None
+        with mock.patch.object(portal, 'parse_list', return_value=entries):
+            remaining = portal._entries_to_fetch(land, raw_list, (), {entries[0].aktenzeichen, entries[1].aktenzeichen})
+        self.assertEqual(remaining, entries[1:])
+
+
+if __name__ == "__main__":
+    unittest.main()
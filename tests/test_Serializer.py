@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import datetime
+import hashlib
+import json
+import unittest
+
+from zvg_portal.model import ObjektEntry, Addresse
+from zvg_portal.serializer import objekt_message, objekt_id
+from zvg_portal.utils import CustomEncoder
+
+
+def entries():
+    yield ObjektEntry(land_short='nw', raw_list_sha256='0' * 64)
+    yield ObjektEntry(
+        land_short='nw',
+        raw_list_sha256='a' * 64,
+        raw_entry_sha256='b' * 64,
+        anhang_sha256s=['c' * 64, None],
+        urls=['https://www.geoportal.nrw/?zvg=10111'],
+        letzte_aktualisierung=datetime.datetime(2023, 4, 4, 11, 3),
+        aktenzeichen='0003 K 0003/2022',
+        zvg_id=10111,
+        amtsgericht='Münster',
+        objekt_lage='Baugrundstück:\xa0Schillerweg 4, 42279 Wuppertal, Langerfeld',
+        verkehrswert_in_cent=9200000,
+        termin_as_str='Donnerstag, 13. April 2023, 12:30 Uhr',
+        termin_as_date=datetime.datetime(2023, 4, 13, 12, 30),
+        beschreibung='Größe ca. 612 m² "unbebaut"\n\\ Baulast',
+        adresse=Addresse(strasse='Schillerweg 4', plz='42279', ort='Wuppertal', stadtteil='Langerfeld'),
+    )
+    yield ObjektEntry(land_short='by', raw_list_sha256='d' * 64, wurde_aufgehoben=True, zvg_id=0)
+
+
+class SerializerTest(unittest.TestCase):
+    def test_messageMatchesRoundTrip(self):
+        inserted_at = datetime.datetime(2023, 5, 1, 8, 0, 0, 123456)
+        for entry in entries():
+            dumped_data = json.dumps(entry, cls=CustomEncoder, sort_keys=True)
+            expected = json.loads(dumped_data)
+            expected['inserted_at'] = inserted_at.isoformat()
+            expected['_key'] = hashlib.sha256(dumped_data.encode('utf-8')).hexdigest()[0:12]
+            self.assertEqual(json.dumps(expected, sort_keys=True), objekt_message(entry, inserted_at))
+
+    def test_idMatchesIndentedDump(self):
+        for entry in entries():
+            expected = hashlib.sha256(
+                json.dumps(entry, indent=0, cls=CustomEncoder, sort_keys=True).encode('utf-8')
+            ).hexdigest()[:8]
+            self.assertEqual(expected, objekt_id(entry))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import datetime
+import logging
+import os
+import tempfile
+import unittest
+
+from helpers import FakePortal
+from zvg_portal.model import Land, ObjektEntry, RawAnhang, RawEntry, RestoredEntry
+from zvg_portal.scraper import ZvgPortal
+from zvg_portal.state import StateIndex
+
+
+class StateIndexTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.state = StateIndex(os.path.join(self._tmp_dir.name, 'state.sqlite3'))
+
+    def tearDown(self):
+        self.state.close()
+        self._tmp_dir.cleanup()
+
+    def _entry(self, **kwargs) -> ObjektEntry:
+        kwargs.setdefault('zvg_id', 1)
+        kwargs.setdefault('letzte_aktualisierung', datetime.datetime(2022, 1, 2, 3, 4))
+        return ObjektEntry(land_short='nw', raw_list_sha256='0' * 64, **kwargs)
+
+    def test_recordAndRestore(self):
+        self.state.record(self._entry(raw_entry_sha256='1' * 64, anhang_sha256s=['2' * 64], grundbuch='Blatt 1'))
+        entry = self._entry()
+        self.assertTrue(self.state.restore(entry))
+        self.assertEqual(entry.raw_entry_sha256, '1' * 64)
+        self.assertEqual(entry.anhang_sha256s, ['2' * 64])
+        self.assertEqual(entry.grundbuch, 'Blatt 1')
+        self.assertEqual(self.state.raw_entry_sha256(self._entry()), '1' * 64)
+
+    def test_changedEntryIsNotRestored(self):
+        self.state.record(self._entry(raw_entry_sha256='1' * 64))
+        entry = self._entry()
+        entry.letzte_aktualisierung = datetime.datetime(2022, 2, 1)
+        self.assertFalse(self.state.restore(entry))
+        self.assertIsNone(entry.raw_entry_sha256)
+        self.assertFalse(self.state.restore(self._entry(raw_entry_sha256=None, zvg_id=None)))
+
+    def test_anhang(self):
+        self.assertIsNone(self.state.anhang_sha256('nw', 1, 2))
+        self.state.record_anhang('nw', 1, 2, '3' * 64)
+        self.assertEqual(self.state.anhang_sha256('nw', 1, 2), '3' * 64)
+        self.assertIsNone(self.state.anhang_sha256('nw', 1, 3))
+
+
+class DedupTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.server = FakePortal()
+        self.land = Land(short='nw', name='Nordrhein-Westfalen')
+
+    def tearDown(self):
+        self.server.stop()
+        self._tmp_dir.cleanup()
+
+    def _portal(self, **kwargs) -> ZvgPortal:
+        state = StateIndex(os.path.join(self._tmp_dir.name, 'state.sqlite3'))
+        self.addCleanup(state.close)
+        return ZvgPortal(logging.getLogger('test'), 'test', self.server.base_url, state=state, **kwargs)
+
+    def _sha256s(self, items, cls) -> list:
+        return [item.sha256 for item in items if isinstance(item, cls)]
+
+    def test_attachmentsToFetch(self):
+        portal = self._portal()
+        hrefs = [f'?button=showAnhang&land_abk=nw&file_id={file_id}&zvg_id=7' for file_id in (1, 2)]
+        portal._state.record_anhang('nw', 7, 1, '1' * 64)
+        self.assertEqual(portal._attachments_to_fetch(hrefs), hrefs[1:])
+        self.assertEqual(self._portal(refetch_attachments=True)._attachments_to_fetch(hrefs), hrefs)
+
+    def test_knownAttachmentsStayInTheRun(self):
+        # every detail page of the fake portal links the same two attachments
+        first = list(self._portal().list(self.land))
+        self.assertEqual(self.server.requests['showAnhang'], 2)
+        self.assertEqual(len(self._sha256s(first, RawAnhang)), 80)
+        second = list(self._portal().list(self.land))
+        self.assertEqual(self.server.requests['showAnhang'], 2)
+        self.assertEqual(self.server.requests['showZvg'], 80)
+        self.assertEqual(self._sha256s(second, RawAnhang), self._sha256s(first, RawAnhang))
+        self.assertFalse(any(item.is_new for item in second if isinstance(item, RawAnhang)))
+
+        list(self._portal(refetch_attachments=True).list(self.land))
+        self.assertEqual(self.server.requests['showAnhang'], 82)
+
+    def test_restoredEntriesStayInTheRun(self):
+        first = list(self._portal().list(self.land))
+        incremental = list(self._portal(incremental=True).list(self.land))
+        self.assertEqual(self.server.requests['showZvg'], 40)
+        self.assertEqual(self._sha256s(incremental, RestoredEntry), self._sha256s(first, RawEntry))
+        self.assertEqual(self._sha256s(incremental, RawAnhang), self._sha256s(first, RawAnhang))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -13,6 +13,33 @@ class VersteigerungsTerminParserTest(unittest.TestCase):
 
     def test_negativeDay(self):
         dt = VersteigerungsTerminParser().to_datetime('Montag, 30. November -1, 00:00 Uhr')
+        self.assertIsNone(dt)
+
+    def test_umlautAndCase(self):
+        dt = VersteigerungsTerminParser().to_datetime('donnerstag, 2. MÄRZ 2023, 9:05 Uhr')
+        self.assertEqual(datetime.datetime(year=2023, month=3, day=2, hour=9, minute=5), dt)
+
+    def test_invalid(self):
+        parser = VersteigerungsTerminParser()
+        for s in [
+            'Der Termin wurde aufgehoben.',
+            'Montag, 23. Jänner 2023, 09:30 Uhr',
+            'Montag, 30. Februar 2023, 09:30 Uhr',
+        ]:
+            with self.assertRaises(ValueError):
+                parser.to_datetime(s)
+
+    def test_batch(self):
+        termine = VersteigerungsTerminParser().to_datetimes([
+            'Montag, 23. Januar 2023, 09:30 Uhr',
+            'Montag, 23. Januar 2023, 09:30 Uhr',
+            'Freitag, 1. Dezember 2023, 14:00 Uhr',
+            'unbekannt',
+        ])
+        self.assertEqual(termine, {
+            'Montag, 23. Januar 2023, 09:30 Uhr': datetime.datetime(year=2023, month=1, day=23, hour=9, minute=30),
+            'Freitag, 1. Dezember 2023, 14:00 Uhr': datetime.datetime(year=2023, month=12, day=1, hour=14, minute=0),
+        })
 
 
 if __name__ == "__main__":
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import argparse
+import datetime
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            requests.get(url, timeout=1).raise_for_status()
+            return
+        except requests.RequestException:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Runs app.py against tools/replay_server.py and reports its throughput. '
+                    'Arguments after -- are passed to app.py, e.g. -- --concurrency 8 --engine async',
+    )
+    parser.add_argument('--latency', default=0.0, type=float)
+    parser.add_argument('--jitter', default=0.0, type=float)
+    parser.add_argument('--error-rate', default=0.0, type=float)
+    parser.add_argument('--capacity', default=0, type=int)
+    parser.add_argument('--seed', default=0, type=int)
+    parser.add_argument('--corpus')
+    parser.add_argument('--run', action='append')
+    parser.add_argument('--raw-data-directory', help='of the replayed runs')
+    parser.add_argument('--output', help='also write the result to this JSON file')
+    parser.add_argument('app_args', nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+    app_args = args.app_args[1:] if args.app_args[:1] == ['--'] else args.app_args
+
+    port = free_port()
+    server_command = [
+        sys.executable, os.path.join(TOOLS_DIR, 'replay_server.py'),
+        '--port', str(port),
+        '--latency', str(args.latency),
+        '--jitter', str(args.jitter),
+        '--error-rate', str(args.error_rate),
+        '--capacity', str(args.capacity),
+        '--seed', str(args.seed),
+    ]
+    if args.corpus:
+        server_command += ['--corpus', args.corpus]
+    for run in args.run or []:
+        server_command += ['--run', run]
+    if args.raw_data_directory:
+        server_command += ['--raw-data-directory', args.raw_data_directory]
+
+    base_url = f'http://127.0.0.1:{port}'
+    server = subprocess.Popen(server_command)
+    try:
+        wait_for(f'{base_url}/stats')
+        with tempfile.TemporaryDirectory() as raw_data_directory:
+            app_command = [
+                sys.executable, os.path.join(TOOLS_DIR, '..', 'zvg_portal', 'app.py'),
+                '--base-url', base_url,
+                '--nsqd-port', str(port),
+                '--raw-data-directory', raw_data_directory,
+                *app_args,
+            ]
+            started = time.perf_counter()
+            completed = subprocess.run(app_command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            elapsed = time.perf_counter() - started
+        stats = requests.get(f'{base_url}/stats').json()
+    finally:
+        server.terminate()
+        server.wait()
+
+    if completed.returncode != 0:
+        sys.stderr.write(completed.stderr.decode('utf-8', 'replace'))
+        sys.exit(completed.returncode)
+
+    requests_served = sum(value for key, value in stats.items() if key.startswith('requests.'))
+    entries = stats.get('messages.zvg_entries', 0)
+    result = {
+        'created_at': datetime.datetime.now().isoformat(),
+        'app_args': app_args,
+        'latency': args.latency,
+        'jitter': args.jitter,
+        'error_rate': args.error_rate,
+        'capacity': args.capacity,
+        'seconds': round(elapsed, 3),
+        'entries': entries,
+        'entries_per_second': round(entries / elapsed, 2),
+        'requests': requests_served,
+        'requests_per_second': round(requests_served / elapsed, 2),
+        'megabytes_per_second': round(stats.get('bytes_sent', 0) / elapsed / 1e6, 2),
+        'server': stats,
+    }
+    print(json.dumps(result, indent=4, sort_keys=True))
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(result, fp, indent=4, sort_keys=True)
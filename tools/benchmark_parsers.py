@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import argparse
+import datetime
+import gc
+import glob
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import time
+from typing import Callable, Dict, List, Any, TypeVar, Optional
+
+from zvg_portal.model import ObjektEntry
+from zvg_portal.scraper import ZvgPortalBase
+
+T = TypeVar('T')
+
+
+def measure(fn: Callable[[T], Any], items: List[T], repeat: int) -> List[int]:
+    best = [None] * len(items)
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            for i, item in enumerate(items):
+                start = time.perf_counter_ns()
+                fn(item)
+                elapsed = time.perf_counter_ns() - start
+                if best[i] is None or elapsed < best[i]:
+                    best[i] = elapsed
+    finally:
+        gc.enable()
+    return best
+
+
+def summary(unit: str, timings: List[int], rows: int = 0) -> Dict[str, Any]:
+    ret = {
+        'unit': unit,
+        'count': len(timings),
+        'total_ns': sum(timings),
+        'median_ns': int(statistics.median(timings)) if timings else None,
+        'max_ns': max(timings) if timings else None,
+    }
+    if rows:
+        ret['rows'] = rows
+        ret['per_row_ns'] = sum(timings) // rows
+    return ret
+
+
+def try_to_datetime(portal: ZvgPortalBase, s: str) -> None:
+    try:
+        portal._versteigerungs_termin_parser.to_datetime(s)
+    except ValueError:
+        pass
+
+
+def parse_details(portal: ZvgPortalBase, content: bytes) -> None:
+    portal._parse_details(ObjektEntry(land_short='nw', raw_list_sha256=''), content)
+
+
+def parse_html_table(portal: ZvgPortalBase, content: bytes) -> List[Dict[str, Any]]:
+    return list(portal._parse_html_table(portal._html.parse(content, 'latin1')))
+
+
+def run(portal: ZvgPortalBase, list_pages: List[bytes], detail_pages: List[bytes], repeat: int) -> Dict[str, Any]:
+    results = {}
+    tables = [parse_html_table(portal, content) for content in list_pages]
+    results['parse_html_table'] = summary(
+        'page',
+        measure(lambda content: parse_html_table(portal, content), list_pages, repeat),
+        sum(len(table) for table in tables),
+    )
+    results['parse_details'] = summary(
+        'page',
+        measure(lambda content: parse_details(portal, content), detail_pages, repeat),
+        sum(len(parse_html_table(portal, content)[0]) for content in detail_pages),
+    )
+
+    rows = [row for table in tables for row in table]
+    lagen = [portal._remove_duplicate_spaces(' '.join(row['Objekt/Lage'])) for row in rows if 'Objekt/Lage' in row]
+    results['AddressParser.parse'] = summary('row', measure(portal._address_parser.parse, lagen, repeat))
+    werte = [row['Verkehrswert in €'][0] for row in rows if 'Verkehrswert in €' in row]
+    results['VerkehrswertParser.cents'] = summary('row', measure(portal._verkehrswert_parser.cents, werte, repeat))
+    termine = [' '.join(row['Termin']) for row in rows if 'Termin' in row]
+    termine = [termin for termin in termine if 'wurde aufgehoben' not in termin]
+    results['VersteigerungsTerminParser.to_datetime'] = summary(
+        'row',
+        measure(lambda s: try_to_datetime(portal, s), termine, repeat),
+    )
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def report(current: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    for backend, results in current['backends'].items():
+        for name, result in results.items():
+            line = f'{backend:12} {name:40} {result["total_ns"] / 1e6:10.2f} ms'
+            try:
+                old = baseline['backends'][backend][name]['total_ns']
+                line += f' (was {old / 1e6:.2f} ms, {(result["total_ns"] - old) / old:+.1%})'
+            except (KeyError, TypeError):
+                pass
+            print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--corpus',
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'fixtures'),
+        help='directory with list_*.html and detail_*.html pages',
+    )
+    parser.add_argument('--repeat', default=20, type=int)
+    parser.add_argument(
+        '--html-parser',
+        action='append',
+        choices=['lxml', 'html.parser'],
+        help='may be given multiple times, defaults to all available',
+    )
+    parser.add_argument('--output', help='defaults to parser-benchmark-<commit>.json')
+    parser.add_argument('--compare', help='a previous result file to compare against')
+    args = parser.parse_args()
+
+    logger = logging.getLogger('benchmark')
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    list_pages = []
+    for path in sorted(glob.glob(os.path.join(args.corpus, 'list_*.html'))):
+        with open(path, 'rb') as fp:
+            list_pages.append(fp.read())
+    detail_pages = []
+    for path in sorted(glob.glob(os.path.join(args.corpus, 'detail_*.html'))):
+        with open(path, 'rb') as fp:
+            detail_pages.append(fp.read())
+    assert list_pages and detail_pages, f'no list or detail pages in {args.corpus}'
+
+    backends = {}
+    for html_parser in args.html_parser or ['lxml', 'html.parser']:
+        try:
+            portal = ZvgPortalBase(logger, 'http://127.0.0.1', html_parser=html_parser)
+        except ImportError:
+            print(f'Skipping {html_parser}, it is not installed.')
+            continue
+        backends[html_parser] = run(portal, list_pages, detail_pages, args.repeat)
+
+    commit = git_commit()
+    current = {
+        'commit': commit,
+        'created_at': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'repeat': args.repeat,
+        'corpus': {'list_pages': len(list_pages), 'detail_pages': len(detail_pages)},
+        'backends': backends,
+    }
+    output = args.output or f'parser-benchmark-{commit}.json'
+    with open(output, 'w') as fp:
+        json.dump(current, fp, indent=4)
+    print(f'Wrote {output}.')
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as fp:
+            baseline = json.load(fp)
+    report(current, baseline)
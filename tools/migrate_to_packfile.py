@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import argparse
+import hashlib
+
+from zvg_portal.repository import RawRepository, PackRepository
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('source_directory')
+    parser.add_argument('target_directory')
+    parser.add_argument('--max-segment-size', default=1 << 30, type=int)
+    parser.add_argument('--verify', action='store_true')
+    parser.add_argument('--compress', action='store_true')
+    parser.add_argument('--compress-level', default=19, type=int)
+    args = parser.parse_args()
+    source = RawRepository(args.source_directory)
+    target = PackRepository(args.target_directory, args.max_segment_size, args.compress, args.compress_level)
+    migrated = 0
+    skipped = 0
+    for i, sha256 in enumerate(source):
+        content = source.get(sha256)
+        if args.verify and hashlib.sha256(content).hexdigest() != sha256:
+            print(f'Skipping corrupt blob {sha256}')
+            continue
+        if target.store(content, sha256):
+            migrated += 1
+        else:
+            skipped += 1
+        print('.', end='' if (i + 1) % 100 else '\n', flush=True)
+    print(f'\nMigrated {migrated} blobs, {skipped} were already present.')
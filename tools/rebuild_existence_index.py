@@ -0,0 +1,13 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import argparse
+
+from zvg_portal.repository import RawRepository
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('raw_data_directory')
+    args = parser.parse_args()
+    repository = RawRepository(args.raw_data_directory, existence_index=True)
+    count = repository.existence_index.rebuild(repository)
+    print(f'Indexed {count} blobs.')
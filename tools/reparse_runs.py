@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import argparse
+import collections
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from zvg_portal.app import create_logger
+from zvg_portal.model import Land, ObjektEntry, RawList
+from zvg_portal.nsq_util import BufferedNsq, ClientSideCertificate, Nsq
+from zvg_portal.repository import open_repository
+from zvg_portal.scraper import ZvgPortalBase
+from zvg_portal.serializer import objekt_message
+from zvg_portal.state import StateIndex
+
+_worker_state: Dict[str, Any] = {}
+
+
+def read_runs(file_names: List[str]) -> Iterator[Dict[str, Any]]:
+    for file_name in file_names:
+        with (sys.stdin if file_name == '-' else open(file_name, 'r')) as fp:
+            content = fp.read().strip()
+        try:
+            yield json.loads(content)
+        except json.JSONDecodeError:
+            for line in content.splitlines():
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _init_worker(args: argparse.Namespace) -> None:
+    logger = create_logger(args.debug)
+    state = None
+    state_file = args.state_file or os.path.join(args.raw_data_directory, 'state.sqlite3')
+    if os.path.exists(state_file):
+        state = StateIndex(state_file)
+    _worker_state['raw_repository'] = open_repository(args.raw_data_directory, args.raw_storage)
+    _worker_state['state'] = state
+    _worker_state['portal'] = ZvgPortalBase(logger, args.base_url, state=state, html_parser=args.html_parser)
+
+
+def _aktenzeichen_of_detail_page(sha256: str) -> Tuple[str, Optional[str]]:
+    portal = _worker_state['portal']
+    content = _worker_state['raw_repository'].find(sha256)
+    if content is None:
+        portal._logger.error(f'Detail page {sha256} is missing from the raw repository.')
+        return sha256, None
+    if not portal._is_valid_details_page(content):
+        return sha256, None
+    table = next(portal._parse_html_table(portal._html.parse(content, 'latin1')), {})
+    return sha256, portal._find_aktenzeichen(table.get('Aktenzeichen', []))
+
+
+def _parse_list_page(sha256: str) -> Tuple[List[ObjektEntry], List[Optional[str]]]:
+    portal = _worker_state['portal']
+    content = _worker_state['raw_repository'].find(sha256)
+    if content is None:
+        portal._logger.error(f'List page {sha256} is missing from the raw repository.')
+        return [], []
+    land_short = portal._land_short_of_list(content)
+    if land_short is None:
+        portal._logger.error(f'Cannot tell the Land of list page {sha256}.')
+        return [], []
+    entries = portal.parse_list(Land(short=land_short, name=land_short), RawList(content=content))
+    state = _worker_state['state']
+    return entries, [None if state is None else state.raw_entry_sha256(entry) for entry in entries]
+
+
+def _parse_detail_page(job: Tuple[ObjektEntry, Optional[str]]) -> ObjektEntry:
+    entry, sha256 = job
+    if sha256 is None:
+        return entry
+    portal = _worker_state['portal']
+    content = _worker_state['raw_repository'].find(sha256)
+    if content is None:
+        portal._logger.error(f'Detail page {sha256} of {entry.land_short}/{entry.zvg_id} is missing.')
+        return entry
+    entry.raw_entry_sha256 = sha256
+    if portal._is_valid_details_page(content):
+        attachment_hrefs = portal._parse_details(entry, content)
+        if _worker_state['state'] is not None:
+            portal._add_attachments(entry, attachment_hrefs, {})
+    return entry
+
+
+def reparse_run(executor: ProcessPoolExecutor, run: Dict[str, Any]) -> Iterator[ObjektEntry]:
+    by_aktenzeichen = collections.defaultdict(collections.deque)
+    for sha256, aktenzeichen in executor.map(_aktenzeichen_of_detail_page, run['entry_sha256s'], chunksize=16):
+        if aktenzeichen is not None:
+            by_aktenzeichen[aktenzeichen].append(sha256)
+
+    jobs = []
+    for entries, indexed_sha256s in executor.map(_parse_list_page, run['list_sha256s']):
+        for entry, sha256 in zip(entries, indexed_sha256s):
+            candidates = by_aktenzeichen.get(entry.aktenzeichen)
+            if not entry.zvg_id:
+                sha256 = None
+            elif sha256 is None:
+                # without the state index, detail pages are joined by Aktenzeichen: they were fetched in the same
+                # order as the list rows they belong to, which keeps the join right for Aktenzeichen shared between
+                # Amtsgerichte
+                sha256 = candidates.popleft() if candidates else None
+            elif candidates and sha256 in candidates:
+                candidates.remove(sha256)
+            jobs.append((entry, sha256))
+    yield from executor.map(_parse_detail_page, jobs, chunksize=16)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('run_files', nargs='+', help='ScraperRun records as JSON or JSON lines, - for stdin')
+    parser.add_argument('--debug', action='store_true')
+    parser.add_argument(
+        '--raw-data-directory',
+        default=os.path.realpath(os.getenv('RAW_DATA_DIRECTORY', os.path.join(os.path.dirname(__file__), '..', 'raw')))
+    )
+    parser.add_argument(
+        '--raw-storage',
+        choices=['directory', 'packfile'],
+        default=os.getenv('RAW_STORAGE', 'directory'),
+    )
+    parser.add_argument('--state-file', default=os.getenv('STATE_FILE'))
+    parser.add_argument('--base-url', default=os.getenv('BASE_URL', 'https://www.zvg-portal.de'))
+    parser.add_argument('--html-parser', choices=['auto', 'lxml', 'html.parser'], default='auto')
+    parser.add_argument('--processes', default=os.cpu_count(), type=int)
+    parser.add_argument('--output', help='write the entries to this JSON lines file')
+    parser.add_argument('--publish', action='store_true', help='publish the entries to NSQ')
+    parser.add_argument('--nsqd-address', default=os.getenv('NSQD_ADDRESS', '127.0.0.1'))
+    parser.add_argument('--nsqd-port', default=os.getenv('NSQD_PORT', '4151'), type=int)
+    parser.add_argument('--nsq-batch-size', default=os.getenv('NSQ_BATCH_SIZE', '100'), type=int)
+    parser.add_argument('--client-side-crt', default=os.getenv('CLIENT_SIDE_CRT'))
+    parser.add_argument('--client-side-key', default=os.getenv('CLIENT_SIDE_KEY'))
+    args = parser.parse_args()
+    if bool(args.output) == args.publish:
+        parser.error('pass either --output or --publish')
+    logger = create_logger(args.debug)
+
+    nsq = None
+    output = None
+    if args.publish:
+        cert = None
+        if args.client_side_crt or args.client_side_key:
+            cert = ClientSideCertificate(crt_path=args.client_side_crt, key_path=args.client_side_key)
+        nsq = BufferedNsq(Nsq(args.nsqd_address, args.nsqd_port, cert), max_messages=args.nsq_batch_size)
+    else:
+        output = open(args.output, 'w')
+
+    count = 0
+    with ProcessPoolExecutor(args.processes, initializer=_init_worker, initargs=(args,)) as executor:
+        for run in read_runs(args.run_files):
+            run_count = 0
+            for entry in reparse_run(executor, run):
+                if nsq is not None:
+                    nsq.publish('zvg_entries', objekt_message(entry))
+                else:
+                    output.write(objekt_message(entry) + '\n')
+                run_count += 1
+            logger.info(f'Re-parsed {run_count} entries of run {run.get("id")}.')
+            count += run_count
+
+    if nsq is not None:
+        nsq.close()
+    else:
+        output.close()
+    logger.info(f'Re-parsed {count} entries in total.')
+
+
+if __name__ == '__main__':
+    main()
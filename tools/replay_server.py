@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import argparse
+import asyncio
+import collections
+import glob
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import struct
+from typing import Dict, Optional, Tuple, Iterable, Union
+
+from aiohttp import web
+
+from zvg_portal.repository import open_repository, Repository
+from zvg_portal.scraper import ZvgPortalBase
+from zvg_portal.state import StateIndex
+
+EMPTY_LIST = b'<html><body><table></table></body></html>'
+
+
+def form_page(laender: Dict[str, str]) -> bytes:
+    options = ''.join(f'<option value="{short}">{name}</option>' for short, name in sorted(laender.items()))
+    return (
+        f'<html><body><form method="post" action="index.php?button=Suchen"><select name="land_abk">'
+        f'<option value="0">-- Bundesland auswählen --</option>{options}</select></form></body></html>'
+    ).encode('latin1')
+
+
+def attachment_content(file_id: int, size: int) -> bytes:
+    block = hashlib.sha256(str(file_id).encode('ascii')).digest()
+    return (b'%PDF-1.4\n' + block * (size // len(block) + 1))[:size]
+
+
+class FixtureCorpus:
+    def __init__(self, dir_name: str, attachment_size: int):
+        self._attachment_size = attachment_size
+        self._lists: Dict[str, bytes] = {}
+        for path in sorted(glob.glob(os.path.join(dir_name, 'list_*.html'))):
+            with open(path, 'rb') as fp:
+                self._lists[os.path.basename(path)[5:-5]] = fp.read()
+        self._details = []
+        for path in sorted(glob.glob(os.path.join(dir_name, 'detail_*.html'))):
+            with open(path, 'rb') as fp:
+                self._details.append(fp.read())
+        assert self._lists and self._details, f'no list or detail pages in {dir_name}'
+        form_path = os.path.join(dir_name, 'form.html')
+        if os.path.exists(form_path):
+            with open(form_path, 'rb') as fp:
+                self._form = fp.read()
+        else:
+            self._form = form_page({short: short for short in self._lists.keys()})
+
+    def form(self) -> bytes:
+        return self._form
+
+    def list(self, land_short: str) -> bytes:
+        # every Land of the form gets the fixture lists, so the corpus yields some volume
+        content = self._lists.get(land_short) or next(iter(self._lists.values()))
+        return re.sub(rb'land_abk=[a-z]{2}\b', b'land_abk=' + land_short.encode('ascii'), content)
+
+    def detail(self, land_short: str, zvg_id: int) -> Optional[bytes]:
+        return self._details[zvg_id % len(self._details)]
+
+    def attachment(self, land_abk: str, zvg_id: int, file_id: int) -> Optional[bytes]:
+        return attachment_content(file_id, self._attachment_size)
+
+
+class RepositoryCorpus:
+    def __init__(self, repository: Repository, state: StateIndex, runs: Iterable[Dict]):
+        self._repository = repository
+        self._state = state
+        portal = ZvgPortalBase(logging.getLogger('replay'), 'http://127.0.0.1')
+        self._lists: Dict[str, str] = {}
+        for run in runs:
+            for sha256 in run['list_sha256s']:
+                content = repository.find(sha256)
+                land_short = None if content is None else portal._land_short_of_list(content)
+                if land_short is not None:
+                    self._lists[land_short] = sha256
+        self._details: Dict[Tuple[str, int], str] = {
+            (land_short, zvg_id): sha256 for land_short, zvg_id, sha256 in state.raw_entry_sha256s()
+        }
+
+    def form(self) -> bytes:
+        return form_page({short: short for short in self._lists.keys()})
+
+    def list(self, land_short: str) -> bytes:
+        sha256 = self._lists.get(land_short)
+        content = None if sha256 is None else self._repository.find(sha256)
+        return EMPTY_LIST if content is None else content
+
+    def detail(self, land_short: str, zvg_id: int) -> Optional[bytes]:
+        sha256 = self._details.get((land_short, zvg_id))
+        return None if sha256 is None else self._repository.find(sha256)
+
+    def attachment(self, land_abk: str, zvg_id: int, file_id: int) -> Optional[bytes]:
+        sha256 = self._state.anhang_sha256(land_abk, zvg_id, file_id)
+        return None if sha256 is None else self._repository.find(sha256)
+
+
+Corpus = Union[FixtureCorpus, RepositoryCorpus]
+
+
+class ReplayServer:
+    def __init__(
+            self,
+            corpus: Corpus,
+            latency: float = 0.0,
+            jitter: float = 0.0,
+            error_rate: float = 0.0,
+            error_status: int = 500,
+            seed: Optional[int] = None,
+            capacity: int = 0,
+    ):
+        self._corpus = corpus
+        self._capacity = capacity
+        self._in_flight = 0
+        self._latency = latency
+        self._jitter = jitter
+        self._error_rate = error_rate
+        self._error_status = error_status
+        self._random = random.Random(seed)
+        self.stats = collections.Counter()
+        self.app = web.Application()
+        self.app.router.add_route('*', '/{tail:.*}', self.handle)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if request.path in ('/pub', '/mpub'):
+            return await self._handle_nsq(request)
+        if request.path == '/stats':
+            return web.json_response(dict(self.stats))
+
+        button = request.query.get('button')
+        self.stats[f'requests.{button}'] += 1
+        if self._capacity and self._in_flight >= self._capacity:
+            self.stats['overloaded'] += 1
+            return web.Response(status=503)
+        self._in_flight += 1
+        try:
+            return await self._handle_portal(request, button)
+        finally:
+            self._in_flight -= 1
+
+    async def _handle_portal(self, request: web.Request, button: Optional[str]) -> web.Response:
+        delay = self._latency + self._random.uniform(-self._jitter, self._jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self._random.random() < self._error_rate:
+            self.stats['injected_errors'] += 1
+            return web.Response(status=self._error_status)
+
+        if button == 'Termine suchen':
+            content = self._corpus.form()
+        elif button == 'Suchen':
+            content = self._corpus.list((await request.post()).get('land_abk', ''))
+        elif button == 'showZvg':
+            content = self._corpus.detail(request.query['land_abk'], int(request.query['zvg_id'], 10))
+        elif button == 'showAnhang':
+            content = self._corpus.attachment(
+                request.query['land_abk'],
+                int(request.query['zvg_id'], 10),
+                int(request.query['file_id'], 10),
+            )
+        else:
+            content = None
+        if content is None:
+            self.stats['not_found'] += 1
+            return web.Response(status=404)
+        self.stats['bytes_sent'] += len(content)
+        return web.Response(body=content, content_type='text/html', charset='iso-8859-1')
+
+    async def _handle_nsq(self, request: web.Request) -> web.Response:
+        topic = request.query.get('topic')
+        body = await request.read()
+        count = 1 if request.path == '/pub' else struct.unpack('>I', body[0:4])[0]
+        self.stats[f'messages.{topic}'] += count
+        return web.Response(text='OK')
+
+
+def create_corpus(args: argparse.Namespace) -> Corpus:
+    if args.run is None:
+        return FixtureCorpus(args.corpus, args.attachment_size)
+    runs = []
+    for file_name in args.run:
+        with open(file_name, 'r') as fp:
+            content = fp.read().strip()
+        try:
+            runs.append(json.loads(content))
+        except json.JSONDecodeError:
+            runs.extend(json.loads(line) for line in content.splitlines() if line.strip())
+    state = StateIndex(args.state_file or os.path.join(args.raw_data_directory, 'state.sqlite3'))
+    return RepositoryCorpus(open_repository(args.raw_data_directory, args.raw_storage), state, runs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', default=8800, type=int)
+    parser.add_argument(
+        '--corpus',
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'fixtures'),
+        help='directory with form.html, list_<land>.html and detail_*.html pages',
+    )
+    parser.add_argument('--run', action='append', help='replay the pages of these ScraperRun records instead')
+    parser.add_argument('--raw-data-directory')
+    parser.add_argument('--raw-storage', choices=['directory', 'packfile'], default='directory')
+    parser.add_argument('--state-file')
+    parser.add_argument('--attachment-size', default=1 << 16, type=int)
+    parser.add_argument('--latency', default=0.0, type=float, help='seconds added to every portal response')
+    parser.add_argument('--jitter', default=0.0, type=float, help='seconds the latency varies by')
+    parser.add_argument('--error-rate', default=0.0, type=float, help='fraction of portal requests that fail')
+    parser.add_argument('--error-status', default=500, type=int)
+    parser.add_argument('--capacity', default=0, type=int, help='portal requests served at once, 503 beyond')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+    if args.run is not None and args.raw_data_directory is None:
+        parser.error('--run requires --raw-data-directory')
+
+    server = ReplayServer(
+        create_corpus(args),
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed,
+        capacity=args.capacity,
+    )
+    web.run_app(server.app, host=args.host, port=args.port, print=None)
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import argparse
+import os
+import random
+
+from zvg_portal.compression import BlobCompressor
+from zvg_portal.repository import open_repository
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('raw_data_directory')
+    parser.add_argument('--raw-storage', choices=['directory', 'packfile'], default='directory')
+    parser.add_argument('--samples', default=5000, type=int)
+    parser.add_argument('--dict-size', default=1 << 17, type=int)
+    args = parser.parse_args()
+    repository = open_repository(args.raw_data_directory, args.raw_storage)
+    sha256s = list(repository)
+    random.shuffle(sha256s)
+    samples = []
+    for sha256 in sha256s:
+        content = repository.get(sha256)
+        # only the HTML pages share the portal's boilerplate, attachments are mostly PDFs and images
+        if content.lstrip()[0:1] != b'<':
+            continue
+        samples.append(content)
+        if len(samples) >= args.samples:
+            break
+    print(f'Training dictionary on {len(samples)} of {len(sha256s)} blobs.')
+    dict_id = BlobCompressor.train(os.path.join(args.raw_data_directory, 'zstd-dictionaries'), samples, args.dict_size)
+    print(f'Dictionary {dict_id} is now used for newly compressed blobs.')
@@ -1,12 +1,14 @@
 #!/usr/bin/env python3
 import argparse
+import asyncio
 import datetime
-import hashlib
 import json
-import locale
 import logging
 import os
 import platform
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Union, Dict, Any, List, Optional, Tuple, Set, Collection
 
 import requests
 import requests.adapters
@@ -14,97 +16,418 @@ import requests.adapters
 __service__ = 'ZvgPortalScraper'
 __version__ = '1.0.0'
 
-from zvg_portal.model import ObjektEntry, RawList, RawEntry, ScraperRun, RawAnhang
-from zvg_portal.nsq_util import Nsq, ClientSideCertificate
-from zvg_portal.repository import RawRepository
+from zvg_portal.journal import RunJournal
+from zvg_portal.metrics import REGISTRY, Metrics, serve_metrics
+from zvg_portal.model import ObjektEntry, RawList, RawEntry, RestoredEntry, ScraperRun, RawAnhang, Land, Sha256Array
+from zvg_portal.nsq_util import Nsq, ClientSideCertificate, BufferedNsq, Publisher, NsqTcp
+from zvg_portal.profiling import Profiler, start_profiler, stop_profiler
+from zvg_portal.rate_limiter import HostLimiters
+from zvg_portal.repository import Repository, open_repository
 from zvg_portal.scraper import ZvgPortal
+from zvg_portal.serializer import objekt_message
+from zvg_portal.state import StateIndex
+from zvg_portal.stats import ListStats
 from zvg_portal.utils import ConsoleHandler, CustomEncoder
 
+_worker_state: Dict[str, Any] = {}
+
+
+def create_logger(debug: bool) -> logging.Logger:
+    logger = logging.getLogger(__service__)
+    if not any(isinstance(handler, ConsoleHandler) for handler in logger.handlers):
+        logger.handlers.append(ConsoleHandler())
+    logger.setLevel(logging.DEBUG if debug else logging.INFO)
+    return logger
+
+
+def create_nsq(args: argparse.Namespace) -> Publisher:
+    cert = None
+    if args.client_side_crt or args.client_side_key:
+        assert os.path.exists(args.client_side_crt)
+        assert os.path.exists(args.client_side_key)
+        cert = ClientSideCertificate(crt_path=args.client_side_crt, key_path=args.client_side_key)
+    if args.nsq_transport == 'tcp':
+        nsq = NsqTcp(args.nsqd_address, args.nsqd_tcp_port, cert, tls=args.nsq_tls, user_agent=args.user_agent)
+    else:
+        nsq = Nsq(args.nsqd_address, args.nsqd_port, cert)
+    if args.nsq_batch_size > 1:
+        return BufferedNsq(nsq, max_messages=args.nsq_batch_size, flush_interval=args.nsq_flush_interval)
+    return nsq
+
+
+def create_repository(args: argparse.Namespace) -> Repository:
+    return open_repository(args.raw_data_directory, args.raw_storage, args.compress, args.existence_index)
+
+
+def create_state(args: argparse.Namespace) -> StateIndex:
+    return StateIndex(args.state_file or os.path.join(args.raw_data_directory, 'state.sqlite3'))
+
+
+def portal_options(args: argparse.Namespace, raw_repository: Repository, state: StateIndex) -> Dict[str, Any]:
+    return {
+        'raw_repository': raw_repository,
+        'state': state,
+        'incremental': args.incremental,
+        'refetch_attachments': args.refetch_attachments,
+        'html_parser': args.html_parser,
+        'limiters': create_limiters(args),
+    }
+
+
+def create_limiters(args: argparse.Namespace) -> Optional[HostLimiters]:
+    if not args.adaptive_concurrency:
+        return None
+    return HostLimiters(
+        max_concurrency=args.concurrency,
+        min_concurrency=args.min_concurrency,
+        max_rate=args.max_rate,
+        min_rate=args.min_rate,
+        latency_target=args.latency_target,
+    )
+
+
+def log_limiter_stats(logger: logging.Logger, limiters: Optional[HostLimiters]) -> None:
+    for host, stats in ({} if limiters is None else limiters.stats()).items():
+        rate_limit = 'none' if stats.rate_limit is None else f'{stats.rate_limit:.2f}/s'
+        logger.info(
+            f'{host}: {stats.requests} requests at {stats.effective_rate:.2f}/s, '
+            f'{stats.overloaded} overloaded, {stats.timeouts} timed out, {stats.decreases} decreases, '
+            f'concurrency limit {stats.concurrency_limit:.1f} (max {stats.max_concurrency_limit:.1f}, '
+            f'{stats.max_in_flight} in flight), rate limit {rate_limit}, mean latency {stats.mean_latency:.3f}s'
+        )
+
+
+def checkpoint(run: ScraperRun, nsq: Publisher, journal: RunJournal, completed_land: Optional[str] = None) -> None:
+    nsq.flush()
+    journal.checkpoint(run, REGISTRY, completed_land)
+
+
+def process_entry(
+        entry: Union[ObjektEntry, RawList, RawEntry, RestoredEntry, RawAnhang],
+        run: ScraperRun,
+        raw_repository: Repository,
+        nsq: Publisher,
+        print_entries: bool = False,
+        journal: Optional[RunJournal] = None,
+) -> None:
+    if isinstance(entry, ObjektEntry):
+        run.scraped_entries += 1
+        if print_entries:
+            print(json.dumps(entry, indent=4, cls=CustomEncoder, sort_keys=True))
+        nsq.publish('zvg_entries', objekt_message(entry))
+        if journal is not None:
+            journal.processed(entry)
+            if journal.due():
+                checkpoint(run, nsq, journal)
+    elif isinstance(entry, RawList):
+        if raw_repository.store(entry.content, entry.sha256):
+            run.new_file_count += 1
+        if journal is None or not journal.resumes_list(entry.sha256):
+            run.list_sha256s.append(entry.sha256)
+    elif isinstance(entry, RawEntry):
+        if raw_repository.store(entry.content, entry.sha256):
+            run.new_file_count += 1
+        run.entry_sha256s.append(entry.sha256)
+    elif isinstance(entry, RestoredEntry):
+        run.entry_sha256s.append(entry.sha256)
+    elif isinstance(entry, RawAnhang):
+        if entry.is_new:
+            run.new_file_count += 1
+        run.anhang_sha256s.append(entry.sha256)
+    else:
+        raise NotImplementedError(f'Unknown type: {type(entry)}')
+
+
+def print_stats(
+        logger: logging.Logger,
+        zvg_portal: ZvgPortal,
+        laender: List[Land],
+        quantiles: int = 0,
+) -> Dict[str, RawList]:
+    stats = ListStats(quantiles)
+    raw_lists = {}
+    for land in laender:
+        raw_list = raw_lists[land.short] = zvg_portal.fetch_list(land)
+        stats.extend(zvg_portal.parse_list(land, raw_list))
+        land_stats = stats.by_land.get(land.short)
+        if land_stats is None:
+            continue
+        logger.info(f'{land_stats.count} Zwangsversteigerungen in {land.name}, {land_stats.summary(quantiles)}')
+        for entry in (land_stats.cheapest, land_stats.most_expensive):
+            if entry is None:
+                continue
+            print(json.dumps(entry, indent=4, cls=CustomEncoder, sort_keys=True))
+            print(f'{zvg_portal.endpoints.show_details}&zvg_id={entry.zvg_id}&land_abk={land.short}')
+    for amtsgericht, amtsgericht_stats in sorted(stats.by_amtsgericht.items()):
+        logger.info(
+            f'{amtsgericht_stats.count} Zwangsversteigerungen am Amtsgericht {amtsgericht}, '
+            f'{amtsgericht_stats.summary(quantiles)}'
+        )
+    return raw_lists
+
+
+async def scrape_async(
+        logger: logging.Logger,
+        args: argparse.Namespace,
+        run: ScraperRun,
+        raw_repository: Repository,
+        state: StateIndex,
+        nsq: Publisher,
+        laender: List[Land],
+        raw_lists: Dict[str, RawList],
+        journal: RunJournal,
+        processed_zvg_ids: Dict[str, Set[int]],
+        processed_aktenzeichen: Dict[str, Set[str]],
+) -> None:
+    from zvg_portal.async_scraper import AsyncZvgPortal
+
+    async with AsyncZvgPortal(
+            logger,
+            args.user_agent,
+            args.base_url,
+            args.concurrency,
+            **portal_options(args, raw_repository, state),
+    ) as zvg_portal:
+        for land in laender:
+            async for entry in zvg_portal.list(
+                    land,
+                    raw_list=raw_lists.pop(land.short, None),
+                    skip_zvg_ids=processed_zvg_ids.get(land.short, ()),
+                    skip_aktenzeichen=processed_aktenzeichen.get(land.short, ()),
+            ):
+                process_entry(entry, run, raw_repository, nsq, args.print_entries, journal)
+            checkpoint(run, nsq, journal, land.short)
+        log_limiter_stats(logger, zvg_portal.limiters)
+
+
+def write_profile(logger: logging.Logger, args: argparse.Namespace, profiler: Profiler, run_id: str) -> None:
+    stop_profiler()
+    profile_directory = args.profile_directory or os.path.join(args.raw_data_directory, 'profiles')
+    os.makedirs(profile_directory, exist_ok=True)
+    for path in profiler.write(profile_directory, run_id):
+        logger.info(F'Wrote profile {path}')
+
+
+def _init_worker(args: argparse.Namespace) -> None:
+    REGISTRY.drain()
+    logger = create_logger(args.debug)
+    _worker_state['args'] = args
+    _worker_state['logger'] = logger
+    _worker_state['raw_repository'] = raw_repository = create_repository(args)
+    _worker_state['zvg_portal'] = ZvgPortal(
+        logger,
+        args.user_agent,
+        args.base_url,
+        args.concurrency,
+        **portal_options(args, raw_repository, create_state(args)),
+    )
+    _worker_state['nsq'] = create_nsq(args)
+    _worker_state['profiler'] = start_profiler(args.profile, args.profile_interval) if args.profile else None
+
+
+def _scrape_land_in_worker(
+        land: Land,
+        raw_list: Optional[RawList] = None,
+        skip_zvg_ids: Collection[int] = (),
+        skip_aktenzeichen: Collection[str] = (),
+) -> Tuple[ScraperRun, Metrics, Any]:
+    run = ScraperRun()
+    entries = _worker_state['zvg_portal'].list(
+        land,
+        raw_list=raw_list,
+        skip_zvg_ids=skip_zvg_ids,
+        skip_aktenzeichen=skip_aktenzeichen,
+    )
+    for entry in entries:
+        process_entry(
+            entry,
+            run,
+            _worker_state['raw_repository'],
+            _worker_state['nsq'],
+            _worker_state['args'].print_entries,
+        )
+    _worker_state['nsq'].flush()
+    log_limiter_stats(_worker_state['logger'], _worker_state['zvg_portal'].limiters)
+    profiler = _worker_state['profiler']
+    return run, REGISTRY.drain(), profiler.drain() if profiler is not None else None
+
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--debug', action='store_true')
     parser.add_argument('--print-stats', action='store_true')
+    parser.add_argument('--stats-only', action='store_true')
+    parser.add_argument('--stats-quantiles', default=os.getenv('STATS_QUANTILES', '0'), type=int)
     parser.add_argument('--print-entries', action='store_true')
     parser.add_argument('--base-url', default=os.getenv('BASE_URL', 'https://www.zvg-portal.de'))
     parser.add_argument('--nsqd-address', default=os.getenv('NSQD_ADDRESS', '127.0.0.1'))
     parser.add_argument('--nsqd-port', default=os.getenv('NSQD_PORT', '4151'), type=int)
+    parser.add_argument('--nsqd-tcp-port', default=os.getenv('NSQD_TCP_PORT', '4150'), type=int)
+    parser.add_argument('--nsq-transport', choices=['http', 'tcp'], default=os.getenv('NSQ_TRANSPORT', 'http'))
+    parser.add_argument('--nsq-tls', action='store_true')
+    parser.add_argument('--nsq-batch-size', default=os.getenv('NSQ_BATCH_SIZE', '1'), type=int)
+    parser.add_argument('--nsq-flush-interval', default=os.getenv('NSQ_FLUSH_INTERVAL', '1.0'), type=float)
     parser.add_argument('--client-side-crt', default=os.getenv('CLIENT_SIDE_CRT'))
     parser.add_argument('--client-side-key', default=os.getenv('CLIENT_SIDE_KEY'))
+    parser.add_argument('--concurrency', default=os.getenv('CONCURRENCY'), type=int)
+    parser.add_argument('--engine', choices=['threads', 'async'], default=os.getenv('ENGINE', 'threads'))
+    parser.add_argument('--adaptive-concurrency', action='store_true')
+    parser.add_argument('--min-concurrency', default=os.getenv('MIN_CONCURRENCY', '1'), type=int)
+    parser.add_argument('--max-rate', default=os.getenv('MAX_RATE'), type=float)
+    parser.add_argument('--min-rate', default=os.getenv('MIN_RATE', '0.5'), type=float)
+    parser.add_argument('--latency-target', default=os.getenv('LATENCY_TARGET', '2.0'), type=float)
+    parser.add_argument('--processes', default=os.getenv('PROCESSES', '1'), type=int)
+    parser.add_argument('--incremental', action='store_true')
+    parser.add_argument('--refetch-attachments', action='store_true')
+    parser.add_argument('--state-file', default=os.getenv('STATE_FILE'))
     parser.add_argument(
         '--raw-data-directory',
         default=os.path.realpath(os.getenv('RAW_DATA_DIRECTORY', os.path.join(os.path.dirname(__file__), '..', 'raw')))
     )
+    parser.add_argument(
+        '--raw-storage',
+        choices=['directory', 'packfile'],
+        default=os.getenv('RAW_STORAGE', 'directory'),
+    )
+    parser.add_argument('--compress', action='store_true')
+    parser.add_argument('--existence-index', action='store_true')
+    parser.add_argument('--metrics-port', default=os.getenv('METRICS_PORT'), type=int)
+    parser.add_argument('--metrics-textfile', default=os.getenv('METRICS_TEXTFILE'))
+    parser.add_argument('--profile', choices=['sampling', 'cprofile'], default=os.getenv('PROFILE'))
+    parser.add_argument('--profile-directory', default=os.getenv('PROFILE_DIRECTORY'))
+    parser.add_argument('--profile-interval', default=os.getenv('PROFILE_INTERVAL', '0.005'), type=float)
+    parser.add_argument('--resume', metavar='RUN_ID')
+    parser.add_argument('--journal-directory', default=os.getenv('JOURNAL_DIRECTORY'))
+    parser.add_argument('--checkpoint-interval', default=os.getenv('CHECKPOINT_INTERVAL', '30'), type=float)
+    parser.add_argument(
+        '--html-parser',
+        choices=['auto', 'lxml', 'html.parser'],
+        default=os.getenv('HTML_PARSER', 'auto'),
+    )
     parser.add_argument(
         '--user-agent',
         default=F'{__service__}/{__version__} (python-requests {requests.__version__}) '
                 F'{platform.system()} ({platform.release()})'
     )
     args = parser.parse_args()
+    if args.concurrency is None:
+        args.concurrency = 100 if args.engine == 'async' else 1
+    if args.processes > 1 and args.engine != 'threads':
+        parser.error('--processes requires --engine threads')
+    if args.adaptive_concurrency and not 1 <= args.min_concurrency <= args.concurrency:
+        parser.error('--min-concurrency must be between 1 and --concurrency')
+    if args.existence_index and args.raw_storage != 'directory':
+        parser.error('--existence-index requires --raw-storage directory')
+    if args.profile and args.engine != 'threads':
+        parser.error('--profile requires --engine threads')
+    journal_directory = args.journal_directory or os.path.join(args.raw_data_directory, 'journal')
+    if args.resume and not os.path.exists(RunJournal.path_of(journal_directory, args.resume)):
+        parser.error(f'No journal of run {args.resume} in {journal_directory}')
 
-    logger = logging.getLogger(__service__)
-    logger.handlers.append(ConsoleHandler())
-    logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
+    logger = create_logger(args.debug)
+    if args.metrics_port is not None:
+        serve_metrics(args.metrics_port)
+    profiler = start_profiler(args.profile, args.profile_interval) if args.profile else None
 
-    locale.setlocale(locale.LC_ALL, 'de_DE')
     logger.debug(F'Using User-Agent string: {args.user_agent}')
-    cert = None
-    if args.client_side_crt or args.client_side_key:
-        assert os.path.exists(args.client_side_crt)
-        assert os.path.exists(args.client_side_key)
-        cert = ClientSideCertificate(crt_path=args.client_side_crt, key_path=args.client_side_key)
-    nsq = Nsq(args.nsqd_address, args.nsqd_port, cert)
-    zvg_portal = ZvgPortal(logger, args.user_agent, args.base_url)
+    nsq = create_nsq(args)
+    raw_repository = create_repository(args)
+    state = create_state(args)
+    zvg_portal = ZvgPortal(
+        logger,
+        args.user_agent,
+        args.base_url,
+        args.concurrency,
+        **portal_options(args, raw_repository, state),
+    )
 
-    if args.print_stats:
-        for land in zvg_portal.get_laender():
-            entries = [entry for entry in zvg_portal.list(land) if isinstance(entry, ObjektEntry)]
-            if len(entries) == 0:
-                continue
-            total_cents = sum(entry.verkehrswert_in_cent for entry in entries if entry.verkehrswert_in_cent)
-            logger.info(
-                f'{len(entries)} Zwangsversteigerungen in {land.name}, '
-                f'Verkehrswertsumme: {locale.currency(total_cents / 100)}'
-            )
-            by_price = sorted(
-                (entry for entry in entries if entry.verkehrswert_in_cent),
-                key=lambda e: e.verkehrswert_in_cent
-            )
-            print(json.dumps(by_price[0], indent=4, cls=CustomEncoder, sort_keys=True))
-            print(f'{zvg_portal.endpoints.show_details}&zvg_id={by_price[0].zvg_id}&land_abk={land.short}')
-            print(json.dumps(by_price[-1], indent=4, cls=CustomEncoder, sort_keys=True))
-            print(f'{zvg_portal.endpoints.show_details}&zvg_id={by_price[-1].zvg_id}&land_abk={land.short}')
+    laender = list(zvg_portal.get_laender())
+    raw_lists: Dict[str, RawList] = {}
+    if args.print_stats or args.stats_only:
+        raw_lists = print_stats(logger, zvg_portal, laender, args.stats_quantiles)
+        if args.stats_only:
+            nsq.close()
+            if profiler is not None:
+                write_profile(logger, args, profiler, str(uuid.uuid4()))
+            return
 
-    raw_repository = RawRepository(args.raw_data_directory)
-    run = ScraperRun()
-    for land in zvg_portal.get_laender():
-        entries = zvg_portal.list(land)
-        for entry in entries:
-            if isinstance(entry, ObjektEntry):
-                run.scraped_entries += 1
-                if args.print_entries:
-                    print(json.dumps(entry, indent=4, cls=CustomEncoder, sort_keys=True))
-                dumped_data = json.dumps(entry, cls=CustomEncoder, sort_keys=True)
-                data = json.loads(dumped_data)
-                data['inserted_at'] = datetime.datetime.utcnow().isoformat()
-                data['_key'] = hashlib.sha256(dumped_data.encode('utf-8')).hexdigest()[0:12]
-                nsq.publish('zvg_entries', json.dumps(data, sort_keys=True))
-            elif isinstance(entry, RawList):
-                if raw_repository.store(entry.content):
-                    run.new_file_count += 1
-                run.list_sha256s.append(entry.sha256)
-            elif isinstance(entry, RawEntry):
-                if raw_repository.store(entry.content):
-                    run.new_file_count += 1
-                run.entry_sha256s.append(entry.sha256)
-            elif isinstance(entry, RawAnhang):
-                if raw_repository.store(entry.content):
-                    run.new_file_count += 1
-                run.anhang_sha256s.append(entry.sha256)
-            else:
-                raise NotImplementedError(f'Unknown type: {type(entry)}')
+    os.makedirs(journal_directory, exist_ok=True)
+    if args.resume:
+        journal = RunJournal(RunJournal.path_of(journal_directory, args.resume), args.checkpoint_interval)
+        run = journal.restore()
+        if run is None:
+            journal.close()
+            nsq.close()
+            parser.error(f'Journal {journal.path} holds no run, start a new one without --resume')
+        journal_metrics = journal.metrics()
+        if journal_metrics is not None:
+            REGISTRY.merge(journal_metrics)
+        completed_laender = journal.completed_laender()
+        laender = [land for land in laender if land.short not in completed_laender]
+        logger.info(
+            F'Resuming run {run.id} started {run.scraper_started.isoformat()}, {len(completed_laender)} Länder '
+            F'completed, {run.scraped_entries} entries scraped'
+        )
+    else:
+        run = ScraperRun()
+        journal = RunJournal(RunJournal.path_of(journal_directory, run.id), args.checkpoint_interval)
+        journal.begin(run)
+        logger.info(F'Journaling run {run.id} to {journal.path}')
+    processed_zvg_ids = journal.processed_zvg_ids()
+    processed_aktenzeichen = journal.processed_aktenzeichen()
+    # a partially scraped Land continues with the list page its first entries came from
+    for land_short, sha256 in journal.processed_lists().items():
+        content = raw_repository.find(sha256)
+        if content is not None:
+            raw_lists[land_short] = RawList(content=content)
+
+    if args.engine == 'async':
+        asyncio.run(scrape_async(
+            logger, args, run, raw_repository, state, nsq, laender, raw_lists, journal, processed_zvg_ids,
+            processed_aktenzeichen,
+        ))
+    elif args.processes > 1:
+        with ProcessPoolExecutor(args.processes, initializer=_init_worker, initargs=(args,)) as executor:
+            worker_raw_lists = [raw_lists.pop(land.short, None) for land in laender]
+            worker_skip_zvg_ids = [processed_zvg_ids.get(land.short, ()) for land in laender]
+            worker_skip_aktenzeichen = [processed_aktenzeichen.get(land.short, ()) for land in laender]
+            worker_results = executor.map(
+                _scrape_land_in_worker,
+                laender,
+                worker_raw_lists,
+                worker_skip_zvg_ids,
+                worker_skip_aktenzeichen,
+            )
+            for land, (land_run, land_metrics, land_profile) in zip(laender, worker_results):
+                land_run.list_sha256s = Sha256Array(
+                    sha256 for sha256 in land_run.list_sha256s if not journal.resumes_list(sha256)
+                )
+                run.merge(land_run)
+                REGISTRY.merge(land_metrics)
+                if land_profile is not None:
+                    profiler.merge(land_profile)
+                checkpoint(run, nsq, journal, land.short)
+    else:
+        for land in laender:
+            for entry in zvg_portal.list(
+                    land,
+                    raw_list=raw_lists.pop(land.short, None),
+                    skip_zvg_ids=processed_zvg_ids.get(land.short, ()),
+                    skip_aktenzeichen=processed_aktenzeichen.get(land.short, ()),
+            ):
+                process_entry(entry, run, raw_repository, nsq, args.print_entries, journal)
+            checkpoint(run, nsq, journal, land.short)
+        log_limiter_stats(logger, zvg_portal.limiters)
     run.scraper_finished = datetime.datetime.utcnow()
+    nsq.flush()
+    run.metrics = REGISTRY.summary()
     nsq.publish('zvg_scraper_runs', json.dumps(run, cls=CustomEncoder, sort_keys=True))
+    nsq.close()
+    journal.remove()
+    if args.metrics_textfile:
+        REGISTRY.write_textfile(args.metrics_textfile)
+    if profiler is not None:
+        write_profile(logger, args, profiler, run.id)
     print(json.dumps(run, indent=4, cls=CustomEncoder, sort_keys=True))
 
 
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+import collections
+import logging
+from typing import AsyncIterator, List, Union, Optional, Callable, Awaitable, TypeVar, Collection
+from urllib.parse import urlsplit
+
+import aiohttp
+from urllib3 import Retry
+
+from zvg_portal.metrics import REGISTRY
+from zvg_portal.model import Land, ObjektEntry, RawList, RawEntry, RawAnhang, RestoredEntry
+from zvg_portal.rate_limiter import AdaptiveLimiter, HostLimiters, OVERLOAD_STATUSES
+from zvg_portal.repository import Repository
+from zvg_portal.scraper import ZvgPortalBase
+from zvg_portal.state import StateIndex
+
+T = TypeVar('T')
+
+
+class AsyncZvgPortal(ZvgPortalBase):
+    def __init__(
+            self,
+            logger: logging.Logger,
+            user_agent: str,
+            base_url: str,
+            concurrency: int = 100,
+            fixed_timeout: int = 5,
+            retries: int = 3,
+            backoff_factor: float = 0.3,
+            status_forcelist=(429, 500, 502, 503, 504),
+            state: Optional[StateIndex] = None,
+            incremental: bool = False,
+            refetch_attachments: bool = False,
+            raw_repository: Optional[Repository] = None,
+            html_parser: str = 'auto',
+            limiters: Optional[HostLimiters] = None,
+    ):
+        super().__init__(
+            logger, base_url, concurrency, state, incremental, refetch_attachments, raw_repository, html_parser
+        )
+        self.limiters = limiters
+        self._user_agent = user_agent
+        self._fixed_timeout = fixed_timeout
+        self._retries = retries
+        self._backoff_factor = backoff_factor
+        self._status_forcelist = status_forcelist
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self) -> 'AsyncZvgPortal':
+        self._session = aiohttp.ClientSession(
+            headers={'User-Agent': self._user_agent},
+            timeout=aiohttp.ClientTimeout(
+                total=None,
+                sock_connect=self._fixed_timeout,
+                sock_read=self._fixed_timeout,
+            ),
+            connector=aiohttp.TCPConnector(limit=self._concurrency),
+        )
+        self._semaphore = asyncio.Semaphore(self._concurrency)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self._session.close()
+        self._session = None
+
+    async def _request(
+            self,
+            method: str,
+            url: str,
+            read: Optional[Callable[[aiohttp.ClientResponse], Awaitable[T]]] = None,
+            **kwargs
+    ) -> Union[bytes, T]:
+        assert self._session is not None, 'use "async with AsyncZvgPortal(...)"'
+        limiter = None if self.limiters is None else self.limiters.get(urlsplit(url).netloc)
+        # like urllib3's Retry, which the threaded engine uses: a request that may have reached the portal is only
+        # sent again if its method is idempotent
+        idempotent = method.upper() in Retry.DEFAULT_ALLOWED_METHODS
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    async with await self._send(limiter, method, url, **kwargs) as response:
+                        if response.status not in self._status_forcelist or not idempotent \
+                                or attempt >= self._retries:
+                            response.raise_for_status()
+                            return await (response.read() if read is None else read(response))
+            except (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError):
+                if attempt >= self._retries:
+                    raise
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if not idempotent or attempt >= self._retries:
+                    raise
+            await asyncio.sleep(self._backoff_factor * (2 ** attempt))
+            attempt += 1
+
+    async def _send(
+            self,
+            limiter: Optional[AdaptiveLimiter],
+            method: str,
+            url: str,
+            **kwargs
+    ) -> aiohttp.ClientResponse:
+        if limiter is None:
+            return await self._session.request(method, url, **kwargs)
+        started = await limiter.acquire_async()
+        overloaded = timed_out = False
+        try:
+            response = await self._session.request(method, url, **kwargs)
+            overloaded = response.status in OVERLOAD_STATUSES
+            return response
+        except asyncio.TimeoutError:
+            timed_out = True
+            raise
+        except aiohttp.ClientConnectionError:
+            overloaded = True
+            raise
+        finally:
+            limiter.release(started, overloaded, timed_out)
+
+    async def get_laender(self) -> List[Land]:
+        return list(self._parse_laender(await self._request('GET', self.endpoints.form)))
+
+    async def _stream_attachment(self, response: aiohttp.ClientResponse) -> RawAnhang:
+        with self._blob_writer() as writer:
+            async for chunk in response.content.iter_chunked(self._chunk_size):
+                writer.write(chunk)
+            return self._stored_attachment(writer)
+
+    async def _fetch_attachment(self, href: str) -> RawAnhang:
+        with REGISTRY.timer('zvg_http_request_seconds', call='attachment'):
+            raw_anhang = await self._request(
+                'GET',
+                f'{self._base_url}/{href}',
+                self._stream_attachment,
+                headers={'Referer': self.referer},
+            )
+        REGISTRY.inc('zvg_http_downloaded_bytes_total', raw_anhang.size, call='attachment')
+        return raw_anhang
+
+    async def _fetch_details(
+            self,
+            land: Land,
+            entry: ObjektEntry,
+    ) -> List[Union[RawEntry, RestoredEntry, RawAnhang, ObjektEntry]]:
+        ret = []
+        if entry.zvg_id and self._restore_unchanged(entry):
+            ret.extend(self._restored(entry))
+        elif entry.zvg_id:
+            with REGISTRY.timer('zvg_http_request_seconds', call='detail'):
+                content = await self._request('GET', self._details_url(land, entry), headers={'Referer': self.referer})
+            REGISTRY.inc('zvg_http_downloaded_bytes_total', len(content), call='detail')
+            last_raw_entry = RawEntry(content=content)
+            entry.raw_entry_sha256 = last_raw_entry.sha256
+            ret.append(last_raw_entry)
+            if self._is_valid_details_page(content):
+                attachment_hrefs = self._parse_details(entry, content)
+                missing_hrefs = self._attachments_to_fetch(attachment_hrefs)
+                fetched = await asyncio.gather(*(self._fetch_attachment(href) for href in missing_hrefs))
+                ret.extend(self._add_attachments(entry, attachment_hrefs, dict(zip(missing_hrefs, fetched))))
+                self._record_details(entry)
+            else:
+                self._logger.error(f'Response not valid {entry}, could not : {content}')
+
+        ret.append(entry)
+        return ret
+
+    async def fetch_list(self, land: Land, plz: str = '') -> RawList:
+        with REGISTRY.timer('zvg_http_request_seconds', call='list'):
+            content = await self._request(
+                'POST',
+                self.endpoints.index,
+                params=self._list_params(),
+                data=self._list_data(land, plz),
+            )
+        REGISTRY.inc('zvg_http_downloaded_bytes_total', len(content), call='list')
+        return RawList(content=content)
+
+    async def list(
+            self,
+            land: Land,
+            plz: str = '',
+            raw_list: Optional[RawList] = None,
+            skip_zvg_ids: Collection[int] = (),
+            skip_aktenzeichen: Collection[str] = (),
+    ) -> AsyncIterator[Union[RawList, RawEntry, RestoredEntry, ObjektEntry, RawAnhang]]:
+        last_raw_list = await self.fetch_list(land, plz) if raw_list is None else raw_list
+        yield last_raw_list
+
+        pending = collections.deque()
+        try:
+            for entry in self._entries_to_fetch(land, last_raw_list, skip_zvg_ids, skip_aktenzeichen):
+                pending.append(asyncio.ensure_future(self._fetch_details(land, entry)))
+                if len(pending) >= 2 * self._concurrency:
+                    for fetched in await pending.popleft():
+                        yield fetched
+            while pending:
+                for fetched in await pending.popleft():
+                    yield fetched
+        finally:
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+import threading
+from typing import Dict, List, Optional
+
+import zstandard
+
+
+class BlobCompressor:
+    def __init__(self, dictionary_dir_name: str, level: int = 3):
+        self._dictionary_dir_name = dictionary_dir_name
+        self._level = level
+        self._lock = threading.Lock()
+        self._dictionaries: Dict[int, zstandard.ZstdCompressionDict] = {}
+        self._decompressors: Dict[int, zstandard.ZstdDecompressor] = {}
+        current = self._current_dictionary()
+        self._compressor = zstandard.ZstdCompressor(level=level, dict_data=current, write_checksum=True)
+
+    def _current_dictionary(self) -> Optional[zstandard.ZstdCompressionDict]:
+        current_path = os.path.join(self._dictionary_dir_name, 'current')
+        if not os.path.exists(current_path):
+            return None
+        with open(current_path, 'r') as fp:
+            return self._dictionary(int(fp.read().strip(), 10))
+
+    def _dictionary(self, dict_id: int) -> zstandard.ZstdCompressionDict:
+        if dict_id not in self._dictionaries:
+            with open(os.path.join(self._dictionary_dir_name, f'{dict_id}.dict'), 'rb') as fp:
+                self._dictionaries[dict_id] = zstandard.ZstdCompressionDict(fp.read())
+        return self._dictionaries[dict_id]
+
+    def compress(self, content: bytes) -> bytes:
+        with self._lock:
+            return self._compressor.compress(content)
+
+    def decompress(self, data: bytes) -> bytes:
+        dict_id = zstandard.get_frame_parameters(data).dict_id
+        with self._lock:
+            if dict_id not in self._decompressors:
+                dict_data = self._dictionary(dict_id) if dict_id else None
+                self._decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=dict_data)
+            return self._decompressors[dict_id].decompress(data)
+
+    @staticmethod
+    def train(dictionary_dir_name: str, samples: List[bytes], dict_size: int = 1 << 17) -> int:
+        dictionary = zstandard.train_dictionary(dict_size, samples)
+        os.makedirs(dictionary_dir_name, exist_ok=True)
+        with open(os.path.join(dictionary_dir_name, f'{dictionary.dict_id()}.dict'), 'wb') as fp:
+            fp.write(dictionary.as_bytes())
+        current_path = os.path.join(dictionary_dir_name, 'current')
+        with open(f'{current_path}.tmp', 'w') as fp:
+            fp.write(str(dictionary.dict_id()))
+        os.replace(f'{current_path}.tmp', current_path)
+        return dictionary.dict_id()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from typing import Iterator, List, Optional, Tuple, Any, Union
+
+from bs4 import BeautifulSoup, UnicodeDammit
+
+Cell = Tuple[str, Optional[str]]
+
+
+class HtmlParserBackend:
+    name = 'html.parser'
+
+    def parse(self, content: bytes, encoding: Optional[str] = None) -> Any:
+        return BeautifulSoup(content if encoding is None else content.decode(encoding), 'html.parser')
+
+    def rows(self, document: BeautifulSoup) -> Iterator[List[Cell]]:
+        for tr in document.find_all('tr'):
+            cells = []
+            for td in tr.find_all('td'):
+                a = td.find('a')
+                cells.append((td.text, None if a is None else a.get('href')))
+            yield cells
+
+    def hrefs(self, document: BeautifulSoup) -> Iterator[str]:
+        for a in document.find_all('a'):
+            href = a.get('href')
+            if href is not None:
+                yield href
+
+    def selects(self, document: BeautifulSoup) -> Iterator[List[Tuple[Optional[str], str]]]:
+        for select in document.find_all('select'):
+            yield [(option.get('value'), option.text) for option in select.select('option')]
+
+
+class LxmlBackend:
+    name = 'lxml'
+    # BeautifulSoup leaves the content of these out of .text
+    _invisible_tags = {'script', 'style', 'template'}
+
+    def __init__(self):
+        import lxml.etree
+        import lxml.html
+        self._etree = lxml.etree
+        self._html = lxml.html
+
+    def parse(self, content: bytes, encoding: Optional[str] = None) -> Any:
+        if encoding is None:
+            markup = UnicodeDammit(content, is_html=True).unicode_markup
+        else:
+            markup = content.decode(encoding)
+        try:
+            return self._html.document_fromstring(markup)
+        except self._etree.ParserError:
+            return self._html.Element('html')
+
+    def _text(self, element) -> str:
+        parts = [element.text or '']
+        for child in element:
+            if isinstance(child.tag, str) and child.tag not in self._invisible_tags:
+                parts.append(self._text(child))
+            parts.append(child.tail or '')
+        return ''.join(parts)
+
+    def rows(self, document) -> Iterator[List[Cell]]:
+        for tr in document.iter('tr'):
+            cells = []
+            for td in tr.iter('td'):
+                a = next(td.iter('a'), None)
+                cells.append((self._text(td), None if a is None else a.get('href')))
+            yield cells
+
+    def hrefs(self, document) -> Iterator[str]:
+        for a in document.iter('a'):
+            href = a.get('href')
+            if href is not None:
+                yield href
+
+    def selects(self, document) -> Iterator[List[Tuple[Optional[str], str]]]:
+        for select in document.iter('select'):
+            yield [(option.get('value'), self._text(option)) for option in select.iter('option')]
+
+
+HtmlBackend = Union[HtmlParserBackend, LxmlBackend]
+
+
+def create_html_backend(name: str = 'auto') -> HtmlBackend:
+    if name == HtmlParserBackend.name:
+        return HtmlParserBackend()
+    if name == LxmlBackend.name:
+        return LxmlBackend()
+    assert name == 'auto', f'unknown html parser "{name}"'
+    try:
+        return LxmlBackend()
+    except ImportError:
+        return HtmlParserBackend()
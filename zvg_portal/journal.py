@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import datetime
+import os
+import pickle
+import sqlite3
+import time
+from typing import Optional, Set, Dict, List, Callable
+
+from zvg_portal.metrics import Metrics
+from zvg_portal.model import ScraperRun, ObjektEntry
+
+
+class RunJournal:
+    _sha256_fields = ['list_sha256s', 'entry_sha256s', 'anhang_sha256s']
+
+    def __init__(
+            self,
+            path: str,
+            checkpoint_interval: float = 30.0,
+            clock: Callable[[], float] = time.monotonic,
+    ):
+        self.path = path
+        self._checkpoint_interval = checkpoint_interval
+        self._clock = clock
+        self._last_checkpoint = clock()
+        self._offsets = {name: 0 for name in self._sha256_fields}
+        self._processed: List[ObjektEntry] = []
+        self._lists: Dict[str, str] = {}
+        self._resumed_lists: Set[str] = set()
+        self._connection = sqlite3.connect(path, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS run ('
+            'id TEXT PRIMARY KEY, '
+            'scraper_started TEXT NOT NULL, '
+            'scraped_entries INTEGER NOT NULL, '
+            'new_file_count INTEGER NOT NULL, '
+            'metrics BLOB)'
+        )
+        self._connection.execute('CREATE TABLE IF NOT EXISTS sha256s (field TEXT NOT NULL, digests BLOB NOT NULL)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS laender (land_short TEXT PRIMARY KEY)')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'land_short TEXT NOT NULL, '
+            'zvg_id INTEGER NOT NULL, '
+            'PRIMARY KEY (land_short, zvg_id))'
+        )
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS aktenzeichen ('
+            'land_short TEXT NOT NULL, '
+            'aktenzeichen TEXT NOT NULL, '
+            'PRIMARY KEY (land_short, aktenzeichen))'
+        )
+        self._connection.execute('CREATE TABLE IF NOT EXISTS lists (land_short TEXT PRIMARY KEY, sha256 TEXT NOT NULL)')
+
+    @staticmethod
+    def path_of(dir_name: str, run_id: str) -> str:
+        return os.path.join(dir_name, f'{run_id}.sqlite3')
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def remove(self) -> None:
+        self.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def begin(self, run: ScraperRun) -> None:
+        self._connection.execute(
+            'INSERT INTO run (id, scraper_started, scraped_entries, new_file_count) VALUES (?, ?, ?, ?)',
+            (run.id, run.scraper_started.isoformat(), run.scraped_entries, run.new_file_count)
+        )
+
+    def restore(self) -> Optional[ScraperRun]:
+        row = self._connection.execute(
+            'SELECT id, scraper_started, scraped_entries, new_file_count FROM run'
+        ).fetchone()
+        if row is None:
+            return None
+        run = ScraperRun(
+            id=row[0],
+            scraper_started=datetime.datetime.fromisoformat(row[1]),
+            scraped_entries=row[2],
+            new_file_count=row[3],
+        )
+        for name, digests in self._connection.execute('SELECT field, digests FROM sha256s ORDER BY rowid'):
+            getattr(run, name).extend_digests(digests)
+        for name in self._sha256_fields:
+            self._offsets[name] = len(getattr(run, name))
+        self._resumed_lists = set(self.processed_lists().values())
+        return run
+
+    def metrics(self) -> Optional[Metrics]:
+        row = self._connection.execute('SELECT metrics FROM run').fetchone()
+        return None if row is None or row[0] is None else pickle.loads(row[0])
+
+    def completed_laender(self) -> Set[str]:
+        return {row[0] for row in self._connection.execute('SELECT land_short FROM laender')}
+
+    def processed_zvg_ids(self) -> Dict[str, Set[int]]:
+        ret: Dict[str, Set[int]] = {}
+        for land_short, zvg_id in self._connection.execute('SELECT land_short, zvg_id FROM entries'):
+            ret.setdefault(land_short, set()).add(zvg_id)
+        return ret
+
+    def processed_aktenzeichen(self) -> Dict[str, Set[str]]:
+        ret: Dict[str, Set[str]] = {}
+        for land_short, aktenzeichen in self._connection.execute('SELECT land_short, aktenzeichen FROM aktenzeichen'):
+            ret.setdefault(land_short, set()).add(aktenzeichen)
+        return ret
+
+    def processed_lists(self) -> Dict[str, str]:
+        return dict(self._connection.execute('SELECT land_short, sha256 FROM lists'))
+
+    def resumes_list(self, sha256: str) -> bool:
+        if sha256 not in self._resumed_lists:
+            return False
+        self._resumed_lists.remove(sha256)
+        return True
+
+    def processed(self, entry: ObjektEntry) -> None:
+        self._lists[entry.land_short] = entry.raw_list_sha256
+        if entry.zvg_id is not None or entry.aktenzeichen:
+            self._processed.append(entry)
+
+    def due(self) -> bool:
+        return self._clock() - self._last_checkpoint >= self._checkpoint_interval
+
+    def checkpoint(
+            self,
+            run: ScraperRun,
+            metrics: Optional[Metrics] = None,
+            completed_land: Optional[str] = None,
+    ) -> None:
+        offsets = {name: len(getattr(run, name)) for name in self._sha256_fields}
+        self._connection.execute('BEGIN')
+        try:
+            for name in self._sha256_fields:
+                if offsets[name] > self._offsets[name]:
+                    self._connection.execute(
+                        'INSERT INTO sha256s (field, digests) VALUES (?, ?)',
+                        (name, getattr(run, name).digests(self._offsets[name]))
+                    )
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO entries (land_short, zvg_id) VALUES (?, ?)',
+                [(entry.land_short, entry.zvg_id) for entry in self._processed if entry.zvg_id is not None]
+            )
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO aktenzeichen (land_short, aktenzeichen) VALUES (?, ?)',
+                [(entry.land_short, entry.aktenzeichen) for entry in self._processed if entry.zvg_id is None]
+            )
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO lists (land_short, sha256) VALUES (?, ?)',
+                list(self._lists.items())
+            )
+            if completed_land is not None:
+                self._connection.execute('INSERT OR IGNORE INTO laender (land_short) VALUES (?)', (completed_land,))
+                for table in ('entries', 'aktenzeichen', 'lists'):
+                    self._connection.execute(f'DELETE FROM {table} WHERE land_short = ?', (completed_land,))
+            self._connection.execute(
+                'UPDATE run SET scraped_entries = ?, new_file_count = ?, metrics = ?',
+                (
+                    run.scraped_entries,
+                    run.new_file_count,
+                    None if metrics is None else pickle.dumps(metrics, pickle.HIGHEST_PROTOCOL),
+                )
+            )
+            self._connection.execute('COMMIT')
+        except BaseException:
+            self._connection.execute('ROLLBACK')
+            raise
+        self._offsets = offsets
+        self._processed = []
+        self._lists = {}
+        self._last_checkpoint = self._clock()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import bisect
+import contextlib
+import os
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Tuple, Iterator, Any, List
+
+Labels = Tuple[Tuple[str, str], ...]
+
+DESCRIPTIONS = {
+    'zvg_http_request_seconds': 'Duration of portal requests by call type, including downloading the body.',
+    'zvg_http_downloaded_bytes_total': 'Bytes downloaded from the portal by call type.',
+    'zvg_parse_seconds': 'Time spent parsing a list or detail page.',
+    'zvg_repository_store_seconds': 'Duration of storing a raw page or attachment.',
+    'zvg_repository_written_bytes_total': 'Bytes of new blobs written to the raw repository, before compression.',
+    'zvg_repository_stored_blobs_total': 'New blobs written to the raw repository.',
+    'zvg_repository_duplicates_total': 'Blobs that were already stored in the raw repository.',
+    'zvg_publish_seconds': 'Duration of publishing to nsqd by transport.',
+    'zvg_published_messages_total': 'Messages published to nsqd by topic.',
+}
+
+
+class Histogram:
+    buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other: 'Histogram') -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+
+    def quantile(self, q: float) -> float:
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = 0.0 if i == 0 else self.buckets[i - 1]
+                if i == len(self.buckets):
+                    return lower
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return 0.0
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def merge(self, other: 'Metrics') -> None:
+        with self._lock:
+            for key, value in other._counters.items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            for key, other_histogram in other._histograms.items():
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram()
+                histogram.merge(other_histogram)
+
+    def drain(self) -> 'Metrics':
+        drained = Metrics()
+        with self._lock:
+            drained._counters, self._counters = self._counters, {}
+            drained._histograms, self._histograms = self._histograms, {}
+        return drained
+
+    def __getstate__(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'counters': dict(self._counters), 'histograms': dict(self._histograms)}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self._lock = threading.Lock()
+        self._counters = state['counters']
+        self._histograms = state['histograms']
+
+    def summary(self) -> Dict[str, Any]:
+        ret = {}
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                ret[f'{name}{_format_labels(labels)}'] = value
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                ret[f'{name}{_format_labels(labels)}'] = {
+                    'count': histogram.count,
+                    'sum': round(histogram.sum, 6),
+                    'p50': round(histogram.quantile(0.5), 6),
+                    'p95': round(histogram.quantile(0.95), 6),
+                }
+        return ret
+
+    def to_prometheus(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, histogram.counts[:], histogram.count, histogram.sum)
+                                for key, histogram in self._histograms.items())
+        described = set()
+
+        def describe(name: str, metric_type: str) -> None:
+            if name in described:
+                return
+            described.add(name)
+            if name in DESCRIPTIONS:
+                lines.append(f'# HELP {name} {DESCRIPTIONS[name]}')
+            lines.append(f'# TYPE {name} {metric_type}')
+
+        for (name, labels), value in counters:
+            describe(name, 'counter')
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        for (name, labels), counts, count, total in histograms:
+            describe(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(Histogram.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", le),))} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(total)}')
+            lines.append(f'{name}_count{_format_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path: str) -> None:
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as fp:
+            fp.write(self.to_prometheus())
+        os.replace(f'{path}.tmp', path)
+
+
+REGISTRY = Metrics()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.metrics.to_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve_metrics(port: int, host: str = '0.0.0.0', metrics: Metrics = REGISTRY) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.metrics = metrics
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
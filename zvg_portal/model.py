@@ -1,19 +1,73 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import datetime
+import functools
 import hashlib
 import uuid
-from dataclasses import dataclass, field
-from typing import Optional, List
+from dataclasses import dataclass, field, fields
+from typing import Optional, List, Iterable, Iterator, Union, Callable, Dict, Any
 
 
 class Sha256Mixin:
-    @property
+    @functools.cached_property
     def sha256(self) -> str:
         return hashlib.sha256(self.content).hexdigest()
 
 
-@dataclass
+class Sha256Array:
+    __slots__ = ('_digests',)
+
+    def __init__(self, sha256s: Iterable[str] = ()):
+        self._digests = bytearray()
+        self.extend(sha256s)
+
+    def append(self, sha256: str) -> None:
+        self._digests += bytes.fromhex(sha256)
+
+    def extend(self, sha256s: Union['Sha256Array', Iterable[str]]) -> None:
+        if isinstance(sha256s, Sha256Array):
+            self._digests += sha256s._digests
+            return
+        for sha256 in sha256s:
+            self.append(sha256)
+
+    def extend_digests(self, digests: bytes) -> None:
+        assert len(digests) % 32 == 0
+        self._digests += digests
+
+    def digests(self, start: int = 0) -> bytes:
+        return bytes(self._digests[32 * start:])
+
+    def __len__(self) -> int:
+        return len(self._digests) // 32
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('Sha256Array index out of range')
+        return self._digests[32 * i:32 * (i + 1)].hex()
+
+    def __iter__(self) -> Iterator[str]:
+        for offset in range(0, len(self._digests), 32):
+            yield self._digests[offset:offset + 32].hex()
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Sha256Array):
+            return self._digests == other._digests
+        return list(self) == other
+
+    def __repr__(self) -> str:
+        return f'Sha256Array({list(self)!r})'
+
+    def __getstate__(self) -> bytes:
+        return bytes(self._digests)
+
+    def __setstate__(self, state: bytes) -> None:
+        self._digests = bytearray(state)
+
+
+@dataclass(slots=True)
 class Land:
     short: str
     name: str
@@ -25,8 +79,11 @@ class RawList(Sha256Mixin):
 
 
 @dataclass
-class RawAnhang(Sha256Mixin):
-    content: bytes
+class RawAnhang:
+    sha256: str
+    size: int
+    path: Optional[str] = None
+    is_new: bool = False
 
 
 @dataclass
@@ -35,18 +92,31 @@ class RawEntry(Sha256Mixin):
 
 
 @dataclass
+class RestoredEntry:
+    sha256: str
+
+
+@dataclass(slots=True)
 class ScraperRun:
     id: str = field(default_factory=lambda: str(uuid.uuid4()))
-    list_sha256s: List[str] = field(default_factory=list)
-    entry_sha256s: List[str] = field(default_factory=list)
-    anhang_sha256s: List[str] = field(default_factory=list)
+    list_sha256s: Sha256Array = field(default_factory=Sha256Array)
+    entry_sha256s: Sha256Array = field(default_factory=Sha256Array)
+    anhang_sha256s: Sha256Array = field(default_factory=Sha256Array)
     scraper_started: datetime.datetime = field(default_factory=datetime.datetime.now)
     scraper_finished: Optional[datetime.datetime] = None
     scraped_entries: int = 0
     new_file_count: int = 0
+    metrics: Dict[str, Any] = field(default_factory=dict)
 
+    def merge(self, other: 'ScraperRun') -> None:
+        self.list_sha256s.extend(other.list_sha256s)
+        self.entry_sha256s.extend(other.entry_sha256s)
+        self.anhang_sha256s.extend(other.anhang_sha256s)
+        self.scraped_entries += other.scraped_entries
+        self.new_file_count += other.new_file_count
 
-@dataclass
+
+@dataclass(slots=True)
 class Addresse:
     strasse: str
     plz: str
@@ -54,7 +124,7 @@ class Addresse:
     stadtteil: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class ObjektEntry:
     land_short: str
     raw_list_sha256: str
@@ -80,3 +150,58 @@ class ObjektEntry:
     @property
     def any(self) -> bool:
         return not all(e is None for e in [self.letzte_aktualisierung, self.aktenzeichen, self.zvg_id])
+
+
+def _lazy_detail(name: str) -> property:
+    slot = getattr(ObjektEntry, name)
+
+    def get(self: 'LazyObjektEntry'):
+        if self.details_loader is not None:
+            self.details_loader([self])
+        return slot.__get__(self)
+
+    def set(self: 'LazyObjektEntry', value) -> None:
+        slot.__set__(self, value)
+
+    return property(get, set)
+
+
+class LazyObjektEntry(ObjektEntry):
+    __slots__ = ('details_loader',)
+
+    raw_entry_sha256 = _lazy_detail('raw_entry_sha256')
+    anhang_sha256s = _lazy_detail('anhang_sha256s')
+    urls = _lazy_detail('urls')
+    grundbuch = _lazy_detail('grundbuch')
+    art_der_versteigerung = _lazy_detail('art_der_versteigerung')
+    ort_der_versteigerung = _lazy_detail('ort_der_versteigerung')
+    beschreibung = _lazy_detail('beschreibung')
+    informationen_zum_glaeubiger = _lazy_detail('informationen_zum_glaeubiger')
+
+    def __init__(self, *args, details_loader: Optional[Callable[[List['LazyObjektEntry']], object]] = None, **kwargs):
+        self.details_loader = details_loader
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    def of(
+            cls,
+            entry: ObjektEntry,
+            details_loader: Callable[[List['LazyObjektEntry']], object],
+    ) -> 'LazyObjektEntry':
+        return cls(details_loader=details_loader, **{f.name: getattr(entry, f.name) for f in fields(entry)})
+
+    @property
+    def details_loaded(self) -> bool:
+        return self.details_loader is None
+
+    def load_details(self) -> None:
+        if self.details_loader is not None:
+            self.details_loader([self])
+
+    def __repr__(self) -> str:
+        if self.details_loaded:
+            return super().__repr__()
+        return (
+            f'{type(self).__name__}(land_short={self.land_short!r}, zvg_id={self.zvg_id!r}, '
+            f'aktenzeichen={self.aktenzeichen!r}, details not loaded)'
+        )
@@ -1,11 +1,21 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import collections
 import json
+import queue
+import socket
+import ssl
+import struct
+import threading
+import time
 from dataclasses import dataclass
-from typing import Dict, Optional
+from typing import Dict, Optional, List, Union
 
 import requests
 
+from zvg_portal.metrics import REGISTRY
+from zvg_portal.profiling import stage
+
 
 @dataclass
 class ClientSideCertificate:
@@ -13,6 +23,10 @@ class ClientSideCertificate:
     key_path: str
 
 
+class NsqPublishError(Exception):
+    pass
+
+
 class Nsq:
     def __init__(self, nsqd_address: str, nsqd_write_port: int = 4151, cert: Optional[ClientSideCertificate] = None):
         self._nsqd_address = nsqd_address
@@ -28,8 +42,302 @@ class Nsq:
         self.publish_bytes(topic, message.encode('utf-8'))
 
     def publish_bytes(self, topic: str, message: bytes) -> None:
-        response = self._session.post(
-            F'http://{self._nsqd_address}:{self._nsqd_write_port}/pub?topic={topic}',
-            data=message
-        )
-        response.raise_for_status()
+        with REGISTRY.timer('zvg_publish_seconds', transport='http'), stage('publish'):
+            response = self._session.post(
+                F'http://{self._nsqd_address}:{self._nsqd_write_port}/pub?topic={topic}',
+                data=message
+            )
+            response.raise_for_status()
+        REGISTRY.inc('zvg_published_messages_total', topic=topic)
+
+    def publish_multiple_bytes(self, topic: str, messages: List[bytes]) -> None:
+        body = [struct.pack('>I', len(messages))]
+        for message in messages:
+            body.append(struct.pack('>I', len(message)))
+            body.append(message)
+        with REGISTRY.timer('zvg_publish_seconds', transport='http'), stage('publish'):
+            response = self._session.post(
+                F'http://{self._nsqd_address}:{self._nsqd_write_port}/mpub?topic={topic}&binary=true',
+                data=b''.join(body)
+            )
+            response.raise_for_status()
+        REGISTRY.inc('zvg_published_messages_total', len(messages), topic=topic)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class NsqTcp:
+    _frame_type_response = 0
+    _frame_type_error = 1
+
+    def __init__(
+            self,
+            nsqd_address: str,
+            nsqd_tcp_port: int = 4150,
+            cert: Optional[ClientSideCertificate] = None,
+            tls: bool = False,
+            max_in_flight: int = 100,
+            retries: int = 3,
+            backoff_factor: float = 0.3,
+            timeout: float = 10.0,
+            user_agent: Optional[str] = None,
+    ):
+        self._nsqd_address = nsqd_address
+        self._nsqd_tcp_port = nsqd_tcp_port
+        self._cert = cert
+        self._tls = tls or cert is not None
+        self._max_in_flight = max_in_flight
+        self._retries = retries
+        self._backoff_factor = backoff_factor
+        self._timeout = timeout
+        self._user_agent = user_agent
+        self._lock = threading.Lock()
+        self._socket: Optional[socket.socket] = None
+        self._received = bytearray()
+        # commands that were sent but not yet acknowledged, they are sent again after a reconnect
+        self._pending = collections.deque()
+
+    def publish_dict(self, topic: str, message: Dict) -> None:
+        return self.publish(topic, json.dumps(message))
+
+    def publish(self, topic: str, message: str) -> None:
+        self.publish_bytes(topic, message.encode('utf-8'))
+
+    def publish_bytes(self, topic: str, message: bytes) -> None:
+        with REGISTRY.timer('zvg_publish_seconds', transport='tcp'), stage('publish'):
+            self._submit(b'PUB ' + topic.encode('ascii') + b'\n' + struct.pack('>I', len(message)) + message)
+        REGISTRY.inc('zvg_published_messages_total', topic=topic)
+
+    def publish_multiple_bytes(self, topic: str, messages: List[bytes]) -> None:
+        body = [struct.pack('>I', len(messages))]
+        for message in messages:
+            body.append(struct.pack('>I', len(message)))
+            body.append(message)
+        body = b''.join(body)
+        with REGISTRY.timer('zvg_publish_seconds', transport='tcp'), stage('publish'):
+            self._submit(b'MPUB ' + topic.encode('ascii') + b'\n' + struct.pack('>I', len(body)) + body)
+        REGISTRY.inc('zvg_published_messages_total', len(messages), topic=topic)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._drain(0)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pending:
+                self._drain(0)
+            self._disconnect()
+
+    def _submit(self, command: bytes) -> None:
+        with self._lock:
+            self._pending.append(command)
+            if self._socket is None:
+                self._reconnect()
+            else:
+                try:
+                    self._socket.sendall(command)
+                except OSError:
+                    self._disconnect()
+                    self._reconnect()
+            if len(self._pending) >= self._max_in_flight:
+                self._drain(self._max_in_flight // 2)
+
+    def _drain(self, keep: int) -> None:
+        failures = 0
+        while len(self._pending) > keep:
+            try:
+                if self._socket is None:
+                    self._reconnect()
+                self._await_response()
+                failures = 0
+            except OSError as e:
+                self._disconnect()
+                failures += 1
+                if failures > self._retries:
+                    raise NsqPublishError(f'Lost connection to {self._nsqd_address}:{self._nsqd_tcp_port}') from e
+
+    def _reconnect(self) -> None:
+        attempt = 0
+        while True:
+            try:
+                self._connect()
+                return
+            except OSError as e:
+                self._disconnect()
+                if attempt >= self._retries:
+                    raise NsqPublishError(f'Cannot connect to {self._nsqd_address}:{self._nsqd_tcp_port}') from e
+            time.sleep(self._backoff_factor * (2 ** attempt))
+            attempt += 1
+
+    def _connect(self) -> None:
+        self._socket = socket.create_connection((self._nsqd_address, self._nsqd_tcp_port), self._timeout)
+        self._received = bytearray()
+        self._socket.sendall(b'  V2')
+        identify = json.dumps({
+            'client_id': socket.gethostname(),
+            'hostname': socket.getfqdn(),
+            'user_agent': self._user_agent,
+            'feature_negotiation': True,
+            'heartbeat_interval': -1,
+            'tls_v1': self._tls,
+        }).encode('utf-8')
+        self._socket.sendall(b'IDENTIFY\n' + struct.pack('>I', len(identify)) + identify)
+        data = self._read_response()
+        features = json.loads(data) if data.startswith(b'{') else {}
+        if self._tls:
+            if not features.get('tls_v1'):
+                raise NsqPublishError('nsqd does not support TLS')
+            context = ssl.create_default_context()
+            if self._cert is not None:
+                context.load_cert_chain(self._cert.crt_path, self._cert.key_path)
+            self._socket = context.wrap_socket(self._socket, server_hostname=self._nsqd_address)
+            self._read_response()
+        for command in self._pending:
+            self._socket.sendall(command)
+
+    def _disconnect(self) -> None:
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+        self._socket = None
+
+    def _receive_exactly(self, size: int) -> bytes:
+        while len(self._received) < size:
+            chunk = self._socket.recv(max(4096, size - len(self._received)))
+            if not chunk:
+                raise ConnectionResetError('nsqd closed the connection')
+            self._received.extend(chunk)
+        data = bytes(self._received[:size])
+        del self._received[:size]
+        return data
+
+    def _read_response(self) -> bytes:
+        while True:
+            size, frame_type = struct.unpack('>Ii', self._receive_exactly(8))
+            data = self._receive_exactly(size - 4)
+            if frame_type == self._frame_type_error:
+                raise NsqPublishError(data.decode('utf-8', errors='replace'))
+            if frame_type == self._frame_type_response and data == b'_heartbeat_':
+                self._socket.sendall(b'NOP\n')
+                continue
+            return data
+
+    def _await_response(self) -> None:
+        try:
+            self._read_response()
+        except NsqPublishError:
+            self._pending.popleft()
+            raise
+        self._pending.popleft()
+
+
+class BufferedNsq:
+    _flush = object()
+    _close = object()
+
+    def __init__(
+            self,
+            nsq: Union[Nsq, NsqTcp],
+            max_messages: int = 100,
+            max_bytes: int = 1 << 20,
+            flush_interval: float = 1.0,
+            max_pending: int = 10_000,
+    ):
+        self._nsq = nsq
+        self._max_messages = max_messages
+        self._max_bytes = max_bytes
+        self._flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='nsq-flusher', daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> 'BufferedNsq':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def publish_dict(self, topic: str, message: Dict) -> None:
+        return self.publish(topic, json.dumps(message))
+
+    def publish(self, topic: str, message: str) -> None:
+        self.publish_bytes(topic, message.encode('utf-8'))
+
+    def publish_bytes(self, topic: str, message: bytes) -> None:
+        self._put((topic, message))
+
+    def flush(self) -> None:
+        done = threading.Event()
+        self._put((self._flush, done))
+        while not done.wait(0.1):
+            self._raise_error()
+        self._raise_error()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._put((self._close, None))
+        self._thread.join()
+        self._closed = True
+        self._raise_error()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise NsqPublishError('Publishing to nsqd failed') from self._error
+
+    def _put(self, item) -> None:
+        assert not self._closed
+        # blocks while max_pending messages are waiting, but not forever if the flusher died
+        while True:
+            self._raise_error()
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _run(self) -> None:
+        buffers: Dict[str, List[bytes]] = {}
+        sizes: Dict[str, int] = {}
+
+        def send(topic: str) -> None:
+            messages = buffers.pop(topic)
+            sizes.pop(topic)
+            if len(messages) == 1:
+                self._nsq.publish_bytes(topic, messages[0])
+            else:
+                self._nsq.publish_multiple_bytes(topic, messages)
+
+        try:
+            deadline = time.monotonic() + self._flush_interval
+            while True:
+                try:
+                    topic, message = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    topic, message = None, None
+                if topic is None or topic is self._flush or topic is self._close:
+                    for buffered_topic in list(buffers.keys()):
+                        send(buffered_topic)
+                    deadline = time.monotonic() + self._flush_interval
+                    if topic is self._flush:
+                        message.set()
+                    if topic is self._close:
+                        return
+                    continue
+                buffers.setdefault(topic, []).append(message)
+                sizes[topic] = sizes.get(topic, 0) + len(message)
+                if len(buffers[topic]) >= self._max_messages or sizes[topic] >= self._max_bytes:
+                    send(topic)
+        except BaseException as e:
+            self._error = e
+
+
+Publisher = Union[Nsq, NsqTcp, BufferedNsq]
@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import datetime
-import locale
+import functools
 import re
-from typing import Optional
+from typing import Optional, Iterable, Dict, Tuple
 
 from zvg_portal.model import Addresse
 
@@ -28,37 +28,77 @@ class VerkehrswertParser:
 
 
 class AddressParser:
-    def __init__(self):
-        self._regexes = [
-            re.compile(
-                r'(?P<strasse>[äüöÄÜÖß (),a-zA-Z0-9-".]+), '
-                r'(?P<plz>\d{5}) '
-                r'(?P<ort>[äüöÄÜÖß a-zA-Z0-9-.]+), '
-                r'(?P<stadtteil>[äüöÄÜÖß a-zA-Z0-9-.]+)'
-            ),
-            re.compile(r'(?P<strasse>[äüöÄÜÖß (),a-zA-Z0-9-."]+), (?P<plz>\d{5}) (?P<ort>[äüöÄÜÖß a-zA-Z0-9-.]+)'),
-        ]
+    def __init__(self, cache_size: int = 1 << 16):
+        self._plz_regex = re.compile(r'(?:^|[,:])\s*(?P<plz>\d{5})\s+(?=\S)')
+        self._parse = functools.lru_cache(maxsize=cache_size)(self._parse_uncached)
 
-    def parse(self, s: str) -> Optional[Addresse]:
-        for r in self._regexes:
-            m = r.search(s)
-            if m:
-                ret = Addresse(
-                    strasse=m.group('strasse').strip(),
-                    plz=m.group('plz').strip(),
-                    ort=m.group('ort').strip(),
-                )
-                try:
-                    ret.stadtteil = m.group('stadtteil').strip()
-                except IndexError:
-                    pass
+    def _parse_uncached(self, s: str) -> Optional[Tuple[Optional[str], str, str, Optional[str]]]:
+        candidates = list(self._plz_regex.finditer(s))
+        if not candidates:
+            return None
+        m = candidates[-1]
+        strasse = s[:m.start('plz')].rsplit(':', 1)[-1].strip().rstrip(',').strip() or None
+        ort, _, rest = s[m.end():].partition(',')
+        stadtteil = rest.split(',', 1)[0].strip() or None
+        return strasse, m.group('plz'), ort.strip(), stadtteil
 
-                return ret
+    def parse(self, s: str) -> Optional[Addresse]:
+        parsed = self._parse(s)
+        if parsed is None:
+            return None
+        strasse, plz, ort, stadtteil = parsed
+        return Addresse(strasse=strasse, plz=plz, ort=ort, stadtteil=stadtteil)
 
 
 class VersteigerungsTerminParser:
-    def __init__(self):
-        locale.setlocale(locale.LC_ALL, 'de_DE')
+    _wochentage = ['montag', 'dienstag', 'mittwoch', 'donnerstag', 'freitag', 'samstag', 'sonntag']
+    _monate = {
+        'januar': 1,
+        'februar': 2,
+        'märz': 3,
+        'april': 4,
+        'mai': 5,
+        'juni': 6,
+        'juli': 7,
+        'august': 8,
+        'september': 9,
+        'oktober': 10,
+        'november': 11,
+        'dezember': 12,
+    }
+
+    def __init__(self, cache_size: int = 4096):
+        self._r = re.compile(
+            r'(?P<wochentag>\w+),\s+(?P<day>\d{1,2})\.\s+(?P<month>\w+)\s+(?P<year>-?\d{1,4}),\s+'
+            r'(?P<hour>\d{1,2}):(?P<minute>\d{1,2})\s+Uhr'
+        )
+        self.to_datetime = functools.lru_cache(maxsize=cache_size)(self._to_datetime)
+
+    def _to_datetime(self, s: str) -> Optional[datetime.datetime]:
+        m = self._r.fullmatch(s)
+        if m is None or m.group('wochentag').lower() not in self._wochentage:
+            raise ValueError(f'Termin {repr(s)} does not match "%A, %d. %B %Y, %H:%M Uhr"')
+        try:
+            month = self._monate[m.group('month').lower()]
+        except KeyError:
+            raise ValueError(f'Termin {repr(s)} has an unknown month')
+        year = int(m.group('year'), 10)
+        # the portal shows "30. November -1" for auctions without a date
+        if year < 1:
+            return None
+        return datetime.datetime(
+            year=year,
+            month=month,
+            day=int(m.group('day'), 10),
+            hour=int(m.group('hour'), 10),
+            minute=int(m.group('minute'), 10),
+        )
 
-    def to_datetime(self, s: str) -> Optional[datetime.datetime]:
-        return datetime.datetime.strptime(s, '%A, %d. %B %Y, %H:%M Uhr')
+    def to_datetimes(self, termine: Iterable[str]) -> Dict[str, Optional[datetime.datetime]]:
+        ret = {}
+        for s in set(termine):
+            try:
+                ret[s] = self.to_datetime(s)
+            except ValueError:
+                continue
+        return ret
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import cProfile
+import collections
+import contextlib
+import os
+import pstats
+import sys
+import threading
+from typing import Dict, List, Optional, Iterator, Tuple, Union
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005):
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._stages: Dict[int, List[str]] = {}
+        self._samples = collections.Counter()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name='SamplingProfiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def enter(self, stage: str) -> None:
+        with self._lock:
+            self._stages.setdefault(threading.get_ident(), []).append(stage)
+
+    def exit(self, stage: str) -> None:
+        thread_id = threading.get_ident()
+        with self._lock:
+            stages = self._stages[thread_id]
+            stages.pop()
+            if not stages:
+                del self._stages[thread_id]
+
+    @staticmethod
+    def _stack(frame) -> List[str]:
+        ret = []
+        while frame is not None:
+            code = frame.f_code
+            ret.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        ret.reverse()
+        return ret
+
+    def _sample(self) -> None:
+        frames = sys._current_frames()
+        with self._lock:
+            stages = {thread_id: stages[-1] for thread_id, stages in self._stages.items()}
+            for thread_id, stage in stages.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self._samples[';'.join([stage] + self._stack(frame))] += 1
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self._interval):
+            self._sample()
+
+    def drain(self) -> collections.Counter:
+        with self._lock:
+            samples, self._samples = self._samples, collections.Counter()
+        return samples
+
+    def merge(self, samples: collections.Counter) -> None:
+        with self._lock:
+            self._samples.update(samples)
+
+    def write(self, dir_name: str, run_id: str) -> List[str]:
+        path = os.path.join(dir_name, f'{run_id}.collapsed')
+        with open(path, 'w', encoding='utf-8') as fp:
+            for stack, count in sorted(self.drain().items()):
+                fp.write(f'{stack} {count}\n')
+        return [path]
+
+
+class _RawStats:
+    def __init__(self, stats: Dict):
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        pass
+
+
+class DeterministicProfiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active: Dict[int, List[Tuple[str, Optional[cProfile.Profile]]]] = {}
+        self._profiles: Dict[Tuple[int, str], cProfile.Profile] = {}
+        self._merged: Dict[str, List[Dict]] = collections.defaultdict(list)
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+    def enter(self, stage: str) -> None:
+        thread_id = threading.get_ident()
+        with self._lock:
+            active = self._active.setdefault(thread_id, [])
+            profile = self._profiles.setdefault((thread_id, stage), cProfile.Profile())
+        if active and active[-1][1] is not None:
+            active[-1][1].disable()
+        try:
+            profile.enable()
+        except ValueError:
+            # since Python 3.12 only one profiler can be active at a time, other threads' stages are skipped then
+            profile = None
+        active.append((stage, profile))
+
+    def exit(self, stage: str) -> None:
+        active = self._active[threading.get_ident()]
+        _, profile = active.pop()
+        if profile is not None:
+            profile.disable()
+        if active and active[-1][1] is not None:
+            try:
+                active[-1][1].enable()
+            except ValueError:
+                active[-1] = (active[-1][0], None)
+
+    def drain(self) -> Dict[str, List[Dict]]:
+        with self._lock:
+            active = {id(profile) for stages in self._active.values() for _, profile in stages}
+            profiles = [(key, profile) for key, profile in self._profiles.items() if id(profile) not in active]
+            for key, _ in profiles:
+                del self._profiles[key]
+            merged, self._merged = self._merged, collections.defaultdict(list)
+        for (_, stage), profile in profiles:
+            profile.create_stats()
+            merged[stage].append(profile.stats)
+        return dict(merged)
+
+    def merge(self, stats: Dict[str, List[Dict]]) -> None:
+        with self._lock:
+            for stage, stage_stats in stats.items():
+                self._merged[stage].extend(stage_stats)
+
+    def write(self, dir_name: str, run_id: str) -> List[str]:
+        paths = []
+        for stage, stage_stats in sorted(self.drain().items()):
+            path = os.path.join(dir_name, f'{run_id}.{stage}.pstats')
+            stats = pstats.Stats(_RawStats(stage_stats[0]))
+            for other in stage_stats[1:]:
+                stats.add(pstats.Stats(_RawStats(other)))
+            stats.dump_stats(path)
+            paths.append(path)
+        return paths
+
+
+Profiler = Union[SamplingProfiler, DeterministicProfiler]
+
+_profiler: Optional[Profiler] = None
+
+
+def start_profiler(mode: str, interval: float = 0.005) -> Profiler:
+    global _profiler
+    if mode == 'sampling':
+        _profiler = SamplingProfiler(interval)
+    elif mode == 'cprofile':
+        _profiler = DeterministicProfiler()
+    else:
+        raise NotImplementedError(f'Unknown profile mode: {mode}')
+    _profiler.start()
+    return _profiler
+
+
+def stop_profiler() -> Optional[Profiler]:
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+    profiler.enter(name)
+    try:
+        yield
+    finally:
+        profiler.exit(name)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+import math
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Optional, Callable, Dict, Set
+
+OVERLOAD_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def _wake(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float = 1.0, now: float = 0.0):
+        assert rate > 0 and burst >= 1
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = now
+
+    def take(self, now: float) -> float:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+
+@dataclass(slots=True)
+class LimiterStats:
+    requests: int = 0
+    overloaded: int = 0
+    timeouts: int = 0
+    decreases: int = 0
+    max_in_flight: int = 0
+    concurrency_limit: float = 0.0
+    max_concurrency_limit: float = 0.0
+    rate_limit: Optional[float] = None
+    min_rate_limit: Optional[float] = None
+    mean_latency: float = 0.0
+    effective_rate: float = 0.0
+
+
+class AdaptiveLimiter:
+    def __init__(
+            self,
+            max_concurrency: int = 8,
+            min_concurrency: int = 1,
+            max_rate: Optional[float] = None,
+            min_rate: float = 0.5,
+            latency_target: float = 2.0,
+            decrease_factor: float = 0.5,
+            clock: Callable[[], float] = time.monotonic,
+    ):
+        assert 1 <= min_concurrency <= max_concurrency
+        assert 0 < min_rate and (max_rate is None or min_rate <= max_rate)
+        assert 0 < decrease_factor < 1
+        self._max_concurrency = max_concurrency
+        self._min_concurrency = min_concurrency
+        self._max_rate = max_rate
+        self._min_rate = min_rate
+        self._latency_target = latency_target
+        self._decrease_factor = decrease_factor
+        self._clock = clock
+        self._condition = threading.Condition()
+        self._async_waiters: Set[asyncio.Future] = set()
+        self._limit = float(min_concurrency)
+        self._slow_start = True
+        self._in_flight = 0
+        self._started = clock()
+        self._last_decrease = -math.inf
+        self._bucket = None if max_rate is None else TokenBucket(max_rate, now=self._started)
+        self._stats = LimiterStats(concurrency_limit=self._limit, max_concurrency_limit=self._limit)
+
+    @property
+    def concurrency_limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def rate_limit(self) -> Optional[float]:
+        return None if self._bucket is None else self._bucket.rate
+
+    def _try_acquire(self, now: float) -> float:
+        if self._in_flight >= int(self._limit):
+            return math.inf
+        if self._bucket is not None:
+            wait = self._bucket.take(now)
+            if wait > 0:
+                return wait
+        self._in_flight += 1
+        self._stats.max_in_flight = max(self._stats.max_in_flight, self._in_flight)
+        return 0.0
+
+    def acquire(self) -> float:
+        with self._condition:
+            while True:
+                now = self._clock()
+                wait = self._try_acquire(now)
+                if wait == 0:
+                    return now
+                self._condition.wait(None if wait == math.inf else wait)
+
+    async def acquire_async(self) -> float:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                now = self._clock()
+                wait = self._try_acquire(now)
+                if wait == 0:
+                    return now
+                waiter = loop.create_future()
+                self._async_waiters.add(waiter)
+            try:
+                await asyncio.wait((waiter,), timeout=None if wait == math.inf else wait)
+            finally:
+                with self._condition:
+                    self._async_waiters.discard(waiter)
+
+    def release(self, started: float, overloaded: bool = False, timed_out: bool = False) -> None:
+        with self._condition:
+            now = self._clock()
+            latency = now - started
+            self._in_flight -= 1
+            self._stats.requests += 1
+            self._stats.overloaded += overloaded
+            self._stats.timeouts += timed_out
+            self._stats.mean_latency += (latency - self._stats.mean_latency) / self._stats.requests
+            if overloaded or timed_out or latency > self._latency_target:
+                self._decrease(started, now)
+            else:
+                self._increase()
+            self._stats.concurrency_limit = self._limit
+            self._stats.max_concurrency_limit = max(self._stats.max_concurrency_limit, self._limit)
+            self._condition.notify_all()
+            for waiter in self._async_waiters:
+                waiter.get_loop().call_soon_threadsafe(_wake, waiter)
+            self._async_waiters.clear()
+
+    def _decrease(self, started: float, now: float) -> None:
+        if started < self._last_decrease:
+            return
+        self._last_decrease = now
+        self._slow_start = False
+        self._stats.decreases += 1
+        if self._limit > self._min_concurrency:
+            self._limit = max(float(self._min_concurrency), self._limit * self._decrease_factor)
+            return
+        if self._bucket is None:
+            rate = self._min_concurrency / max(self._stats.mean_latency, 1e-3)
+            self._bucket = TokenBucket(rate, now=now)
+        self._bucket.rate = max(self._min_rate, self._bucket.rate * self._decrease_factor)
+        self._stats.min_rate_limit = min(self._bucket.rate, self._stats.min_rate_limit or math.inf)
+
+    def _increase(self) -> None:
+        if self._bucket is not None and (self._max_rate is None or self._bucket.rate < self._max_rate):
+            self._bucket.rate += 1 / self._bucket.rate
+            if self._max_rate is not None:
+                self._bucket.rate = min(self._max_rate, self._bucket.rate)
+            elif self._bucket.rate > self._max_concurrency / max(self._stats.mean_latency, 1e-3):
+                self._bucket = None
+            return
+        self._limit += 1 if self._slow_start else 1 / self._limit
+        self._limit = min(float(self._max_concurrency), self._limit)
+
+    def stats(self) -> LimiterStats:
+        with self._condition:
+            elapsed = self._clock() - self._started
+            return replace(
+                self._stats,
+                rate_limit=self.rate_limit,
+                effective_rate=self._stats.requests / elapsed if elapsed > 0 else 0.0,
+            )
+
+
+class HostLimiters:
+    def __init__(self, **limiter_kwargs):
+        self._limiter_kwargs = limiter_kwargs
+        self._limiters: Dict[str, AdaptiveLimiter] = {}
+        self._lock = threading.Lock()
+
+    def get(self, host: str) -> AdaptiveLimiter:
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = self._limiters[host] = AdaptiveLimiter(**self._limiter_kwargs)
+            return limiter
+
+    def stats(self) -> Dict[str, LimiterStats]:
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {host: limiter.stats() for host, limiter in limiters.items()}
@@ -1,35 +1,477 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import array
+import bisect
+import contextlib
+import fcntl
 import hashlib
+import heapq
+import io
 import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+from typing import Optional, Tuple, Dict, Iterator, BinaryIO, Union, Iterable, Set
 
+from zvg_portal.metrics import REGISTRY
+from zvg_portal.profiling import stage
+
+
+def _record_store(started: float, size: int, is_new: bool) -> None:
+    REGISTRY.observe('zvg_repository_store_seconds', time.perf_counter() - started)
+    if is_new:
+        REGISTRY.inc('zvg_repository_stored_blobs_total')
+        REGISTRY.inc('zvg_repository_written_bytes_total', size)
+    else:
+        REGISTRY.inc('zvg_repository_duplicates_total')
+
+
+class BlobWriter:
+    def __init__(self, tmp_dir: Optional[str]):
+        self._hash = hashlib.sha256()
+        self.size = 0
+        self._fp = None
+        self._tmp_path = None
+        if tmp_dir is not None:
+            fd, self._tmp_path = tempfile.mkstemp(dir=tmp_dir, prefix='.incoming.')
+            self._fp = os.fdopen(fd, 'wb')
+
+    def __enter__(self) -> 'BlobWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.abort()
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+    def write(self, chunk: bytes) -> None:
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        if self._fp is not None:
+            self._fp.write(chunk)
+
+    def close(self) -> Optional[str]:
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+        return self._tmp_path
+
+    def abort(self) -> None:
+        self.close()
+        if self._tmp_path is not None and os.path.exists(self._tmp_path):
+            os.unlink(self._tmp_path)
+        self._tmp_path = None
+
+
+class ExistenceIndex:
+    _prefix_struct = struct.Struct('<Q')
 
-class RawRepository:
     def __init__(self, dir_name: str):
+        self._index_path = os.path.join(dir_name, 'existence.idx')
+        self._log_path = os.path.join(dir_name, 'existence.log')
+        self._lock_path = os.path.join(dir_name, 'existence.lock')
+        self._lock = threading.Lock()
+        self._sorted: Optional[array.array] = None
+        self._recent: Set[int] = set()
+        self._log_fp = None
+
+    @staticmethod
+    def _prefix(sha256: str) -> int:
+        return int(sha256[0:16], 16)
+
+    def _read_sorted(self) -> array.array:
+        prefixes = array.array('Q')
+        if os.path.exists(self._index_path):
+            with open(self._index_path, 'rb') as fp:
+                prefixes.frombytes(fp.read())
+            if sys.byteorder == 'big':
+                prefixes.byteswap()
+        return prefixes
+
+    def _write_sorted(self, prefixes: Iterable[int]) -> None:
+        data = array.array('Q', prefixes)
+        if sys.byteorder == 'big':
+            data.byteswap()
+        tmp_path = f'{self._index_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as fp:
+            data.tofile(fp)
+        os.replace(tmp_path, self._index_path)
+
+    def _read_log(self) -> Set[int]:
+        if not os.path.exists(self._log_path):
+            return set()
+        with open(self._log_path, 'rb') as fp:
+            data = fp.read()
+        complete = len(data) - len(data) % self._prefix_struct.size
+        return {prefix for prefix, in self._prefix_struct.iter_unpack(data[:complete])}
+
+    def _load(self) -> None:
+        self._sorted = self._read_sorted()
+        self._recent = self._read_log()
+        if len(self._recent) > max(1 << 16, len(self._sorted) >> 3):
+            self._compact()
+
+    def _compact(self) -> None:
+        with open(self._lock_path, 'a') as lock_fp:
+            fcntl.flock(lock_fp, fcntl.LOCK_EX)
+            try:
+                # other processes may have compacted the same log since it was loaded
+                merged = array.array('Q')
+                for prefix in heapq.merge(self._read_sorted(), sorted(self._recent | self._read_log())):
+                    if not merged or merged[-1] != prefix:
+                        merged.append(prefix)
+                self._write_sorted(merged)
+                # appends racing with this unlink get lost, which only costs a later filesystem lookup
+                try:
+                    os.unlink(self._log_path)
+                except FileNotFoundError:
+                    pass
+            finally:
+                fcntl.flock(lock_fp, fcntl.LOCK_UN)
+        if self._log_fp is not None:
+            self._log_fp.close()
+            self._log_fp = None
+        self._sorted = merged
+        self._recent = set()
+
+    def __contains__(self, sha256: str) -> bool:
+        prefix = self._prefix(sha256)
+        with self._lock:
+            if self._sorted is None:
+                self._load()
+            if prefix in self._recent:
+                return True
+            i = bisect.bisect_left(self._sorted, prefix)
+            return i < len(self._sorted) and self._sorted[i] == prefix
+
+    def add(self, sha256: str) -> None:
+        prefix = self._prefix(sha256)
+        with self._lock:
+            if self._sorted is None:
+                self._load()
+            self._recent.add(prefix)
+            if self._log_fp is None:
+                self._log_fp = open(self._log_path, 'ab', buffering=0)
+            self._log_fp.write(self._prefix_struct.pack(prefix))
+
+    def rebuild(self, sha256s: Iterable[str]) -> int:
+        prefixes = sorted({self._prefix(sha256) for sha256 in sha256s})
+        with self._lock:
+            self._write_sorted(prefixes)
+            if os.path.exists(self._log_path):
+                os.unlink(self._log_path)
+            if self._log_fp is not None:
+                self._log_fp.close()
+                self._log_fp = None
+            self._sorted = None
+            self._recent = set()
+        return len(prefixes)
+
+
+class RawRepository:
+    def __init__(self, dir_name: str, compress: bool = False, existence_index: bool = False, compress_level: int = 3):
         assert dir_name
-        if not os.path.exists(dir_name):
-            os.mkdir(dir_name)
+        os.makedirs(dir_name, exist_ok=True)
         assert os.path.isdir(dir_name)
 
         self._dir_name = dir_name
+        self._tmp_dir_name = os.path.join(dir_name, '.incoming')
+        os.makedirs(self._tmp_dir_name, exist_ok=True)
+        self._compress = compress
+        self._compress_level = compress_level
+        self._compressor = None
+        self.existence_index = ExistenceIndex(dir_name) if existence_index else None
+
+    def _get_compressor(self):
+        if self._compressor is None:
+            from zvg_portal.compression import BlobCompressor
+            self._compressor = BlobCompressor(os.path.join(self._dir_name, 'zstd-dictionaries'), self._compress_level)
+        return self._compressor
+
+    def path(self, sha256: str) -> Optional[str]:
+        return os.path.join(self._dir_name, sha256[0:2], sha256[2:4], sha256[4:6], sha256)
+
+    def _exists(self, path: str, size: Optional[int] = None) -> Optional[bool]:
+        if not os.path.exists(path):
+            return False
+        size_in_bytes = os.stat(path).st_size
+        if not size_in_bytes:
+            return None
+        assert size is None or size_in_bytes == size
+        return True
+
+    def _is_stored(self, sha256: str, size: Optional[int] = None) -> bool:
+        if self.existence_index is not None and sha256 in self.existence_index:
+            return True
+        path = self.path(sha256)
+        stored = bool(self._exists(path, size) or self._exists(f'{path}.zst'))
+        if stored and self.existence_index is not None:
+            self.existence_index.add(sha256)
+        return stored
+
+    def store(self, content: bytes, sha256: Optional[str] = None) -> bool:
+        started = time.perf_counter()
+        with stage('store'):
+            is_new = self._store(content, sha256)
+        _record_store(started, len(content), is_new)
+        return is_new
+
+    def _store(self, content: bytes, sha256: Optional[str] = None) -> bool:
+        sha256 = sha256 or hashlib.sha256(content).hexdigest()
+        if self._is_stored(sha256, len(content)):
+            return False
+        with self.writer() as writer:
+            if self._compress:
+                writer.write(self._get_compressor().compress(content))
+                return self._publish(writer, sha256, f'{self.path(sha256)}.zst')
+            writer.write(content)
+            return self._publish(writer, sha256, self.path(sha256), len(content))
+
+    def writer(self) -> BlobWriter:
+        return BlobWriter(self._tmp_dir_name)
 
-    def store(self, content: bytes) -> bool:
-        sha256 = hashlib.sha256(content).hexdigest()
-        dir_name = os.path.join(self._dir_name, sha256[0:2])
-        if not os.path.exists(dir_name):
-            os.mkdir(dir_name)
-        dir_name = os.path.join(self._dir_name, sha256[0:2], sha256[2:4])
-        if not os.path.exists(dir_name):
-            os.mkdir(dir_name)
-        dir_name = os.path.join(self._dir_name, sha256[0:2], sha256[2:4], sha256[4:6])
-        if not os.path.exists(dir_name):
-            os.mkdir(dir_name)
-        path = os.path.join(dir_name, sha256)
+    def commit(self, writer: BlobWriter) -> Tuple[str, bool]:
+        started = time.perf_counter()
+        with stage('store'):
+            sha256, is_new = self._commit(writer)
+        _record_store(started, writer.size, is_new)
+        return sha256, is_new
+
+    def _commit(self, writer: BlobWriter) -> Tuple[str, bool]:
+        sha256 = writer.sha256
+        if (self.existence_index is not None and sha256 in self.existence_index) \
+                or self._exists(f'{self.path(sha256)}.zst'):
+            writer.abort()
+            return sha256, False
+        return sha256, self._publish(writer, sha256, self.path(sha256), writer.size)
+
+    def _publish(self, writer: BlobWriter, sha256: str, path: str, size: Optional[int] = None) -> bool:
+        is_new = self._move_into_place(writer, path, size)
+        if self.existence_index is not None:
+            self.existence_index.add(sha256)
+        return is_new
+
+    def _move_into_place(self, writer: BlobWriter, path: str, size: Optional[int] = None) -> bool:
+        tmp_path = writer.close()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        exists = self._exists(path, size)
+        try:
+            if exists:
+                return False
+            if exists is None:
+                os.replace(tmp_path, path)
+                return True
+            # several scraper processes may store the same blob at once: never expose a partially written file and
+            # let exactly one of them win, so that new_file_count stays exact
+            try:
+                os.link(tmp_path, path)
+            except FileExistsError:
+                return False
+            return True
+        finally:
+            writer.abort()
+
+    def get(self, sha256: str) -> bytes:
+        path = self.path(sha256)
         if os.path.exists(path):
-            size_in_bytes = os.stat(path).st_size
-            if size_in_bytes:
-                assert size_in_bytes == len(content)
+            with open(path, 'rb') as fp:
+                return fp.read()
+        with open(f'{path}.zst', 'rb') as fp:
+            return self._get_compressor().decompress(fp.read())
+
+    def find(self, sha256: str) -> Optional[bytes]:
+        try:
+            return self.get(sha256)
+        except FileNotFoundError:
+            return None
+
+    def __iter__(self) -> Iterator[str]:
+        for dir_path, dir_names, file_names in os.walk(self._dir_name):
+            dir_names[:] = sorted(name for name in dir_names if len(name) == 2)
+            if os.path.relpath(dir_path, self._dir_name).count(os.sep) != 2:
+                continue
+            for file_name in sorted(file_names):
+                if len(file_name) == 64:
+                    yield file_name
+                elif len(file_name) == 68 and file_name.endswith('.zst'):
+                    yield file_name[:64]
+
+
+class PackRepository:
+    _record = struct.Struct('<32sIQQ')
+    # the highest bit of a record's segment number marks zstd-compressed blobs
+    _compressed_flag = 1 << 31
+
+    def __init__(
+            self,
+            dir_name: str,
+            max_segment_size: int = 1 << 30,
+            compress: bool = False,
+            compress_level: int = 3,
+    ):
+        assert dir_name
+        self._dir_name = dir_name
+        self._compress = compress
+        self._compress_level = compress_level
+        self._compressor = None
+        self._pack_dir_name = os.path.join(dir_name, 'packs')
+        self._tmp_dir_name = os.path.join(dir_name, '.incoming')
+        os.makedirs(self._pack_dir_name, exist_ok=True)
+        os.makedirs(self._tmp_dir_name, exist_ok=True)
+
+        self._max_segment_size = max_segment_size
+        self._index_path = os.path.join(self._pack_dir_name, 'index.bin')
+        self._lock_path = os.path.join(self._pack_dir_name, 'lock')
+        self._lock = threading.Lock()
+        self._index: Dict[bytes, Tuple[int, int, int, bool]] = {}
+        self._index_size = 0
+        self._segment = 0
+        with self._lock:
+            self._refresh()
+
+    def _get_compressor(self):
+        if self._compressor is None:
+            from zvg_portal.compression import BlobCompressor
+            self._compressor = BlobCompressor(os.path.join(self._dir_name, 'zstd-dictionaries'), self._compress_level)
+        return self._compressor
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self._pack_dir_name, f'segment-{segment:06d}.pack')
+
+    def _refresh(self) -> None:
+        if not os.path.exists(self._index_path):
+            return
+        with open(self._index_path, 'rb') as fp:
+            fp.seek(self._index_size)
+            data = fp.read()
+        complete = len(data) - len(data) % self._record.size
+        for digest, segment, offset, length in self._record.iter_unpack(data[:complete]):
+            compressed = bool(segment & self._compressed_flag)
+            segment &= ~self._compressed_flag
+            self._index[digest] = (segment, offset, length, compressed)
+            self._segment = max(self._segment, segment)
+        self._index_size += complete
+
+    @contextlib.contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        with self._lock, open(self._lock_path, 'a') as lock_fp:
+            fcntl.flock(lock_fp, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                yield
+            finally:
+                fcntl.flock(lock_fp, fcntl.LOCK_UN)
+
+    def _append(self, digest: bytes, fp: BinaryIO, length: int, compressed: bool = False) -> None:
+        segment_path = self._segment_path(self._segment)
+        if os.path.exists(segment_path) and os.stat(segment_path).st_size + length > self._max_segment_size:
+            self._segment += 1
+            segment_path = self._segment_path(self._segment)
+        with open(segment_path, 'ab') as segment_fp:
+            offset = segment_fp.tell()
+            shutil.copyfileobj(fp, segment_fp)
+            segment_fp.flush()
+            os.fsync(segment_fp.fileno())
+        with open(self._index_path, 'ab') as index_fp:
+            # drop a record that was only partially written before a crash
+            index_fp.truncate(self._index_size)
+            flags = self._compressed_flag if compressed else 0
+            index_fp.write(self._record.pack(digest, self._segment | flags, offset, length))
+        self._index[digest] = (self._segment, offset, length, compressed)
+        self._index_size += self._record.size
+
+    def __contains__(self, sha256: str) -> bool:
+        digest = bytes.fromhex(sha256)
+        with self._lock:
+            if digest not in self._index:
+                self._refresh()
+            return digest in self._index
+
+    def path(self, sha256: str) -> Optional[str]:
+        return None
+
+    def store(self, content: bytes, sha256: Optional[str] = None) -> bool:
+        started = time.perf_counter()
+        with stage('store'):
+            is_new = self._store(content, sha256)
+        _record_store(started, len(content), is_new)
+        return is_new
+
+    def _store(self, content: bytes, sha256: Optional[str] = None) -> bool:
+        sha256 = sha256 or hashlib.sha256(content).hexdigest()
+        if sha256 in self:
+            return False
+        digest = bytes.fromhex(sha256)
+        data = self._get_compressor().compress(content) if self._compress else content
+        with self._exclusive():
+            if digest in self._index:
                 return False
-        with open(path, 'wb') as fp:
-            fp.write(content)
+            self._append(digest, io.BytesIO(data), len(data), self._compress)
         return True
+
+    def writer(self) -> BlobWriter:
+        return BlobWriter(self._tmp_dir_name)
+
+    def commit(self, writer: BlobWriter) -> Tuple[str, bool]:
+        started = time.perf_counter()
+        with stage('store'):
+            sha256, is_new = self._commit(writer)
+        _record_store(started, writer.size, is_new)
+        return sha256, is_new
+
+    def _commit(self, writer: BlobWriter) -> Tuple[str, bool]:
+        sha256 = writer.sha256
+        digest = bytes.fromhex(sha256)
+        tmp_path = writer.close()
+        try:
+            with self._exclusive():
+                if digest in self._index:
+                    return sha256, False
+                with open(tmp_path, 'rb') as fp:
+                    self._append(digest, fp, writer.size)
+            return sha256, True
+        finally:
+            writer.abort()
+
+    def get(self, sha256: str) -> bytes:
+        digest = bytes.fromhex(sha256)
+        with self._lock:
+            if digest not in self._index:
+                self._refresh()
+            segment, offset, length, compressed = self._index[digest]
+        with open(self._segment_path(segment), 'rb') as fp:
+            fp.seek(offset)
+            data = fp.read(length)
+        return self._get_compressor().decompress(data) if compressed else data
+
+    def find(self, sha256: str) -> Optional[bytes]:
+        try:
+            return self.get(sha256)
+        except KeyError:
+            return None
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            self._refresh()
+            return iter([digest.hex() for digest in self._index])
+
+
+Repository = Union[RawRepository, PackRepository]
+
+
+def open_repository(
+        dir_name: str,
+        storage: str = 'directory',
+        compress: bool = False,
+        existence_index: bool = False,
+) -> Repository:
+    if storage == 'directory':
+        return RawRepository(dir_name, compress=compress, existence_index=existence_index)
+    if storage == 'packfile':
+        return PackRepository(dir_name, compress=compress)
+    raise NotImplementedError(f'Unknown storage: {storage}')
@@ -1,17 +1,28 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import collections
 import datetime
 import logging
 import re
-from typing import Iterator, Dict, Union
+import sys
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Iterator, Dict, Union, List, Optional, Callable, Iterable, TypeVar, Tuple, Collection
 
 import requests
-from bs4 import BeautifulSoup
 
-from zvg_portal.model import Land, ObjektEntry, RawList, RawEntry, RawAnhang
+from zvg_portal.html_backend import create_html_backend
+from zvg_portal.metrics import REGISTRY
+from zvg_portal.model import Land, ObjektEntry, RawList, RawEntry, RawAnhang, LazyObjektEntry, RestoredEntry
 from zvg_portal.parser import VerkehrswertParser, VersteigerungsTerminParser, AddressParser
+from zvg_portal.profiling import stage
+from zvg_portal.rate_limiter import HostLimiters
+from zvg_portal.repository import Repository, BlobWriter
+from zvg_portal.state import StateIndex
 from zvg_portal.utils import CustomHTTPAdapter
 
+T = TypeVar('T')
+R = TypeVar('R')
+
 
 class Endpoints:
     def __init__(self, base_url: str):
@@ -21,38 +32,149 @@ class Endpoints:
         self.show_details = f'{base_url}/index.php?button=showZvg'
 
 
-class ZvgPortal:
-    def __init__(self, logger: logging.Logger, user_agent: str, base_url: str):
+class ZvgPortalBase:
+    def __init__(
+            self,
+            logger: logging.Logger,
+            base_url: str,
+            concurrency: int = 1,
+            state: Optional[StateIndex] = None,
+            incremental: bool = False,
+            refetch_attachments: bool = False,
+            raw_repository: Optional[Repository] = None,
+            html_parser: str = 'auto',
+    ):
+        assert concurrency >= 1
         self._logger = logger
-        self._session = requests.session()
-        self._session.mount('https://', CustomHTTPAdapter())
-        self._session.mount('http://', CustomHTTPAdapter())
-        self._session.headers = {'User-Agent': user_agent}
+        self._concurrency = concurrency
+        self._state = state
+        self._incremental = incremental
+        self._refetch_attachments = refetch_attachments
+        self._raw_repository = raw_repository
+        self._chunk_size = 1 << 16
+        self._html = create_html_backend(html_parser)
         self._base_url = base_url
         self.endpoints = Endpoints(base_url)
         self._zvg_id_regex = re.compile(r'zvg_id=(?P<zvg_id>\d{1,20})')
+        self._land_abk_regex = re.compile(rb'land_abk=(?P<land_abk>[a-z]{2})\b')
         self._aktenzeichen_regex_1 = re.compile(r'\d{4} K \d{4}/\d{4}')
         self._aktenzeichen_regex_2 = re.compile(r'K \d{4}/\d{4}')
         self._aktualisierung_regex = re.compile(
             r'letzte Aktualisierung (?P<day>\d{2})-(?P<month>\d{2})-(?P<year>\d{4}) (?P<hour>\d{2}):(?P<minute>\d{2})'
         )
         self._strip_tags_regex = re.compile('<[^<]+?>')
-        self._attachment_link = re.compile(r'\?button=showAnhang&land_abk=nw&file_id=\d+&zvg_id=+\d+')
+        self._attachment_link = re.compile(
+            r'\?button=showAnhang&land_abk=(?P<land_abk>nw)&file_id=(?P<file_id>\d+)&zvg_id=+(?P<zvg_id>\d+)'
+        )
         self._address_parser = AddressParser()
         self._verkehrswert_parser = VerkehrswertParser()
         self._versteigerungs_termin_parser = VersteigerungsTerminParser()
 
-    def get_laender(self) -> Iterator[Land]:
-        response = self._session.get(self.endpoints.form)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        for select in soup.findAll('select'):
+    @property
+    def referer(self) -> str:
+        return f'{self._base_url}/index.php?button=Suchen'
+
+    def _details_url(self, land: Land, entry: ObjektEntry) -> str:
+        return f'{self._base_url}/index.php?button=showZvg&zvg_id={entry.zvg_id}&land_abk={land.short}'
+
+    @staticmethod
+    def _list_params() -> Dict[str, str]:
+        return {'button': 'Suchen', 'all': '1'}
+
+    @staticmethod
+    def _list_data(land: Land, plz: str = '') -> Dict[str, str]:
+        return {
+            'ger_name': '-- Alle Amtsgerichte --',
+            'order_by': '2',
+            'land_abk': land.short,
+            'ger_id': '0',
+            'az1': '',
+            'az2': '',
+            'az3': '',
+            'az4': '',
+            'art': '',
+            'obj': '',
+            'str': '',
+            'hnr': '',
+            'plz': plz,
+            'ort': '',
+            'ortsteil': '',
+            'vtermin': '',
+            'btermin': '',
+        }
+
+    @staticmethod
+    def _is_valid_details_page(content: bytes) -> bool:
+        return content[0:10] == b'\n<!DOCTYPE'
+
+    def _land_short_of_list(self, content: bytes) -> Optional[str]:
+        match = self._land_abk_regex.search(content)
+        return None if match is None else match.group('land_abk').decode('ascii')
+
+    def _restore_unchanged(self, entry: ObjektEntry) -> bool:
+        if self._state is None or not self._incremental or not self._state.restore(entry):
+            return False
+        self._logger.debug(f'Skipping details of unchanged {entry.land_short}/{entry.zvg_id}.')
+        return True
+
+    @staticmethod
+    def _restored(entry: ObjektEntry) -> List[Union[RestoredEntry, RawAnhang]]:
+        ret: List[Union[RestoredEntry, RawAnhang]] = [RestoredEntry(sha256=entry.raw_entry_sha256)]
+        ret.extend(RawAnhang(sha256=sha256, size=0) for sha256 in entry.anhang_sha256s)
+        return ret
+
+    def _record_details(self, entry: ObjektEntry) -> None:
+        if self._state is not None:
+            self._state.record(entry)
+
+    def _blob_writer(self) -> BlobWriter:
+        return BlobWriter(None) if self._raw_repository is None else self._raw_repository.writer()
+
+    def _stored_attachment(self, writer: BlobWriter) -> RawAnhang:
+        if self._raw_repository is None:
+            return RawAnhang(sha256=writer.sha256, size=writer.size)
+        sha256, is_new = self._raw_repository.commit(writer)
+        return RawAnhang(sha256=sha256, size=writer.size, path=self._raw_repository.path(sha256), is_new=is_new)
+
+    def _attachment_key(self, href: str) -> Tuple[str, int, int]:
+        match = self._attachment_link.match(href)
+        return match.group('land_abk'), int(match.group('zvg_id'), 10), int(match.group('file_id'), 10)
+
+    def _attachments_to_fetch(self, attachment_hrefs: List[str]) -> List[str]:
+        if self._state is None or self._refetch_attachments:
+            return attachment_hrefs
+        return [href for href in attachment_hrefs if self._state.anhang_sha256(*self._attachment_key(href)) is None]
+
+    def _add_attachments(
+            self,
+            entry: ObjektEntry,
+            attachment_hrefs: List[str],
+            fetched: Dict[str, RawAnhang],
+    ) -> List[RawAnhang]:
+        ret = []
+        for href in attachment_hrefs:
+            if href in fetched:
+                raw_anhang = fetched[href]
+                if self._state is not None:
+                    self._state.record_anhang(*self._attachment_key(href), raw_anhang.sha256)
+                entry.anhang_sha256s.append(raw_anhang.sha256)
+                ret.append(raw_anhang)
+            else:
+                sha256 = self._state.anhang_sha256(*self._attachment_key(href))
+                if sha256 is not None:
+                    entry.anhang_sha256s.append(sha256)
+                    ret.append(RawAnhang(sha256=sha256, size=0))
+        return ret
+
+    def _parse_laender(self, content: bytes) -> Iterator[Land]:
+        for options in self._html.selects(self._html.parse(content)):
             correct_select = False
-            for option in select.select('option'):
+            for value, text in options:
                 if correct_select:
-                    yield Land(short=option['value'], name=option.text)
+                    if value is not None:
+                        yield Land(short=sys.intern(value), name=text)
                     continue
-                if 'Bundesland auswählen' in option.text:
+                if 'Bundesland auswählen' in text:
                     correct_select = True
             if correct_select:
                 break
@@ -60,35 +182,34 @@ class ZvgPortal:
     def _clean_value(self, s):
         return self._strip_tags_regex.sub('', s).strip('\n')
 
-    def _parse_html_table(self, soup: BeautifulSoup) -> Iterator[Dict[str, str]]:
+    def _parse_html_table(self, document) -> Iterator[Dict[str, str]]:
         current_row = {}
-        for tr in soup.findAll('tr'):
-            tds = tr.findAll('td')
-            if len(tds) < 2:
+        for cells in self._html.rows(document):
+            if len(cells) < 2:
                 continue
 
-            title = tds[0].text.strip().strip(':')
+            title = cells[0][0].strip().strip(':')
             if title == 'Aktenzeichen' and current_row:
                 yield current_row
                 current_row = {}
-            for td in tds:
-                a = td.find('a')
-                if a is None:
-                    continue
-                try:
-                    match = self._zvg_id_regex.search(a['href'])
-                except KeyError:
+            for _, href in cells:
+                if href is None:
                     continue
+                match = self._zvg_id_regex.search(href)
                 if match:
                     current_row['zvg_id'] = int(match.group('zvg_id'), 10)
 
-            current_row[title] = [td.text.strip() for td in tds[1:]]
+            current_row[title] = [text.strip() for text, _ in cells[1:]]
 
         if current_row:
             yield current_row
 
-    def _parse_details(self, entry: ObjektEntry, content: bytes) -> Iterator[Union[ObjektEntry, RawAnhang]]:
-        soup = BeautifulSoup(content.decode('latin1'), 'html.parser')
+    def _parse_details(self, entry: ObjektEntry, content: bytes) -> List[str]:
+        with REGISTRY.timer('zvg_parse_seconds', page='detail'), stage('detail_parse'):
+            return self._parse_details_page(entry, content)
+
+    def _parse_details_page(self, entry: ObjektEntry, content: bytes) -> List[str]:
+        document = self._html.parse(content, 'latin1')
         skip_startswith = [
             'index.php?button=',
             '?button=',
@@ -97,26 +218,16 @@ class ZvgPortal:
             'javascript:',
             '#',
         ]
-        for a in soup.find_all('a'):
-            try:
-                href = a['href']
-                if self._attachment_link.match(href):
-                    response = self._session.get(
-                        f'{self._base_url}/{href}',
-                        headers={'Referer': f'{self._base_url}/index.php?button=Suchen'}
-                    )
-                    response.raise_for_status()
-                    raw_anhang = RawAnhang(content=response.content)
-                    entry.anhang_sha256s.append(raw_anhang.sha256)
-                    yield raw_anhang
-                elif any(href.startswith(s) for s in skip_startswith):
-                    continue
-                else:
-                    entry.urls.append(href)
-            except KeyError:
+        attachment_hrefs = []
+        for href in self._html.hrefs(document):
+            if self._attachment_link.match(href):
+                attachment_hrefs.append(href)
+            elif any(href.startswith(s) for s in skip_startswith):
                 continue
+            else:
+                entry.urls.append(href)
 
-        table = next(self._parse_html_table(soup))
+        table = next(self._parse_html_table(document))
         if 'Grundbuch' in table:
             entry.grundbuch = table['Grundbuch'][0]
             del table['Grundbuch']
@@ -154,7 +265,7 @@ class ZvgPortal:
                 continue
             self._logger.debug(f'Unparsed title {repr(title)} with cells ({entry.aktenzeichen}): {cells}')
 
-        yield entry
+        return attachment_hrefs
 
     def _title_probably_aktenzeichen(self, title: str, entry: ObjektEntry) -> bool:
         cleaned_title = self._nbsps_to_spaces(title)
@@ -181,50 +292,51 @@ class ZvgPortal:
             s = s.replace('  ', ' ')
         return s
 
-    def list(self, land: Land, plz: str = '') -> Iterator[Union[RawList, RawEntry, ObjektEntry, RawAnhang]]:
-        params = {'button': 'Suchen', 'all': '1'}
+    def _find_aktenzeichen(self, td_contents: List[str]) -> Optional[str]:
+        aktenzeichen = None
+        for td_content in td_contents:
+            for aktenzeichen_regex in [self._aktenzeichen_regex_1, self._aktenzeichen_regex_2]:
+                match = aktenzeichen_regex.search(td_content)
+                if match is not None:
+                    aktenzeichen = match.group(0)
+                    break
+        return aktenzeichen
 
-        data = {
-            'ger_name': '-- Alle Amtsgerichte --',
-            'order_by': '2',
-            'land_abk': land.short,
-            'ger_id': '0',
-            'az1': '',
-            'az2': '',
-            'az3': '',
-            'az4': '',
-            'art': '',
-            'obj': '',
-            'str': '',
-            'hnr': '',
-            'plz': plz,
-            'ort': '',
-            'ortsteil': '',
-            'vtermin': '',
-            'btermin': '',
-        }
+    def parse_list(self, land: Land, raw_list: RawList) -> List[ObjektEntry]:
+        with REGISTRY.timer('zvg_parse_seconds', page='list'), stage('list_parse'):
+            return list(self._parse_list_page(land, raw_list))
 
-        response = requests.post(self.endpoints.index, params=params, data=data)
-        response.raise_for_status()
-        last_raw_list = RawList(content=response.content)
-        yield last_raw_list
+    def _entries_to_fetch(
+            self,
+            land: Land,
+            raw_list: RawList,
+            skip_zvg_ids: Collection[int],
+            skip_aktenzeichen: Collection[str] = (),
+    ) -> List[ObjektEntry]:
+        entries = self.parse_list(land, raw_list)
+        if not skip_zvg_ids and not skip_aktenzeichen:
+            return entries
+        return [
+            entry for entry in entries
+            if entry.zvg_id not in skip_zvg_ids
+            and (entry.zvg_id is not None or entry.aktenzeichen not in skip_aktenzeichen)
+        ]
 
-        soup = BeautifulSoup(response.content.decode('latin1'), 'html.parser')
-        table_rows = list(self._parse_html_table(soup))
+    def _parse_list_page(self, land: Land, raw_list: RawList) -> Iterator[ObjektEntry]:
+        document = self._html.parse(raw_list.content, 'latin1')
+        table_rows = list(self._parse_html_table(document))
         self._logger.info(f'Found {len(table_rows)} rows for "{land.name}".')
+        termine = self._versteigerungs_termin_parser.to_datetimes(
+            ' '.join(rows['Termin']) for rows in table_rows if 'Termin' in rows.keys()
+        )
         for rows in table_rows:
-            entry = ObjektEntry(land_short=land.short, raw_list_sha256=last_raw_list.sha256)
+            entry = ObjektEntry(land_short=sys.intern(land.short), raw_list_sha256=raw_list.sha256)
             if 'zvg_id' in rows.keys():
                 entry.zvg_id = rows['zvg_id']
 
-            for td_content in rows.get('Aktenzeichen', []):
-                for aktenzeichen_regex in [self._aktenzeichen_regex_1, self._aktenzeichen_regex_2]:
-                    match = aktenzeichen_regex.search(td_content)
-                    if match is not None:
-                        entry.aktenzeichen = match.group(0)
-                        break
+            entry.aktenzeichen = self._find_aktenzeichen(rows.get('Aktenzeichen', []))
             if 'Amtsgericht' in rows.keys():
-                entry.amtsgericht = ' '.join(rows['Amtsgericht'])
+                entry.amtsgericht = sys.intern(' '.join(rows['Amtsgericht']))
             if 'Objekt/Lage' in rows.keys():
                 entry.objekt_lage = self._remove_duplicate_spaces(' '.join(rows['Objekt/Lage']))
                 entry.adresse = self._address_parser.parse(entry.objekt_lage)
@@ -236,11 +348,10 @@ class ZvgPortal:
                 entry.termin_as_str = ' '.join(rows['Termin'])
                 if 'wurde aufgehoben' in entry.termin_as_str:
                     entry.wurde_aufgehoben = True
+                elif entry.termin_as_str in termine:
+                    entry.termin_as_date = termine[entry.termin_as_str]
                 else:
-                    try:
-                        entry.termin_as_date = self._versteigerungs_termin_parser.to_datetime(entry.termin_as_str)
-                    except ValueError:
-                        self._logger.error(f'Cannot parse date {entry.termin_as_str}.')
+                    self._logger.error(f'Cannot parse date {entry.termin_as_str}.')
 
             for key, tds in rows.items():
                 for td_content in tds if isinstance(tds, list) else []:
@@ -258,22 +369,167 @@ class ZvgPortal:
             if not entry.any:
                 continue
 
-            if entry.zvg_id:
-                url = f'{self._base_url}/index.php?button=showZvg&zvg_id={entry.zvg_id}&land_abk={land.short}'
-                response = requests.get(url, headers={'Referer': f'{self._base_url}/index.php?button=Suchen'})
+            yield entry
+
+
+class ZvgPortal(ZvgPortalBase):
+    def __init__(
+            self,
+            logger: logging.Logger,
+            user_agent: str,
+            base_url: str,
+            concurrency: int = 1,
+            state: Optional[StateIndex] = None,
+            incremental: bool = False,
+            refetch_attachments: bool = False,
+            raw_repository: Optional[Repository] = None,
+            html_parser: str = 'auto',
+            limiters: Optional[HostLimiters] = None,
+    ):
+        super().__init__(
+            logger, base_url, concurrency, state, incremental, refetch_attachments, raw_repository, html_parser
+        )
+        self.limiters = limiters
+        self._session = requests.session()
+        self._session.mount('https://', CustomHTTPAdapter(pool_maxsize=2 * concurrency, limiters=limiters))
+        self._session.mount('http://', CustomHTTPAdapter(pool_maxsize=2 * concurrency, limiters=limiters))
+        self._session.headers = {'User-Agent': user_agent}
+
+    def get_laender(self) -> Iterator[Land]:
+        response = self._session.get(self.endpoints.form)
+        response.raise_for_status()
+        yield from self._parse_laender(response.content)
+
+    def _ordered_map(self, executor: Optional[Executor], fn: Callable[[T], R], items: Iterable[T]) -> Iterator[R]:
+        if executor is None:
+            for item in items:
+                yield fn(item)
+            return
+        pending = collections.deque()
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= 2 * self._concurrency:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def _fetch_attachment(self, href: str) -> RawAnhang:
+        url = f'{self._base_url}/{href}'
+        with self._blob_writer() as writer:
+            with REGISTRY.timer('zvg_http_request_seconds', call='attachment'), stage('attachment_fetch'), \
+                    self._session.get(url, headers={'Referer': self.referer}, stream=True) as response:
                 response.raise_for_status()
-                last_raw_entry = RawEntry(content=response.content)
-                entry.raw_entry_sha256 = last_raw_entry.sha256
-                yield last_raw_entry
-                if response.content[0:10] == b'\n<!DOCTYPE':
-                    for new_entry in self._parse_details(entry, response.content):
-                        if isinstance(new_entry, ObjektEntry):
-                            entry = new_entry
-                        elif isinstance(new_entry, RawAnhang):
-                            yield new_entry
-                        else:
-                            raise NotImplementedError
-                else:
-                    self._logger.error(f'Response not valid {entry}, could not : {response.content}')
+                for chunk in response.iter_content(self._chunk_size):
+                    writer.write(chunk)
+            REGISTRY.inc('zvg_http_downloaded_bytes_total', writer.size, call='attachment')
+            return self._stored_attachment(writer)
 
-            yield entry
+    def _fetch_details(
+            self,
+            land: Land,
+            entry: ObjektEntry,
+            attachment_executor: Optional[Executor] = None,
+    ) -> List[Union[RawEntry, RestoredEntry, RawAnhang, ObjektEntry]]:
+        ret = []
+        if entry.zvg_id and self._restore_unchanged(entry):
+            ret.extend(self._restored(entry))
+        elif entry.zvg_id:
+            with REGISTRY.timer('zvg_http_request_seconds', call='detail'), stage('detail_fetch'):
+                response = self._session.get(self._details_url(land, entry), headers={'Referer': self.referer})
+            response.raise_for_status()
+            REGISTRY.inc('zvg_http_downloaded_bytes_total', len(response.content), call='detail')
+            last_raw_entry = RawEntry(content=response.content)
+            entry.raw_entry_sha256 = last_raw_entry.sha256
+            ret.append(last_raw_entry)
+            if self._is_valid_details_page(response.content):
+                attachment_hrefs = self._parse_details(entry, response.content)
+                missing_hrefs = self._attachments_to_fetch(attachment_hrefs)
+                fetched = self._ordered_map(attachment_executor, self._fetch_attachment, missing_hrefs)
+                ret.extend(self._add_attachments(entry, attachment_hrefs, dict(zip(missing_hrefs, fetched))))
+                self._record_details(entry)
+            else:
+                self._logger.error(f'Response not valid {entry}, could not : {response.content}')
+
+        ret.append(entry)
+        return ret
+
+    def fetch_list(self, land: Land, plz: str = '') -> RawList:
+        with REGISTRY.timer('zvg_http_request_seconds', call='list'), stage('list_fetch'):
+            response = self._session.post(
+                self.endpoints.index,
+                params=self._list_params(),
+                data=self._list_data(land, plz),
+            )
+        response.raise_for_status()
+        REGISTRY.inc('zvg_http_downloaded_bytes_total', len(response.content), call='list')
+        return RawList(content=response.content)
+
+    def list(
+            self,
+            land: Land,
+            plz: str = '',
+            raw_list: Optional[RawList] = None,
+            skip_zvg_ids: Collection[int] = (),
+            skip_aktenzeichen: Collection[str] = (),
+    ) -> Iterator[Union[RawList, RawEntry, RestoredEntry, ObjektEntry, RawAnhang]]:
+        last_raw_list = self.fetch_list(land, plz) if raw_list is None else raw_list
+        yield last_raw_list
+
+        entries = self._entries_to_fetch(land, last_raw_list, skip_zvg_ids, skip_aktenzeichen)
+        if self._concurrency == 1:
+            for entry in entries:
+                yield from self._fetch_details(land, entry)
+            return
+        with ThreadPoolExecutor(self._concurrency) as detail_executor, \
+                ThreadPoolExecutor(self._concurrency) as attachment_executor:
+            for fetched in self._ordered_map(
+                    detail_executor,
+                    lambda e: self._fetch_details(land, e, attachment_executor),
+                    entries
+            ):
+                yield from fetched
+
+    def list_lazy(
+            self,
+            land: Land,
+            plz: str = '',
+            raw_list: Optional[RawList] = None,
+    ) -> Iterator[Union[RawList, LazyObjektEntry]]:
+        last_raw_list = self.fetch_list(land, plz) if raw_list is None else raw_list
+        yield last_raw_list
+        for entry in self.parse_list(land, last_raw_list):
+            yield LazyObjektEntry.of(entry, self.load_details)
+
+    def _load_details_of(
+            self,
+            entry: LazyObjektEntry,
+            attachment_executor: Optional[Executor] = None,
+    ) -> List[Union[RawEntry, RestoredEntry, RawAnhang]]:
+        details_loader, entry.details_loader = entry.details_loader, None
+        try:
+            land = Land(short=entry.land_short, name=entry.land_short)
+            fetched = self._fetch_details(land, entry, attachment_executor)
+        except BaseException:
+            entry.urls = []
+            entry.anhang_sha256s = []
+            entry.details_loader = details_loader
+            raise
+        for raw in fetched:
+            if isinstance(raw, RawEntry) and self._raw_repository is not None:
+                self._raw_repository.store(raw.content, raw.sha256)
+        return fetched[:-1]
+
+    def load_details(self, entries: Iterable[LazyObjektEntry]) -> List[Union[RawEntry, RestoredEntry, RawAnhang]]:
+        pending = [entry for entry in entries if not entry.details_loaded]
+        if self._concurrency == 1 or len(pending) <= 1:
+            return [raw for entry in pending for raw in self._load_details_of(entry)]
+        ret = []
+        with ThreadPoolExecutor(self._concurrency) as detail_executor, \
+                ThreadPoolExecutor(self._concurrency) as attachment_executor:
+            for fetched in self._ordered_map(
+                    detail_executor,
+                    lambda e: self._load_details_of(e, attachment_executor),
+                    pending
+            ):
+                ret.extend(fetched)
+        return ret
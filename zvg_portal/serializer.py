@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import datetime
+import hashlib
+import json
+from dataclasses import fields, is_dataclass
+from typing import Any, Optional
+
+from zvg_portal.model import ObjektEntry
+from zvg_portal.utils import CustomEncoder
+
+_encoder = CustomEncoder()
+
+
+def plain(value: Any) -> Any:
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [plain(item) for item in value]
+    if isinstance(value, dict):
+        return {key: plain(item) for key, item in value.items()}
+    if is_dataclass(value) and not isinstance(value, type):
+        return {field.name: plain(getattr(value, field.name)) for field in fields(value)}
+    return plain(_encoder.default(value))
+
+
+def objekt_message(entry: ObjektEntry, inserted_at: Optional[datetime.datetime] = None) -> str:
+    data = plain(entry)
+    dumped_data = json.dumps(data, sort_keys=True)
+    data['inserted_at'] = (inserted_at or datetime.datetime.utcnow()).isoformat()
+    data['_key'] = hashlib.sha256(dumped_data.encode('utf-8')).hexdigest()[0:12]
+    return json.dumps(data, sort_keys=True)
+
+
+def objekt_id(entry: ObjektEntry) -> str:
+    return hashlib.sha256(json.dumps(plain(entry), indent=0, sort_keys=True).encode('utf-8')).hexdigest()[:8]
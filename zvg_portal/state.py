@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import json
+import sqlite3
+import threading
+from typing import Optional, Iterator, Tuple
+
+from zvg_portal.model import ObjektEntry
+
+
+class StateIndex:
+    _detail_fields = [
+        'urls',
+        'anhang_sha256s',
+        'grundbuch',
+        'art_der_versteigerung',
+        'ort_der_versteigerung',
+        'beschreibung',
+        'informationen_zum_glaeubiger',
+    ]
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS objekte ('
+            'land_short TEXT NOT NULL, '
+            'zvg_id INTEGER NOT NULL, '
+            'letzte_aktualisierung TEXT NOT NULL, '
+            'raw_entry_sha256 TEXT NOT NULL, '
+            'details TEXT NOT NULL, '
+            'PRIMARY KEY (land_short, zvg_id))'
+        )
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS anhaenge ('
+            'land_abk TEXT NOT NULL, '
+            'zvg_id INTEGER NOT NULL, '
+            'file_id INTEGER NOT NULL, '
+            'sha256 TEXT NOT NULL, '
+            'PRIMARY KEY (land_abk, zvg_id, file_id))'
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def restore(self, entry: ObjektEntry) -> bool:
+        if entry.zvg_id is None or entry.letzte_aktualisierung is None:
+            return False
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT raw_entry_sha256, details FROM objekte '
+                'WHERE land_short = ? AND zvg_id = ? AND letzte_aktualisierung = ?',
+                (entry.land_short, entry.zvg_id, entry.letzte_aktualisierung.isoformat())
+            ).fetchone()
+        if row is None:
+            return False
+        entry.raw_entry_sha256 = row[0]
+        for key, value in json.loads(row[1]).items():
+            setattr(entry, key, value)
+        return True
+
+    def raw_entry_sha256(self, entry: ObjektEntry) -> Optional[str]:
+        if entry.zvg_id is None or entry.letzte_aktualisierung is None:
+            return None
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT raw_entry_sha256 FROM objekte '
+                'WHERE land_short = ? AND zvg_id = ? AND letzte_aktualisierung = ?',
+                (entry.land_short, entry.zvg_id, entry.letzte_aktualisierung.isoformat())
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def raw_entry_sha256s(self) -> Iterator[Tuple[str, int, str]]:
+        with self._lock:
+            rows = self._connection.execute('SELECT land_short, zvg_id, raw_entry_sha256 FROM objekte').fetchall()
+        yield from rows
+
+    def record(self, entry: ObjektEntry) -> None:
+        if entry.zvg_id is None or entry.letzte_aktualisierung is None or entry.raw_entry_sha256 is None:
+            return
+        details = {key: getattr(entry, key) for key in self._detail_fields}
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO objekte VALUES (?, ?, ?, ?, ?)',
+                (
+                    entry.land_short,
+                    entry.zvg_id,
+                    entry.letzte_aktualisierung.isoformat(),
+                    entry.raw_entry_sha256,
+                    json.dumps(details, sort_keys=True),
+                )
+            )
+
+    def anhang_sha256(self, land_abk: str, zvg_id: int, file_id: int) -> Optional[str]:
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT sha256 FROM anhaenge WHERE land_abk = ? AND zvg_id = ? AND file_id = ?',
+                (land_abk, zvg_id, file_id)
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def record_anhang(self, land_abk: str, zvg_id: int, file_id: int, sha256: str) -> None:
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO anhaenge VALUES (?, ?, ?, ?)',
+                (land_abk, zvg_id, file_id, sha256)
+            )
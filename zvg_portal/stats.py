@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import array
+import statistics
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from zvg_portal.model import ObjektEntry
+
+
+def format_cents(cents: int) -> str:
+    return f'{cents // 100},{cents % 100:02d} €'
+
+
+@dataclass(slots=True)
+class VerkehrswertStats:
+    count: int = 0
+    valued: int = 0
+    total_cents: int = 0
+    cheapest: Optional[ObjektEntry] = None
+    most_expensive: Optional[ObjektEntry] = None
+    values: Optional[array.array] = None
+
+    def add(self, entry: ObjektEntry) -> None:
+        self.count += 1
+        cents = entry.verkehrswert_in_cent
+        if not cents:
+            return
+        self.valued += 1
+        self.total_cents += cents
+        if self.cheapest is None or cents < self.cheapest.verkehrswert_in_cent:
+            self.cheapest = entry
+        if self.most_expensive is None or cents >= self.most_expensive.verkehrswert_in_cent:
+            self.most_expensive = entry
+        if self.values is not None:
+            self.values.append(cents)
+
+    def quantiles(self, n: int) -> List[int]:
+        if self.values is None or len(self.values) < 2:
+            return []
+        return [round(q) for q in statistics.quantiles(self.values, n=n, method='inclusive')]
+
+    def summary(self, quantiles: int = 0) -> str:
+        ret = f'Verkehrswertsumme: {format_cents(self.total_cents)}'
+        if self.valued:
+            ret += (
+                f', Minimum: {format_cents(self.cheapest.verkehrswert_in_cent)}'
+                f', Maximum: {format_cents(self.most_expensive.verkehrswert_in_cent)}'
+            )
+        if quantiles > 1 and self.valued > 1:
+            ret += f', {quantiles}-Quantile: ' + ' / '.join(format_cents(q) for q in self.quantiles(quantiles))
+        return ret
+
+
+@dataclass
+class ListStats:
+    quantiles: int = 0
+    by_land: Dict[str, VerkehrswertStats] = field(default_factory=dict)
+    by_amtsgericht: Dict[str, VerkehrswertStats] = field(default_factory=dict)
+
+    def _group(self, groups: Dict[str, VerkehrswertStats], key: str) -> VerkehrswertStats:
+        stats = groups.get(key)
+        if stats is None:
+            stats = groups[key] = VerkehrswertStats(values=array.array('q') if self.quantiles > 1 else None)
+        return stats
+
+    def add(self, entry: ObjektEntry) -> None:
+        self._group(self.by_land, entry.land_short).add(entry)
+        if entry.amtsgericht is not None:
+            self._group(self.by_amtsgericht, entry.amtsgericht).add(entry)
+
+    def extend(self, entries: Iterable[ObjektEntry]) -> None:
+        for entry in entries:
+            self.add(entry)
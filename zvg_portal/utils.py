@@ -1,16 +1,18 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import datetime
-import hashlib
 import json
 import logging
 from dataclasses import asdict, is_dataclass
 from typing import Optional, Any
+from urllib.parse import urlsplit
 
 import requests.adapters
 from urllib3 import Retry
+from urllib3.exceptions import ConnectTimeoutError, ReadTimeoutError
 
-from zvg_portal.model import ObjektEntry
+from zvg_portal.model import ObjektEntry, Sha256Array
+from zvg_portal.rate_limiter import HostLimiters, OVERLOAD_STATUSES
 
 
 class ConsoleHandler(logging.Handler):
@@ -20,6 +22,8 @@ class ConsoleHandler(logging.Handler):
 
 class CustomEncoder(json.JSONEncoder):
     def default(self, obj: Any) -> Any:
+        if isinstance(obj, Sha256Array):
+            return list(obj)
         if is_dataclass(obj):
             return asdict(obj)
         if isinstance(obj, (datetime.date, datetime.datetime)):
@@ -32,10 +36,12 @@ class CustomHTTPAdapter(requests.adapters.HTTPAdapter):
             fixed_timeout: int = 5,
             retries: int = 3,
             backoff_factor: float = 0.3,
-            status_forcelist=(500, 502, 504),
-            pool_maxsize: Optional[int] = None
+            status_forcelist=(429, 500, 502, 503, 504),
+            pool_maxsize: Optional[int] = None,
+            limiters: Optional[HostLimiters] = None,
     ):
         self._fixed_timeout = fixed_timeout
+        self._limiters = limiters
         retry_strategy = Retry(
             total=retries,
             read=retries,
@@ -48,15 +54,37 @@ class CustomHTTPAdapter(requests.adapters.HTTPAdapter):
             kwargs['pool_maxsize'] = pool_maxsize
         super().__init__(**kwargs)
 
-    def send(self, *args, **kwargs):
+    def send(self, request, *args, **kwargs):
         if kwargs['timeout'] is None:
             kwargs['timeout'] = self._fixed_timeout
-        return super(CustomHTTPAdapter, self).send(*args, **kwargs)
+        if self._limiters is None:
+            return super(CustomHTTPAdapter, self).send(request, *args, **kwargs)
+
+        limiter = self._limiters.get(urlsplit(request.url).netloc)
+        started = limiter.acquire()
+        try:
+            response = super(CustomHTTPAdapter, self).send(request, *args, **kwargs)
+        except requests.exceptions.Timeout:
+            limiter.release(started, timed_out=True)
+            raise
+        except (requests.exceptions.ConnectionError, requests.exceptions.RetryError):
+            limiter.release(started, overloaded=True)
+            raise
+        except BaseException:
+            limiter.release(started)
+            raise
+        retries = getattr(response.raw, 'retries', None)
+        history = () if retries is None else retries.history
+        limiter.release(
+            started,
+            overloaded=response.status_code in OVERLOAD_STATUSES or any(h.status in OVERLOAD_STATUSES for h in history),
+            timed_out=any(isinstance(h.error, (ConnectTimeoutError, ReadTimeoutError)) for h in history),
+        )
+        return response
 
 
 class IdFactory:
     @staticmethod
     def from_objekt(objekt: ObjektEntry) -> str:
-        return hashlib.sha256(
-            json.dumps(objekt, indent=0, cls=CustomEncoder, sort_keys=True).encode('utf-8')
-        ).hexdigest()[:8]
+        from zvg_portal.serializer import objekt_id
+        return objekt_id(objekt)